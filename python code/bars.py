@@ -0,0 +1,89 @@
+"""
+Multi-Timeframe Bars
+====================
+
+Reads {tf}-minute OHLC bars from the ohlc_{tf}m continuous aggregates
+(models.create_ohlc_aggregate) instead of resampling ohlc_live_long, so a
+read costs one row per bar rather than one per minute. Bars are aligned to
+the 09:15 IST session open.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from metrics import stage
+from models import ohlc_aggregate_name
+
+# (bucket, open, high, low, close, volume)
+Bar = Tuple[datetime, float, float, float, float, int]
+
+BAR_COLUMNS = "bucket, symbol, open::float8, high::float8, low::float8, close::float8, volume"
+
+RECENT_SYMBOLS = """
+    SELECT DISTINCT symbol FROM ohlc_live_long
+    WHERE timestamp >= CURRENT_DATE::timestamptz - INTERVAL '7 days'
+"""
+
+
+def _group(rows) -> Dict[str, List[Bar]]:
+    bars = defaultdict(list)
+    for bucket, symbol, o, h, l, c, v in rows:
+        bars[symbol].append((bucket, o, h, l, c, v))
+    return dict(bars)
+
+
+def fetch_bars(conn, tf, symbols: Optional[Sequence[str]] = None,
+               start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, List[Bar]]:
+    """
+    Bars in [start, end) per symbol, oldest first.
+    With no start, only today's bars are returned.
+    """
+    conditions = ["bucket >= COALESCE(%s::timestamptz, CURRENT_DATE::timestamptz)"]
+    params = [start]
+    if end is not None:
+        conditions.append("bucket < %s")
+        params.append(end)
+    if symbols:
+        conditions.append("symbol = ANY(%s)")
+        params.append(list(symbols))
+    with stage('bars', f"fetch:{tf}") as s, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {BAR_COLUMNS}
+            FROM {ohlc_aggregate_name(tf)}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY symbol, bucket
+        """, params)
+        rows = cur.fetchall()
+        s.rows = len(rows)
+    return _group(rows)
+
+
+def last_bars(conn, tf, n: int, symbols: Optional[Sequence[str]] = None) -> Dict[str, List[Bar]]:
+    """
+    The latest n bars per symbol (including the forming one), oldest first.
+    Without symbols, every symbol that traded in the last week. tf=1 reads
+    the raw minutes from ohlc_live_long.
+    """
+    if symbols:
+        universe, params = "SELECT unnest(%s::text[]) AS symbol", [list(symbols)]
+    else:
+        universe, params = RECENT_SYMBOLS, []
+    view, bucket = ('ohlc_live_long', 'timestamp') if int(tf) == 1 else (ohlc_aggregate_name(tf), 'bucket')
+    with stage('bars', f"last:{tf}") as s, conn.cursor() as cur:
+        # Walk (symbol, bucket DESC) once per symbol instead of ranking every bar
+        cur.execute(f"""
+            SELECT b.bucket, s.symbol, b.open, b.high, b.low, b.close, b.volume
+            FROM ({universe}) s
+            CROSS JOIN LATERAL (
+                SELECT {bucket} AS bucket, open::float8, high::float8, low::float8, close::float8, volume
+                FROM {view}
+                WHERE symbol = s.symbol
+                ORDER BY {bucket} DESC
+                LIMIT %s
+            ) b
+            ORDER BY s.symbol, b.bucket
+        """, params + [n])
+        rows = cur.fetchall()
+        s.rows = len(rows)
+    return _group(rows)
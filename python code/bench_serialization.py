@@ -0,0 +1,101 @@
+"""
+Serialization Benchmark: pydantic path vs fast row path
+=======================================================
+
+Times the two ways page2/page3 turn cursor rows into a Redis payload:
+
+    pydantic: Model(**row) -> model_dump() -> json.dumps(cls=DateTimeEncoder)
+    fast:     fast_json.row_encoder(Model)(row) -> fast_json.dumps()
+
+on synthetic rows shaped like the real queries, and checks both decode to
+the same values.
+
+    python bench_serialization.py --rows 5000 --repeat 20
+"""
+
+import argparse
+import json
+import random
+import statistics
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from time import perf_counter
+
+import fast_json
+from fast_json import field_names, model_builder, row_encoder
+from page2_final import Camarilla, DateTimeEncoder as Page2Encoder
+from page3_final import ActiveSignal, DateTimeEncoder as Page3Encoder
+
+IST = timezone(timedelta(hours=5, minutes=30))
+
+
+def camarilla_rows(n: int) -> list:
+    start = datetime(2025, 1, 6, 9, 15, tzinfo=IST)
+    return [
+        (start + timedelta(minutes=15 * (i % 25)), f"SYM{i:05d}", random.choice(['h4', 'h5', 'l4', 'l5']),
+         round(random.uniform(50, 5000), 2))
+        for i in range(n)
+    ]
+
+
+def signal_rows(n: int) -> list:
+    start = datetime(2025, 1, 6, 9, 15, tzinfo=IST)
+    rows = []
+    for i in range(n):
+        entry = Decimal(f"{random.uniform(50, 5000):.2f}")
+        row = {name: None for name in field_names(ActiveSignal)}
+        row.update(
+            id=i, symbol=f"SYM{i:05d}", generation_time=start + timedelta(minutes=5 * (i % 75)),
+            type=random.choice(['BUY', 'SELL']), entry=entry, sl=entry * Decimal('0.98'),
+            tsl=entry * Decimal('0.99'), t1=entry * Decimal('1.01'), t2=entry * Decimal('1.02'),
+            t3=entry * Decimal('1.03'), t1_hit=bool(i % 2), t2_hit=False, t3_hit=False,
+            highest_price=entry * Decimal('1.015'), status='ACTIVE',
+            yellow_at_generation=entry, dema_at_generation=entry, close_price_at_generation=entry,
+        )
+        rows.append(tuple(row.values()))
+    return rows
+
+
+def pydantic_path(model, encoder, rows):
+    build = model_builder(model)
+    return json.dumps([build(row).model_dump() for row in rows], cls=encoder)
+
+
+def fast_path(model, rows):
+    encode = row_encoder(model)
+    return fast_json.dumps([encode(row) for row in rows])
+
+
+def _time(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        samples.append((perf_counter() - start) * 1000)
+    return samples
+
+
+def run(rows: int, repeat: int):
+    cases = [
+        ('Camarilla', Camarilla, Page2Encoder, camarilla_rows(rows)),
+        ('ActiveSignal', ActiveSignal, Page3Encoder, signal_rows(rows)),
+    ]
+    print(f"orjson available: {fast_json.AVAILABLE}")
+    for name, model, encoder, data in cases:
+        slow = pydantic_path(model, encoder, data)
+        fast = fast_path(model, data)
+        assert json.loads(slow) == json.loads(fast), f"{name}: payloads differ"
+
+        slow_ms = _time(lambda: pydantic_path(model, encoder, data), repeat)
+        fast_ms = _time(lambda: fast_path(model, data), repeat)
+        slow_p50, fast_p50 = statistics.median(slow_ms), statistics.median(fast_ms)
+        print(f"{name:<13} rows={rows:<7} pydantic p50={slow_p50:8.2f} ms  fast p50={fast_p50:8.2f} ms  "
+              f"speedup={slow_p50 / fast_p50:5.1f}x  bytes {len(slow)} -> {len(fast)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
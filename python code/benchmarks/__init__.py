@@ -0,0 +1,10 @@
+"""
+Pipeline Benchmarks
+===================
+
+Reproducible timings for the page1/page2/page3 jobs against a scratch
+Postgres/Timescale database filled with synthetic market data and a local
+Redis. Run from the `python code` directory:
+
+    python -m benchmarks.run --dbname stockpro_bench --symbols 500 --days 5 --out bench.json
+"""
@@ -0,0 +1,79 @@
+"""
+Event Detector Benchmark
+========================
+
+Times event_detector on a synthetic universe held in a CandleStore: one
+minute ingest for every symbol, then detect() and row building for the
+newest closed bar, against levels placed close to the prices so every rule fires
+on a good share of the universe. No database or Redis needed.
+
+    python -m benchmarks.detector --symbols 5000 --runs 200
+"""
+
+import argparse
+import statistics
+from time import perf_counter
+
+import numpy as np
+
+from candle_store import CandleStore
+from event_detector import EventDetector, Levels, detect
+
+SESSION_OPEN_EPOCH = 1704080700  # 2024-01-01 09:15 IST
+
+
+def synthetic_levels(symbols, close: np.ndarray, rng) -> Levels:
+    spread = close * rng.uniform(0.005, 0.03, len(close))
+    return Levels(
+        symbols,
+        vwap=close * rng.uniform(0.98, 1.02, len(close)),
+        h4=close + spread, h5=close + 2 * spread,
+        l4=close - spread, l5=close - 2 * spread,
+        prev_high=close * rng.uniform(1.005, 1.05, len(close)),
+        prev_low=close * rng.uniform(0.95, 0.995, len(close)),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized event detector")
+    parser.add_argument('--symbols', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--tf', type=int, default=15)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    symbols = [f"SYM{i:05d}" for i in range(args.symbols)]
+    store = CandleStore(timeframes=[1, args.tf], capacity=64, symbols=symbols)
+    close = rng.uniform(50, 5000, args.symbols)
+    levels = synthetic_levels(symbols, close, rng)
+    detector = EventDetector(tf=args.tf)
+
+    ingest_ms, detect_ms, rows_ms, events = [], [], [], []
+    for run in range(args.runs):
+        o = close * rng.normal(1, 0.004, args.symbols)
+        c = close * rng.normal(1, 0.004, args.symbols)
+        h = np.maximum(o, c) * rng.uniform(1, 1.003, args.symbols)
+        l = np.minimum(o, c) * rng.uniform(0.997, 1, args.symbols)
+        v = rng.lognormal(8, 1.5, args.symbols)
+        start = perf_counter()
+        store.ingest(symbols, np.full(args.symbols, SESSION_OPEN_EPOCH + 60 * run), o, h, l, c, v)
+        ingest_ms.append((perf_counter() - start) * 1000)
+
+        start = perf_counter()
+        bar = store.closed(args.tf)
+        detected = detect(bar, levels)
+        detect_ms.append((perf_counter() - start) * 1000)
+
+        start = perf_counter()
+        rows = detector.rows(symbols, bar, levels, detected)
+        rows_ms.append((perf_counter() - start) * 1000)
+        events.append(sum(len(table_rows) for table_rows in rows.values()))
+
+    print(f"{args.symbols} symbols, {args.runs} runs, {statistics.mean(events):.0f} events per tick")
+    for name, samples in (('ingest', ingest_ms), ('detect', detect_ms), ('rows', rows_ms)):
+        q = statistics.quantiles(samples, n=100)
+        print(f"{name:<7} p50={q[49]:8.2f} ms  p95={q[94]:8.2f} ms  p99={q[98]:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
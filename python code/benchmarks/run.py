@@ -0,0 +1,189 @@
+"""
+Benchmark Runner
+================
+
+Creates the schema in a scratch database, fills it with synthetic data and
+times fetch_stock_movers, page2_1, page2_15 and page3 against a local Redis.
+Each job is timed cold (in-process caches cleared) and warm. Results are
+printed and optionally written as JSON so runs can be compared between
+versions:
+
+    {"params": {...}, "rows": {table: n},
+     "jobs": {"page2_15": {"cold": {...}, "warm": {"p50_ms", "p95_ms", "p99_ms",
+              "mean_ms", "source_rows", "rows_per_s", "bytes_published", "samples"}}}}
+
+source_rows is the number of today's rows the job reads from its source
+tables; bytes_published is the Redis input-bytes delta per run.
+"""
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+from time import perf_counter
+
+import redis
+
+import db
+from app.config.settings import dbname as live_dbname, rhost, rport
+
+
+def percentile(samples, q: float) -> float:
+    """Nearest-rank percentile (q in 0..100)"""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _redis_input_bytes(client) -> int:
+    return int(client.info('stats')['total_net_input_bytes'])
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except Exception:
+        return 'unknown'
+
+
+def _today_rows(conn, table: str, column: str, extra: str = "") -> int:
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT count(*) FROM {table}
+            WHERE {column} >= CURRENT_DATE::timestamptz AND {column} < (CURRENT_DATE + 1)::timestamptz {extra}
+        """)
+        return cur.fetchone()[0]
+
+
+def _reset_caches():
+    """Forget every in-process cache so the next run behaves like a cold start"""
+    import page1_final
+    import page2_final
+    import page3_final
+    page1_final._ad_series_ready = False
+    page1_final._ad_last_ts.clear()
+    page2_final._day_caches.clear()
+    page2_final._published_keys.clear()
+    page2_final._published_day.clear()
+    page2_final._snapshot_written.clear()
+    page2_final._last_stream_id.clear()
+    page3_final._previous_active.clear()
+
+
+def time_job(fn, runs: int, redis_client, source_rows: int, cold: bool) -> dict:
+    samples, published = [], []
+    for _ in range(runs):
+        if cold:
+            _reset_caches()
+        before = _redis_input_bytes(redis_client)
+        start = perf_counter()
+        fn()
+        samples.append((perf_counter() - start) * 1000)
+        published.append(_redis_input_bytes(redis_client) - before)
+    p50 = percentile(samples, 50)
+    return {
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'source_rows': source_rows,
+        'rows_per_s': round(source_rows / (p50 / 1000), 1) if p50 > 0 else None,
+        'bytes_published': int(statistics.median(published)),
+        'samples': len(samples),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the StockPro pipeline jobs on synthetic data")
+    parser.add_argument('--dbname', default='stockpro_bench', help="scratch database (its tables are truncated)")
+    parser.add_argument('--redis-db', type=int, default=15, help="scratch Redis database number")
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--timeframes', default='5,15,30,60')
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--skip-populate', action='store_true', help="reuse data from a previous run")
+    parser.add_argument('--out', help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.dbname == live_dbname:
+        parser.error(f"--dbname must not be the live database ({live_dbname}); its tables are truncated")
+    timeframes = [tf.strip() for tf in args.timeframes.split(',') if tf.strip()]
+
+    # Everything below, including the jobs' own pooled connections, uses the scratch DB
+    db.configure(dbname=args.dbname, options='-c timezone=Asia/Kolkata')
+    redis_client = redis.Redis(host=rhost, port=rport, db=args.redis_db, decode_responses=True)
+    redis_client.flushdb()
+
+    import models
+    import movers_fetch
+    import page1_final
+    import page2_final
+    import page3_final
+    from exchange_stub import start_stub_server, stub_sources
+    from benchmarks.synthetic import populate
+
+    # page1 publishes through its module-level client and fetches from the exchanges;
+    # point both at local stand-ins
+    page1_final.r = redis_client
+    stub = start_stub_server()
+    movers_fetch.MOVER_SOURCES.update(stub_sources(f"http://127.0.0.1:{stub.server_address[1]}"))
+
+    with db.pooled_connection() as conn:
+        models.create_all_tables(conn, timeframes=timeframes)
+        rows = {} if args.skip_populate else populate(conn, args.symbols, args.days, timeframes)
+
+        source_rows = {
+            'fetch_stock_movers': _today_rows(conn, 'movers', 'timestamp'),
+            'page2_1': _today_rows(conn, 'unusual_volume_events', 'timestamp'),
+            'page2_15': (_today_rows(conn, 'breakout_events7', 'event_time')
+                         + _today_rows(conn, 'weekly_vwap_cross_events_15', 'timestamp')
+                         + _today_rows(conn, 'weekly_camarilla_cross_events_15', 'timestamp')),
+            'page3': sum(_today_rows(conn, f"signals_{tf}_new", 'generation_time', "AND status = 'ACTIVE'")
+                         for tf in timeframes),
+        }
+
+    def with_conn(job):
+        def run():
+            with db.pooled_connection() as conn:
+                job(conn)
+        return run
+
+    jobs = {
+        'fetch_stock_movers': page1_final.fetch_stock_movers,
+        'page2_1': with_conn(lambda conn: page2_final.page2_1(conn, redis_client)),
+        'page2_15': with_conn(lambda conn: page2_final.page2_15(conn, redis_client, tf=15, period='weekly')),
+        'page3': with_conn(lambda conn: page3_final.page3_all(conn, redis_client, timeframes)),
+    }
+
+    results = {
+        'params': {
+            'symbols': args.symbols, 'days': args.days, 'timeframes': timeframes, 'runs': args.runs,
+            'revision': _git_revision(), 'python': platform.python_version(),
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+        },
+        'rows': rows,
+        'jobs': {},
+    }
+    for name, fn in jobs.items():
+        results['jobs'][name] = {
+            'cold': time_job(fn, args.runs, redis_client, source_rows[name], cold=True),
+            'warm': time_job(fn, args.runs, redis_client, source_rows[name], cold=False),
+        }
+        for mode in ('cold', 'warm'):
+            r = results['jobs'][name][mode]
+            print(f"{name:<19} {mode:<4} p50={r['p50_ms']:9.2f} ms  p95={r['p95_ms']:9.2f} ms  "
+                  f"p99={r['p99_ms']:9.2f} ms  rows/s={r['rows_per_s']}  bytes={r['bytes_published']}")
+
+    stub.shutdown()
+    db.close_pool()
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
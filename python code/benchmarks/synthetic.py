@@ -0,0 +1,163 @@
+"""
+Synthetic Market Data
+=====================
+
+Fills the models.create_all_tables schema (plus movers) with random but
+well-formed data: a session of 1-minute candles per symbol per trading day
+ending today, and events/signals derived from them at realistic rates.
+Rows are streamed through COPY one day at a time, so memory stays bounded
+by a single day of candles.
+"""
+
+import io
+import random
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List
+
+IST = timezone(timedelta(hours=5, minutes=30))
+SESSION_OPEN = time(9, 15)
+SESSION_MINUTES = 375
+MOVERS_INDICES = ['sensex', 'nifty50', 'banknifty', 'niftymidcap', 'bankex']
+VALUE_THRESHOLD = 160_000_000  # 16 crores
+
+
+def trading_days(days: int, end: date = None) -> List[date]:
+    """Last `days` weekdays up to and including end (default today)"""
+    end = end or date.today()
+    out = []
+    current = end
+    while len(out) < days:
+        if current.weekday() < 5:
+            out.append(current)
+        current -= timedelta(days=1)
+    return sorted(out)
+
+
+def session_minutes(day: date) -> List[datetime]:
+    start = datetime.combine(day, SESSION_OPEN, tzinfo=IST)
+    return [start + timedelta(minutes=i) for i in range(SESSION_MINUTES)]
+
+
+def _copy(cur, table: str, columns: List[str], rows) -> int:
+    buf = io.StringIO()
+    count = 0
+    for row in rows:
+        buf.write(",".join("" if v is None else str(v) for v in row))
+        buf.write("\n")
+        count += 1
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf)
+    return count
+
+
+def _day_candles(symbols: List[str], day: date, last_close: Dict[str, float]):
+    """Random-walk 1-minute candles for every symbol for one session"""
+    for ts in session_minutes(day):
+        for symbol in symbols:
+            open_ = last_close.get(symbol) or random.uniform(50, 5000)
+            close = max(1.0, open_ * (1 + random.gauss(0, 0.0015)))
+            high = max(open_, close) * (1 + abs(random.gauss(0, 0.0007)))
+            low = min(open_, close) * (1 - abs(random.gauss(0, 0.0007)))
+            volume = int(random.lognormvariate(8, 1.5))
+            last_close[symbol] = close
+            yield ts, symbol, round(open_, 2), round(high, 2), round(low, 2), round(close, 2), volume
+
+
+def populate(conn, symbols: int, days: int, timeframes: List[str], seed: int = 7) -> Dict[str, int]:
+    """
+    Truncate and refill the benchmark tables. Returns row counts per table.
+    """
+    random.seed(seed)
+    names = [f"SYM{i:05d}" for i in range(symbols)]
+    counts: Dict[str, int] = {}
+
+    def add(table, n):
+        counts[table] = counts.get(table, 0) + n
+
+    event_tables = [
+        'ohlc_live_long', 'unusual_volume_events', 'breakout_events7', 'movers',
+        'weekly_vwap_cross_events_15', 'weekly_camarilla_cross_events_15',
+    ] + [f"signals_{tf}_new" for tf in timeframes]
+
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(event_tables)}")
+        last_close: Dict[str, float] = {}
+
+        for day in trading_days(days):
+            candles = list(_day_candles(names, day, last_close))
+            add('ohlc_live_long', _copy(cur, 'ohlc_live_long',
+                ['timestamp', 'symbol', 'open', 'high', 'low', 'close', 'volume'], candles))
+
+            # ~2% of candles trade above the value threshold
+            volume_rows = []
+            for ts, symbol, o, h, l, c, v in candles:
+                if random.random() < 0.02:
+                    v = max(v, int(VALUE_THRESHOLD / c) + 1)
+                    volume_rows.append((ts, symbol, o, h, l, c, v, int(c * v), VALUE_THRESHOLD))
+            add('unusual_volume_events', _copy(cur, 'unusual_volume_events',
+                ['timestamp', 'symbol', 'open', 'high', 'low', 'close', 'volume', 'value_traded', 'threshold_value'],
+                volume_rows))
+
+            # 15-minute crosses on a subset of candles
+            vwap_rows, cam_rows = [], []
+            for ts, symbol, o, h, l, c, v in candles:
+                if ts.minute % 15 != 0:
+                    continue
+                roll = random.random()
+                if roll < 0.03:
+                    above = random.random() < 0.5
+                    vwap_rows.append((ts, symbol, o, h, l, c, round(c * (0.999 if above else 1.001), 4), above, not above))
+                elif roll < 0.05:
+                    level = random.choice(['h4', 'h5', 'l4', 'l5'])
+                    h4, h5, l4, l5 = c * 0.998, c * 0.995, c * 1.002, c * 1.005
+                    cam_rows.append((ts, symbol, o, h, l, c, round(h4, 4), round(h5, 4), round(l4, 4), round(l5, 4),
+                                     level if level[0] == 'h' else None, level if level[0] == 'l' else None))
+            add('weekly_vwap_cross_events_15', _copy(cur, 'weekly_vwap_cross_events_15',
+                ['timestamp', 'symbol', 'open', 'high', 'low', 'close', 'vwap', 'crossed_above', 'crossed_below'], vwap_rows))
+            add('weekly_camarilla_cross_events_15', _copy(cur, 'weekly_camarilla_cross_events_15',
+                ['timestamp', 'symbol', 'open', 'high', 'low', 'close', 'h4', 'h5', 'l4', 'l5', 'crossed_above', 'crossed_below'],
+                cam_rows))
+
+            # At most one breakout per symbol per day
+            breakout_rows = []
+            minutes = session_minutes(day)
+            for symbol in names:
+                if random.random() < 0.1:
+                    ts = random.choice(minutes)
+                    close = last_close[symbol]
+                    kind = random.choice(['HIGH', 'LOW'])
+                    breakout_rows.append((day, symbol, ts, kind, ts, round(close * 1.002, 2), round(close * 0.998, 2),
+                                          round(close, 2), round(close * 0.999, 2), round(close * 0.97, 2)))
+            add('breakout_events7', _copy(cur, 'breakout_events7',
+                ['date', 'symbol', 'event_time', 'event_type', 'candle_time', 'candle_high', 'candle_low',
+                 'candle_close', 'prev7d_high', 'prev7d_low'], breakout_rows))
+
+            movers_rows = [(ts, index, random.randint(0, 30), random.randint(0, 30))
+                           for ts in minutes for index in MOVERS_INDICES]
+            add('movers', _copy(cur, 'movers', ['timestamp', 'symbol', 'pullers', 'draggers'], movers_rows))
+
+            # ~3 signals per symbol per tf per day; those from today stay ACTIVE 10% of the time
+            for tf in timeframes:
+                signal_rows = []
+                for symbol in names:
+                    for ts in random.sample(minutes, 3):
+                        entry = round(last_close[symbol], 2)
+                        kind = random.choice(['BUY', 'SELL'])
+                        sign = 1 if kind == 'BUY' else -1
+                        active = day == date.today() and random.random() < 0.1
+                        signal_rows.append((
+                            symbol, ts, kind, entry, round(entry * (1 - 0.01 * sign), 2), round(entry * (1 - 0.01 * sign), 2),
+                            round(entry * (1 + 0.01 * sign), 2), round(entry * (1 + 0.02 * sign), 2),
+                            round(entry * (1 + 0.03 * sign), 2), 'ACTIVE' if active else 'CLOSED',
+                            None if active else ts + timedelta(minutes=int(tf) * 4),
+                            None if active else random.choice(['SL', 'TSL', 'T3']),
+                        ))
+                add(f"signals_{tf}_new", _copy(cur, f"signals_{tf}_new",
+                    ['symbol', 'generation_time', 'type', 'entry', 'sl', 'tsl', 't1', 't2', 't3', 'status',
+                     'closing_time', 'closing_reason'], signal_rows))
+            conn.commit()
+
+    with conn.cursor() as cur:
+        cur.execute(f"ANALYZE {', '.join(event_tables)}")
+    conn.commit()
+    return counts
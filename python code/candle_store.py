@@ -0,0 +1,220 @@
+"""
+Rolling Candle Store
+====================
+
+Keeps the last `capacity` bars per symbol and timeframe in preallocated
+NumPy ring buffers, so detectors and indicators can read recent history for
+the whole universe without going back to ohlc_live_long.
+
+    store = CandleStore(timeframes=[1, 5, 15], capacity=500)
+    store.hydrate(conn)                                  # at startup
+    store.ingest(symbols, epoch_s, o, h, l, c, v)        # every minute
+    bars = store.window(15, 20)                          # (n_symbols, 20) arrays
+
+Per timeframe the buffers are 2-D arrays (symbol slot x ring position).
+Minute bars are rolled up into every timeframe on ingest: a minute in the
+same bucket as the symbol's newest bar updates it in place, otherwise a new
+bar is appended at the ring head; both are O(1) per symbol and vectorized
+across symbols. Buckets are aligned to the 09:15 IST session open, like the
+ohlc_{tf}m continuous aggregates. Timestamps are bucket starts in Unix
+seconds.
+"""
+
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from metrics import stage
+
+IST_OFFSET_S = 19800  # +05:30
+SESSION_OPEN_S = 9 * 3600 + 15 * 60
+SESSION_MINUTES = 375
+FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def bucket_start(epoch_s: np.ndarray, tf: int) -> np.ndarray:
+    """Start of the session-aligned tf-minute bucket containing each timestamp"""
+    epoch_s = np.asarray(epoch_s, dtype=np.int64)
+    local_day = (epoch_s + IST_OFFSET_S) // 86400 * 86400 - IST_OFFSET_S
+    session_open = local_day + SESSION_OPEN_S
+    if tf >= SESSION_MINUTES:
+        return session_open
+    width = tf * 60
+    return session_open + (epoch_s - session_open) // width * width
+
+
+class _Ring:
+    """Ring buffers for one timeframe"""
+
+    def __init__(self, slots: int, capacity: int):
+        self.capacity = capacity
+        self.ts = np.full((slots, capacity), -1, dtype=np.int64)
+        self.values = {name: np.full((slots, capacity), np.nan) for name in FIELDS}
+        self.head = np.zeros(slots, dtype=np.int64)  # next write position
+        self.count = np.zeros(slots, dtype=np.int64)
+
+    def grow(self, slots: int):
+        extra = slots - len(self.head)
+        self.ts = np.vstack([self.ts, np.full((extra, self.capacity), -1, dtype=np.int64)])
+        for name in FIELDS:
+            self.values[name] = np.vstack([self.values[name], np.full((extra, self.capacity), np.nan)])
+        self.head = np.concatenate([self.head, np.zeros(extra, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(extra, dtype=np.int64)])
+
+    def last_position(self, rows: np.ndarray) -> np.ndarray:
+        return (self.head[rows] - 1) % self.capacity
+
+    def update(self, rows, buckets, o, h, l, c, v):
+        """Fold one minute per row into the newest bar, or start a new bar"""
+        last = self.last_position(rows)
+        same = (self.count[rows] > 0) & (self.ts[rows, last] == buckets)
+
+        # Same bucket: extend the forming bar
+        r, p = rows[same], last[same]
+        if len(r):
+            self.values['high'][r, p] = np.fmax(self.values['high'][r, p], h[same])
+            self.values['low'][r, p] = np.fmin(self.values['low'][r, p], l[same])
+            self.values['close'][r, p] = c[same]
+            self.values['volume'][r, p] += v[same]
+
+        # New bucket: write at the head and advance it
+        new = ~same
+        r = rows[new]
+        if len(r):
+            p = self.head[r]
+            self.ts[r, p] = buckets[new]
+            self.values['open'][r, p] = o[new]
+            self.values['high'][r, p] = h[new]
+            self.values['low'][r, p] = l[new]
+            self.values['close'][r, p] = c[new]
+            self.values['volume'][r, p] = v[new]
+            self.head[r] = (p + 1) % self.capacity
+            self.count[r] = np.minimum(self.count[r] + 1, self.capacity)
+
+
+class CandleStore:
+    def __init__(self, timeframes: Sequence[int] = (1, 5, 15, 30, 60), capacity: int = 500,
+                 symbols: Optional[Sequence[str]] = None):
+        self.timeframes = [int(tf) for tf in timeframes]
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self.symbols: List[str] = []
+        self._slot: Dict[str, int] = {}
+        self._rings = {tf: _Ring(0, capacity) for tf in self.timeframes}
+        if symbols:
+            self.slots(symbols)
+
+    # -------------------------------------------------------------------------
+    # Writes
+    # -------------------------------------------------------------------------
+
+    def slots(self, symbols: Sequence[str]) -> np.ndarray:
+        """Slot index per symbol, adding unseen symbols (buffers grow in blocks)"""
+        new = [s for s in dict.fromkeys(symbols) if s not in self._slot]
+        if new:
+            for symbol in new:
+                self._slot[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            allocated = len(next(iter(self._rings.values())).head) if self._rings else 0
+            if len(self.symbols) > allocated:
+                size = max(len(self.symbols), 2 * allocated, 64)
+                for ring in self._rings.values():
+                    ring.grow(size)
+        return np.fromiter((self._slot[s] for s in symbols), dtype=np.int64, count=len(symbols))
+
+    def ingest(self, symbols: Sequence[str], epoch_s, o, h, l, c, v):
+        """
+        Apply minute bars (one per symbol, or several in time order) to every
+        timeframe. Arguments other than symbols are array-likes of equal length.
+        """
+        epoch_s = np.asarray(epoch_s, dtype=np.int64)
+        o, h, l, c, v = (np.asarray(x, dtype=np.float64) for x in (o, h, l, c, v))
+        with self._lock, stage('candle_store', 'ingest') as s:
+            rows = self.slots(symbols)
+            # Several minutes of one symbol in a batch must be folded in order;
+            # split into rounds where every symbol appears at most once
+            order = np.lexsort((epoch_s, rows))
+            rank = np.empty(len(rows), dtype=np.int64)
+            if len(rows):
+                sorted_rows = rows[order]
+                starts = np.r_[0, np.flatnonzero(np.diff(sorted_rows)) + 1]
+                run_start = np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+                rank[order] = np.arange(len(rows)) - run_start
+            for round_no in range(int(rank.max()) + 1 if len(rows) else 0):
+                pick = rank == round_no
+                for tf, ring in self._rings.items():
+                    ring.update(rows[pick], bucket_start(epoch_s[pick], tf),
+                                o[pick], h[pick], l[pick], c[pick], v[pick])
+            s.rows = len(rows)
+
+    def load_bars(self, tf: int, symbol: str, bars: Sequence[tuple]):
+        """Replace a symbol's history for tf with (epoch_s, o, h, l, c, v) bars, oldest first"""
+        with self._lock:
+            ring = self._rings[tf]
+            row = self.slots([symbol])[0]
+            bars = list(bars)[-self.capacity:]
+            n = len(bars)
+            ring.ts[row] = -1
+            for name in FIELDS:
+                ring.values[name][row] = np.nan
+            if n:
+                columns = np.array(bars, dtype=np.float64).T
+                ring.ts[row, :n] = columns[0].astype(np.int64)
+                for i, name in enumerate(FIELDS, start=1):
+                    ring.values[name][row, :n] = columns[i]
+            ring.head[row] = n % self.capacity
+            ring.count[row] = n
+
+    def hydrate(self, conn, symbols: Optional[Sequence[str]] = None):
+        """Fill every timeframe from Postgres (ohlc_live_long / the ohlc_{tf}m aggregates)"""
+        from bars import last_bars
+
+        with stage('candle_store', 'hydrate') as s:
+            loaded = 0
+            for tf in self.timeframes:
+                history = last_bars(conn, tf, self.capacity, symbols)
+                for symbol, bars in history.items():
+                    self.load_bars(tf, symbol, [(b[0].timestamp(), *b[1:]) for b in bars])
+                    loaded += len(bars)
+            s.rows = loaded
+        print(f"Candle store hydrated: {len(self.symbols)} symbols, {loaded} bars")
+
+    # -------------------------------------------------------------------------
+    # Vectorized views (all symbols, in self.symbols order)
+    # -------------------------------------------------------------------------
+
+    def window(self, tf: int, k: int) -> Dict[str, np.ndarray]:
+        """
+        The newest k bars of every symbol, oldest first: 'ts' (n, k) int64 with
+        -1 and the value fields (n, k) float64 with NaN where a symbol has fewer.
+        """
+        with self._lock:
+            ring = self._rings[tf]
+            n = len(self.symbols)
+            k = min(k, self.capacity)
+            positions = (ring.head[:n, None] - k + np.arange(k)) % self.capacity
+            missing = np.arange(k) < (k - ring.count[:n, None])
+            view = {'ts': np.take_along_axis(ring.ts[:n], positions, axis=1)}
+            view['ts'][missing] = -1
+            for name in FIELDS:
+                values = np.take_along_axis(ring.values[name][:n], positions, axis=1)
+                values[missing] = np.nan
+                view[name] = values
+            return view
+
+    def latest(self, tf: int) -> Dict[str, np.ndarray]:
+        """Newest bar of every symbol as 1-D arrays"""
+        return {name: column[:, -1] for name, column in self.window(tf, 1).items()}
+
+    def closed(self, tf: int) -> Dict[str, np.ndarray]:
+        """Newest closed bar of every symbol (the one before the forming bar); ts -1 where none"""
+        return {name: column[:, 0] for name, column in self.window(tf, 2).items()}
+
+    def history(self, tf: int, symbol: str, k: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """One symbol's newest k bars (default all held), oldest first"""
+        view = self.window(tf, k or self.capacity)
+        row = self._slot[symbol]
+        valid = view['ts'][row] >= 0
+        return {name: column[row][valid] for name, column in view.items()}
+
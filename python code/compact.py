@@ -0,0 +1,159 @@
+"""
+Compact Columnar Payloads
+=========================
+
+Binary twin of the large JSON snapshots of the page2 event feeds, written
+under "{key}:cols" and announced on "chan:{key}:cols" next to the JSON key
+and channel. Readers that support it move and parse far fewer bytes: no
+repeated field names, timestamps as integer deltas, symbols
+dictionary-encoded.
+
+Wire format (version 1)
+-----------------------
+    bytes 0-3   magic b"SPC1"
+    byte  4     codec of the body: 0 = none, 1 = zlib, 2 = zstd
+    bytes 5-    body: msgpack map, compressed with the codec
+
+    body   = {"v": 1, "tables": {table_name: table}}
+    table  = {"n": row_count, "cols": {column_name: column}}   (column order kept)
+    column is one of
+      {"t": "ts",   "base": epoch_ms, "tz": utc_offset_minutes, "d": [delta_ms | nil]}
+          each non-nil value is base + cumulative sum of deltas up to it
+          (the first delta is 0); tz is the UTC offset of the first value
+      {"t": "dict", "values": [distinct strings], "idx": [index | nil]}
+      {"t": "f64",  "v": [float | nil]}
+      {"t": "i64",  "v": [int | nil]}
+      {"t": "bool", "v": [bool | nil]}
+
+page2 feeds use the single table "events" with the same columns as the
+JSON objects.
+
+msgpack is required for this format and zstandard is preferred;
+without msgpack, ENABLED is False and writers skip the compact keys.
+"""
+
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ENABLED = msgpack is not None
+MAGIC = b"SPC1"
+VERSION = 1
+CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD = 0, 1, 2
+ZSTD_LEVEL = 3
+
+
+def _epoch_ms(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.astimezone()
+    return int(ts.timestamp() * 1000)
+
+
+def _encode_timestamps(values: list) -> dict:
+    first = next(v for v in values if v is not None)
+    offset = first.utcoffset() if first.tzinfo else first.astimezone().utcoffset()
+    base = _epoch_ms(first)
+    previous = base
+    deltas = []
+    for value in values:
+        if value is None:
+            deltas.append(None)
+            continue
+        ms = _epoch_ms(value)
+        deltas.append(ms - previous)
+        previous = ms
+    return {"t": "ts", "base": base, "tz": int(offset.total_seconds() // 60), "d": deltas}
+
+
+def _encode_strings(values: list) -> dict:
+    index: Dict[str, int] = {}
+    idx = []
+    for value in values:
+        if value is None:
+            idx.append(None)
+            continue
+        if value not in index:
+            index[value] = len(index)
+        idx.append(index[value])
+    return {"t": "dict", "values": list(index), "idx": idx}
+
+
+def encode_column(values: list) -> dict:
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, datetime) for v in present):
+        return _encode_timestamps(values)
+    if present and all(isinstance(v, str) for v in present):
+        return _encode_strings(values)
+    if present and all(isinstance(v, bool) for v in present):
+        return {"t": "bool", "v": values}
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return {"t": "i64", "v": values}
+    return {"t": "f64", "v": [None if v is None else float(v) for v in values]}
+
+
+def encode_table(rows: List[dict], columns: List[str] = None) -> dict:
+    """Column-major form of a list of uniform dicts"""
+    if columns is None:
+        columns = list(rows[0]) if rows else []
+    return {
+        "n": len(rows),
+        "cols": {name: encode_column([row.get(name) for row in rows]) for name in columns},
+    }
+
+
+def pack(tables: Dict[str, dict]) -> bytes:
+    """Serialise encoded tables into the framed, compressed wire format"""
+    body = msgpack.packb({"v": VERSION, "tables": tables}, use_bin_type=True)
+    if zstandard is not None:
+        return MAGIC + bytes([CODEC_ZSTD]) + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return MAGIC + bytes([CODEC_ZLIB]) + zlib.compress(body, 6)
+
+
+def encode_events(events: List[dict]) -> bytes:
+    """page2 feed -> compact payload (table "events")"""
+    return pack({"events": encode_table(events)})
+
+
+def _decode_column(column: dict) -> list:
+    kind = column["t"]
+    if kind == "ts":
+        tz = timezone(timedelta(minutes=column["tz"]))
+        out, current = [], column["base"]
+        for delta in column["d"]:
+            if delta is None:
+                out.append(None)
+                continue
+            current += delta
+            out.append(datetime.fromtimestamp(current / 1000, tz))
+        return out
+    if kind == "dict":
+        values = column["values"]
+        return [None if i is None else values[i] for i in column["idx"]]
+    return list(column["v"])
+
+
+def decode(payload: bytes) -> Dict[str, List[dict]]:
+    """Wire format -> {table_name: [row dicts]} (for readers and round-trip checks)"""
+    if payload[:4] != MAGIC:
+        raise ValueError("not a compact payload")
+    codec, body = payload[4], payload[5:]
+    if codec == CODEC_ZSTD:
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif codec == CODEC_ZLIB:
+        body = zlib.decompress(body)
+    data = msgpack.unpackb(body, raw=False)
+    out = {}
+    for name, table in data["tables"].items():
+        columns = {col: _decode_column(spec) for col, spec in table["cols"].items()}
+        out[name] = [dict(zip(columns, values)) for values in zip(*columns.values())] if columns else []
+    return out
@@ -0,0 +1,76 @@
+"""
+Shared Postgres Connections for StockPro Jobs
+=============================================
+
+One process-wide connection pool used by page1, page2 and page3 so that a
+tick borrows an already-authenticated connection instead of opening a new
+TCP+auth handshake for every statement.
+"""
+
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from app.config.settings import host, dbname, user, password
+
+POOL_MIN_CONN = 1
+POOL_MAX_CONN = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+_connect_params = dict(host=host, dbname=dbname, user=user, password=password)
+
+
+def configure(**params):
+    """
+    Override connection parameters (e.g. dbname for a benchmark or replay
+    database). Must be called before the pool is first used.
+    """
+    if _pool is not None:
+        raise RuntimeError("Connection pool already created; call configure() before first use")
+    _connect_params.update(params)
+
+
+def connect():
+    """A dedicated (unpooled) connection with the configured parameters"""
+    return psycopg2.connect(**_connect_params)
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """Return the process-wide pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, **_connect_params)
+    return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrow a connection from the shared pool.
+
+    The transaction is committed when the block exits cleanly and rolled back
+    otherwise; the connection always goes back to the pool.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def close_pool():
+    """Close every pooled connection (call on process shutdown)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
@@ -0,0 +1,313 @@
+"""
+Vectorized Event Detector
+=========================
+
+Evaluates every page2 event rule for the whole universe at once: the newest
+closed bar of all symbols and their VWAP / Camarilla / previous-N-day levels are
+NumPy arrays aligned by symbol, each rule is a handful of array
+comparisons, and the resulting rows go to the event tables in one batched
+insert per table.
+
+    unusual_volume_events               close * volume >= 16 crore on a 1-minute bar
+    {period}_vwap_cross_events_{tf}     open and close on opposite sides of the period VWAP
+    {period}_camarilla_cross_events_{tf} bar crosses h4/h5 upwards or l4/l5 downwards
+                                        (the outer level wins when both are crossed)
+    breakout_events7                    high above / low below the previous 7-day range,
+                                        first breakout of the day per symbol
+
+Levels come from the previous completed period (vwap / camarilla tables and
+their _weekly / _monthly variants) and from prev7day_hilo for the session
+day of each bar (its IST date), so a bar is never judged against the next
+day's levels; they are loaded once per day. Only closed bars are evaluated
+(the forming one would be frozen by the insert), each of them once. The
+last bar of a session only closes on the next tick, so it is evaluated at
+the close with final=True.
+
+    detector = EventDetector(tf=15, period='weekly')
+    detector.run(conn, store)               # store: candle_store.CandleStore
+    detector.run(conn, store, final=True)   # after the session's last minute
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from metrics import stage
+from models import PERIOD_KEY_FORMATS
+
+IST = timezone(timedelta(hours=5, minutes=30))
+LAST_MINUTE = time(15, 29)  # the session's final 1-minute bar
+EPOCH_DAY = date(1970, 1, 1)
+UNUSUAL_VALUE_THRESHOLD = 160_000_000  # 16 crore traded in one bar
+BREAKOUT_DAYS = 7
+INSERT_PAGE_SIZE = 5000
+
+LEVEL_FIELDS = ('vwap', 'h4', 'h5', 'l4', 'l5', 'prev_high', 'prev_low')
+
+
+class Levels:
+    """Per-symbol levels as float arrays aligned to `symbols` (NaN when unknown)"""
+
+    def __init__(self, symbols: Sequence[str], **arrays):
+        self.symbols = list(symbols)
+        n = len(self.symbols)
+        for name in LEVEL_FIELDS:
+            setattr(self, name, np.asarray(arrays.get(name, np.full(n, np.nan)), dtype=np.float64))
+
+    def align(self, symbols: Sequence[str]) -> 'Levels':
+        """The same levels re-ordered for another symbol list"""
+        if list(symbols) == self.symbols:
+            return self
+        index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        positions = np.array([index.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        known = positions >= 0
+        arrays = {}
+        for name in LEVEL_FIELDS:
+            values = np.full(len(positions), np.nan)
+            values[known] = getattr(self, name)[positions[known]]
+            arrays[name] = values
+        return Levels(symbols, **arrays)
+
+
+def _level_map(cur, query: str, params=()) -> Dict[str, tuple]:
+    cur.execute(query, params)
+    return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+def load_levels(conn, period: str, day: Optional[date] = None, days: int = BREAKOUT_DAYS) -> Levels:
+    """VWAP and Camarilla of the last period completed before day, and day's N-day range"""
+    day = day or date.today()
+    if period == 'daily':
+        vwap_table, cam_table, key, bound = 'vwap', 'camarilla', 'date', '%s::date'
+    else:
+        vwap_table, cam_table, key = f'vwap_{period}', f'camarilla_{period}', period
+        bound = f"to_char(%s::date, '{PERIOD_KEY_FORMATS[period]}')"
+    with stage('event_detector', 'load_levels') as s, conn.cursor() as cur:
+        vwap = _level_map(cur, f"""
+            SELECT DISTINCT ON (symbol) symbol, vwap::float8 FROM {vwap_table}
+            WHERE {key} < {bound} ORDER BY symbol, {key} DESC
+        """, (day,))
+        cam = _level_map(cur, f"""
+            SELECT DISTINCT ON (symbol) symbol, h4::float8, h5::float8, l4::float8, l5::float8 FROM {cam_table}
+            WHERE {key} < {bound} ORDER BY symbol, {key} DESC
+        """, (day,))
+        hilo = _level_map(cur, f"""
+            SELECT DISTINCT ON (symbol) symbol, high::float8, low::float8 FROM prev{days}day_hilo
+            WHERE date <= %s ORDER BY symbol, date DESC
+        """, (day,))
+        symbols = sorted(set(vwap) | set(cam) | set(hilo))
+        s.rows = len(symbols)
+
+    def column(source, i, width):
+        return [(source.get(symbol) or (None,) * width)[i] for symbol in symbols]
+
+    # None -> NaN in the float arrays
+    return Levels(
+        symbols,
+        vwap=column(vwap, 0, 1),
+        h4=column(cam, 0, 4), h5=column(cam, 1, 4), l4=column(cam, 2, 4), l5=column(cam, 3, 4),
+        prev_high=column(hilo, 0, 2), prev_low=column(hilo, 1, 2),
+    )
+
+
+def _nan_as_none(values: np.ndarray) -> list:
+    return [None if v != v else v for v in values.tolist()]
+
+
+def detect_volume(bar: Dict[str, np.ndarray], threshold: float = UNUSUAL_VALUE_THRESHOLD) -> Dict[str, np.ndarray]:
+    """Symbols whose bar traded at least threshold (close * volume)"""
+    value_traded = bar['close'] * bar['volume']
+    hits = np.flatnonzero(value_traded >= threshold)
+    return {'index': hits, 'value_traded': value_traded[hits]}
+
+
+def _keep(detected: Dict[str, np.ndarray], mask: np.ndarray) -> Dict[str, np.ndarray]:
+    """The hits of one rule whose symbol is set in mask"""
+    keep = mask[detected['index']]
+    return {name: values[keep] for name, values in detected.items()}
+
+
+def detect(bar: Dict[str, np.ndarray], levels: Levels,
+           threshold: float = UNUSUAL_VALUE_THRESHOLD) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    Evaluate every rule on one bar per symbol.
+
+    bar: 'open', 'high', 'low', 'close', 'volume' arrays aligned with levels.symbols
+    Returns per rule the indices of the symbols that fired plus the values
+    the event rows need; comparisons against NaN levels never fire.
+    """
+    o, h, l, c = bar['open'], bar['high'], bar['low'], bar['close']
+    out = {'volume': detect_volume(bar, threshold)}
+
+    above = (o < levels.vwap) & (c > levels.vwap)
+    below = (o > levels.vwap) & (c < levels.vwap)
+    hits = np.flatnonzero(above | below)
+    out['vwap'] = {'index': hits, 'above': above[hits], 'below': below[hits]}
+
+    # Outer levels first: a bar through h5 also went through h4
+    up_h5 = (o < levels.h5) & (c >= levels.h5)
+    up_h4 = ~up_h5 & (o < levels.h4) & (c >= levels.h4)
+    down_l5 = (o > levels.l5) & (c <= levels.l5)
+    down_l4 = ~down_l5 & (o > levels.l4) & (c <= levels.l4)
+    crossed_above = np.where(up_h5, 'h5', np.where(up_h4, 'h4', ''))
+    crossed_below = np.where(down_l5, 'l5', np.where(down_l4, 'l4', ''))
+    hits = np.flatnonzero(up_h5 | up_h4 | down_l5 | down_l4)
+    out['camarilla'] = {'index': hits, 'above': crossed_above[hits], 'below': crossed_below[hits]}
+
+    # The row stores both sides of the range, so both must be known
+    known = ~np.isnan(levels.prev_high) & ~np.isnan(levels.prev_low)
+    high_break = known & (h > levels.prev_high)
+    low_break = known & ~high_break & (l < levels.prev_low)
+    hits = np.flatnonzero(high_break | low_break)
+    out['breakout'] = {'index': hits, 'type': np.where(high_break[hits], 'HIGH', 'LOW')}
+    return out
+
+
+class EventDetector:
+    """Detection for one (tf, period) table pair plus the volume and breakout tables"""
+
+    def __init__(self, tf: int = 15, period: str = 'weekly', threshold: float = UNUSUAL_VALUE_THRESHOLD,
+                 days: int = BREAKOUT_DAYS):
+        self.tf = tf
+        self.period = period
+        self.threshold = threshold
+        self.days = days
+        # session day -> levels; the newest two are kept (a bar closed on the
+        # next day's first tick is judged with its own day's levels)
+        self._levels: Dict[date, Levels] = {}
+        # tf -> per symbol slot, the ts of the newest closed bar already evaluated
+        self._evaluated: Dict[int, np.ndarray] = {}
+
+    def levels(self, conn, symbols: Sequence[str], day: Optional[date] = None) -> Levels:
+        day = day or date.today()
+        if day not in self._levels:
+            if len(self._levels) >= 2:
+                del self._levels[min(self._levels)]
+            self._levels[day] = load_levels(conn, self.period, day, self.days)
+        return self._levels[day].align(symbols)
+
+    def _fresh(self, tf: int, bar: Dict[str, np.ndarray]) -> np.ndarray:
+        """Symbols whose closed bar is newer than the last one evaluated"""
+        seen = self._evaluated.get(tf, np.empty(0, dtype=np.int64))
+        n = len(bar['ts'])
+        if len(seen) < n:
+            seen = np.concatenate([seen, np.full(n - len(seen), -1, dtype=np.int64)])
+            self._evaluated[tf] = seen
+        return bar['ts'] > seen[:n]
+
+    def _mark(self, tf: int, bar: Dict[str, np.ndarray], fresh: np.ndarray):
+        seen = self._evaluated[tf]
+        seen[:len(fresh)][fresh] = bar['ts'][fresh]
+
+    def rows(self, symbols: Sequence[str], bar: Dict[str, np.ndarray], levels: Levels,
+             detected: Dict[str, Dict[str, np.ndarray]],
+             minute: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, List[tuple]]:
+        """
+        Event rows per table for one detect() result; the volume rows come
+        from minute when the volume rule was evaluated on the 1-minute bar.
+        """
+        symbols = np.asarray(symbols, dtype=object)
+
+        def common(source, index):
+            stamps = [datetime.fromtimestamp(t, timezone.utc) for t in source['ts'][index].tolist()]
+            return zip(stamps, symbols[index], source['open'][index].tolist(), source['high'][index].tolist(),
+                       source['low'][index].tolist(), source['close'][index].tolist())
+
+        out = {}
+        minute = bar if minute is None else minute
+        d = detected['volume']
+        out['unusual_volume_events'] = [
+            (*row, int(volume), int(value), int(self.threshold))
+            for row, volume, value in zip(common(minute, d['index']), minute['volume'][d['index']].tolist(),
+                                          d['value_traded'].tolist())
+        ]
+        d = detected['vwap']
+        out[f"{self.period}_vwap_cross_events_{self.tf}"] = [
+            (*row, vwap, bool(above), bool(below))
+            for row, vwap, above, below in zip(common(bar, d['index']), levels.vwap[d['index']].tolist(), d['above'], d['below'])
+        ]
+        d = detected['camarilla']
+        i = d['index']
+        out[f"{self.period}_camarilla_cross_events_{self.tf}"] = [
+            (*row, h4, h5, l4, l5, above or None, below or None)
+            for row, h4, h5, l4, l5, above, below in zip(
+                common(bar, i), _nan_as_none(levels.h4[i]), _nan_as_none(levels.h5[i]),
+                _nan_as_none(levels.l4[i]), _nan_as_none(levels.l5[i]), d['above'].tolist(), d['below'].tolist())
+        ]
+        d = detected['breakout']
+        i = d['index']
+        out[f"breakout_events{self.days}"] = [
+            (ts.astimezone(IST).date(), symbol, ts, kind, ts, high, low, close, prev_high, prev_low)
+            for (ts, symbol, _o, high, low, close), kind, prev_high, prev_low in zip(
+                common(bar, i), d['type'].tolist(), levels.prev_high[i].tolist(), levels.prev_low[i].tolist())
+        ]
+        return out
+
+    def store(self, conn, rows: Dict[str, List[tuple]]) -> int:
+        """One batched insert per table; events already stored are ignored"""
+        days = self.days
+        statements = {
+            'unusual_volume_events': "(timestamp, symbol, open, high, low, close, volume, value_traded, threshold_value)",
+            f"{self.period}_vwap_cross_events_{self.tf}":
+                "(timestamp, symbol, open, high, low, close, vwap, crossed_above, crossed_below)",
+            f"{self.period}_camarilla_cross_events_{self.tf}":
+                "(timestamp, symbol, open, high, low, close, h4, h5, l4, l5, crossed_above, crossed_below)",
+            f"breakout_events{days}":
+                f"(date, symbol, event_time, event_type, candle_time, candle_high, candle_low, candle_close, "
+                f"prev{days}d_high, prev{days}d_low)",
+        }
+        inserted = 0
+        with conn.cursor() as cur:
+            for table, columns in statements.items():
+                if not rows.get(table):
+                    continue
+                with stage('event_detector', f"insert:{table}") as s:
+                    execute_values(cur, f"INSERT INTO {table} {columns} VALUES %s ON CONFLICT DO NOTHING",
+                                   rows[table], page_size=INSERT_PAGE_SIZE)
+                    s.rows = len(rows[table])
+                inserted += len(rows[table])
+        conn.commit()
+        return inserted
+
+    def run(self, conn, store, final: bool = False, verbose: bool = True) -> Dict[str, List[tuple]]:
+        """
+        Detect on the newest closed tf bar (1-minute bar for the volume rule)
+        of every symbol in a CandleStore and insert the events; bars evaluated
+        by an earlier run are skipped. Each bar is judged with the levels of
+        its own session day. final evaluates the newest bars instead: at the
+        session close no later tick will close them. Returns the event rows
+        per table.
+        """
+        with stage('event_detector', 'detect') as s:
+            bar = store.latest(self.tf) if final else store.closed(self.tf)
+            minute = store.latest(1) if final else store.closed(1)
+            symbols = store.symbols[:len(bar['ts'])]
+            fresh, fresh_minute = self._fresh(self.tf, bar), self._fresh(1, minute)
+            volume = _keep(detect_volume(minute, self.threshold), fresh_minute)
+            session = (bar['ts'] + int(IST.utcoffset(None).total_seconds())) // 86400
+            groups = []
+            for number in np.unique(session[fresh]).tolist():
+                levels = self.levels(conn, symbols, EPOCH_DAY + timedelta(days=number))
+                in_day = fresh & (session == number)
+                detected = {rule: _keep(hits, in_day) for rule, hits in detect(bar, levels, self.threshold).items()}
+                groups.append((levels, detected))
+            if not groups:
+                # No fresh tf bar: only the volume rule has anything to report
+                unknown = Levels(symbols)
+                groups.append((unknown, {rule: _keep(hits, fresh) for rule, hits in detect(bar, unknown).items()}))
+            s.rows = int(fresh.sum())
+        rows = {}
+        for i, (levels, detected) in enumerate(groups):
+            # The volume rule needs no levels: its rows go out with the first group
+            detected['volume'] = volume if i == 0 else _keep(volume, np.zeros_like(fresh_minute))
+            for table, table_rows in self.rows(symbols, bar, levels, detected, minute).items():
+                rows.setdefault(table, []).extend(table_rows)
+        self.store(conn, rows)
+        self._mark(self.tf, bar, fresh)
+        self._mark(1, minute, fresh_minute)
+        if verbose:
+            print(f"Detected events for {len(symbols)} symbols: "
+                  + ", ".join(f"{table}={len(table_rows)}" for table, table_rows in rows.items()))
+        return rows
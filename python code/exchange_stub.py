@@ -0,0 +1,176 @@
+"""
+Local Stub for the Exchange Movers Endpoints
+============================================
+
+Serves canned puller/dragger payloads so the concurrent movers fetch can be
+exercised offline. Each index can be given an artificial delay or made to
+fail, which is how the per-source deadlines and snapshot fallback are checked.
+The stub speaks keep-alive HTTP/1.1 and counts the connections it accepts;
+--check-reuse fetches through helpers shaped like the exchange ones (plain
+module-level requests.get, no session argument) and fails unless the
+rounds reused connections.
+
+    python exchange_stub.py --delay nifty50=3 --fail bankex
+    python exchange_stub.py --check-reuse
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Set
+
+import requests
+
+from movers_fetch import MOVER_SOURCES, fetch_all_movers
+
+STUB_SYMBOLS = {
+    'sensex': ['RELIANCE', 'HDFCBANK', 'ICICIBANK', 'INFY', 'TCS', 'ITC', 'LT', 'SBIN'],
+    'bankex': ['HDFCBANK', 'ICICIBANK', 'SBIN', 'KOTAKBANK', 'AXISBANK', 'INDUSINDBK'],
+    'nifty50': ['RELIANCE', 'HDFCBANK', 'ICICIBANK', 'INFY', 'TCS', 'BHARTIARTL', 'ITC', 'LT'],
+    'banknifty': ['HDFCBANK', 'ICICIBANK', 'SBIN', 'KOTAKBANK', 'AXISBANK', 'BANKBARODA'],
+    'niftymidcap': ['PERSISTENT', 'CUMMINSIND', 'AUBANK', 'FEDERALBNK', 'LUPIN', 'MPHASIS'],
+}
+
+
+def make_payload(index_name: str) -> dict:
+    """Random but well-formed movers payload for one index"""
+    symbols = STUB_SYMBOLS.get(index_name, [])[:]
+    random.shuffle(symbols)
+    half = len(symbols) // 2
+    return {
+        'pullers': [(s, round(random.uniform(0.5, 40.0), 2)) for s in symbols[:half]],
+        'draggers': [(s, round(-random.uniform(0.5, 40.0), 2)) for s in symbols[half:]],
+    }
+
+
+def make_handler(delays: Dict[str, float], failing: Set[str]):
+    class StubHandler(BaseHTTPRequestHandler):
+        # Keep-alive, so a client that reuses connections can be seen doing it
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if len(parts) != 2 or parts[0] != 'movers' or parts[1] not in STUB_SYMBOLS:
+                self.send_error(404)
+                return
+            index_name = parts[1]
+            with self.server._count_lock:
+                self.server.requests += 1
+            time.sleep(delays.get(index_name, 0.0))
+            if index_name in failing:
+                self.send_error(503)
+                return
+            body = json.dumps(make_payload(index_name)).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+class StubServer(ThreadingHTTPServer):
+    """Counts accepted connections and the requests served over them"""
+
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+        self.requests = 0
+        self._count_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+def start_stub_server(port: int = 0, delays: Dict[str, float] = None, failing: Set[str] = None) -> StubServer:
+    """Start the stub on a background thread; port 0 picks a free port"""
+    server = StubServer(('127.0.0.1', port), make_handler(delays or {}, failing or set()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch_stub_movers(url: str, session=None, timeout: float = 30.0) -> dict:
+    """Fetcher with the same return shape as the NSE/BSE helpers"""
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_stub_movers_plain(url: str, timeout: float = 30.0) -> dict:
+    """Like the exchange helpers: no session argument, module-level requests.get"""
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def stub_sources(base_url: str, fetcher=fetch_stub_movers) -> dict:
+    """MOVER_SOURCES pointing at the stub, keeping each index's real deadline"""
+    return {
+        name: (fetcher, {'url': f"{base_url}/movers/{name}"}, timeout)
+        for name, (_func, _kwargs, timeout) in MOVER_SOURCES.items()
+    }
+
+
+def check_reuse(server: StubServer, base_url: str, rounds: int = 3) -> bool:
+    """Fetch rounds through the session-less fetcher; True if connections were reused"""
+    sources = stub_sources(base_url, fetch_stub_movers_plain)
+    for _ in range(rounds):
+        fetch_all_movers(sources)
+    reused = server.connections < server.requests
+    print(f"{server.requests} requests over {server.connections} connections: "
+          f"{'reused' if reused else 'NOT reused'}")
+    return reused
+
+
+def _parse_delays(items) -> Dict[str, float]:
+    delays = {}
+    for item in items or []:
+        name, seconds = item.split('=', 1)
+        delays[name] = float(seconds)
+    return delays
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stub for the exchange movers endpoints")
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--delay', action='append', help="index=seconds, may be repeated")
+    parser.add_argument('--fail', action='append', default=[], help="index that returns 503")
+    parser.add_argument('--serve', action='store_true', help="only run the server")
+    parser.add_argument('--check-reuse', action='store_true',
+                        help="exit non-zero unless session-less fetchers reuse connections")
+    args = parser.parse_args()
+
+    delays = _parse_delays(args.delay)
+    server = start_stub_server(args.port, delays, set(args.fail))
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"Exchange stub listening on {base_url}")
+
+    if args.check_reuse:
+        ok = check_reuse(server, base_url)
+        server.shutdown()
+        raise SystemExit(0 if ok else 1)
+    elif args.serve:
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        sources = stub_sources(base_url)
+        # Second round shows the snapshot fallback for failing/slow indices
+        for round_no in (1, 2):
+            start = time.monotonic()
+            results, stale = fetch_all_movers(sources)
+            print(f"Round {round_no}: {sorted(results)} stale={sorted(stale)} "
+                  f"wall={time.monotonic() - start:.2f}s sum_of_delays={sum(delays.values()):.2f}s")
+        server.shutdown()
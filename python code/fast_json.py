@@ -0,0 +1,95 @@
+"""
+Fast JSON Path from Cursor Rows
+===============================
+
+Encodes DB rows straight to JSON without building a pydantic model per row.
+The pydantic models stay the schema contract: the row encoder is derived
+from a model's fields (names, order and the float coercion pydantic would
+apply), so the payload carries the same values as
+json.dumps([Model(**row).model_dump() ...], cls=DateTimeEncoder).
+
+orjson is optional; without it dumps() falls back to the stdlib encoder.
+Differences from the stdlib path are textual only (no spaces after
+separators, 1e16 instead of 1e+16); NaN becomes null.
+"""
+
+import json
+import typing
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable, Dict, List, Sequence, Type
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+AVAILABLE = orjson is not None
+
+
+class JSONEncoder(json.JSONEncoder):
+    """Stdlib fallback covering what the page2/page3 DateTimeEncoders handle"""
+
+    def default(self, obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super().default(obj)
+
+
+def _orjson_default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """JSON bytes via orjson when installed, otherwise a str from the stdlib"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_orjson_default)
+    return json.dumps(obj, cls=JSONEncoder)
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _is_float_field(annotation) -> bool:
+    # float and Decimal (page3 serialises Decimal as float), optionally `| None`
+    args = typing.get_args(annotation) or (annotation,)
+    return any(arg in (float, Decimal) for arg in args)
+
+
+def field_names(model: Type[BaseModel]) -> List[str]:
+    """Column order a fast-path query must select in"""
+    return list(model.model_fields)
+
+
+def row_encoder(model: Type[BaseModel]) -> Callable[[Sequence], Dict]:
+    """
+    Build a function turning a cursor row (columns in field_names(model)
+    order) into the dict model.model_dump() would produce.
+    """
+    names = field_names(model)
+    converters = [
+        _to_float if _is_float_field(info.annotation) else None
+        for info in model.model_fields.values()
+    ]
+    if not any(converters):
+        return lambda row: dict(zip(names, row))
+
+    def encode(row):
+        return {
+            name: (convert(value) if convert else value)
+            for name, convert, value in zip(names, converters, row)
+        }
+    return encode
+
+
+def model_builder(model: Type[BaseModel]) -> Callable[[Sequence], BaseModel]:
+    """Validated-model counterpart of row_encoder, for the pydantic path"""
+    names = field_names(model)
+    return lambda row: model(**dict(zip(names, row)))
@@ -0,0 +1,604 @@
+"""
+Streaming Indicator Engine
+==========================
+
+Updates the page3 indicators bar by bar instead of recomputing them over a
+lookback window at every close. Each (symbol, tf) keeps its recursive state
+in NumPy arrays (one row per symbol slot, like candle_store), so a closed
+bar for the whole universe costs O(1) work per symbol, vectorized:
+
+    yellow_{tf}_new      yellow     EMA(close, YELLOW_PERIOD), SMA-seeded
+    dema_talib_{tf}_new  dema       2 * EMA1 - EMA(EMA1), DEMA_PERIOD (TA-Lib DEMA)
+    fibonacci_{tf}_new   fib_61/38  retracements of the FIB_WINDOW-bar high/low range
+    bb_atr_{tf}_new      bb_upper/lower = SMA +- BB_DEVIATIONS * stdev(close, BB_PERIOD)
+                         bb_signal  1 above the upper band, -1 below the lower, else 0
+                         trendline  low - ATR on 1 / high + ATR on -1, never moving
+                                    against the trend; ATR is Wilder's over ATR_PERIOD
+                         trend      1 / -1 when the trendline rises / falls
+
+Rolling means and deviations are sliding sums (re-synced from the window
+once per period); rolling highs / lows are only rescanned when the bar
+leaving the window held the extreme. A table gets a row once its
+indicator is warmed up, one batched insert per table per update.
+
+State is checkpointed as one blob per timeframe to Postgres
+(indicator_state) or Redis (indicator_state:{tf}); a restart restores it
+and bars at or before a symbol's last processed bar are skipped.
+
+    engine = IndicatorEngine(timeframes=[5, 15])
+    engine.restore(conn) or engine.warm_up(conn)
+    engine.run(conn, store)               # store: candle_store.CandleStore
+    engine.checkpoint(conn)
+
+The indicator definitions are reconstructed (the scripts that fill these
+tables today are not in this tree), so the engine writes nothing unless
+created with write=True; replay does, into its own schema. --compare
+checks the engine against the rows already in the live tables.
+
+    python indicator_engine.py --self-check    # parity with full recomputation
+    python indicator_engine.py --compare 15    # parity with yellow_15_new & co.
+"""
+
+import io
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+from metrics import stage
+
+YELLOW_PERIOD = 20
+DEMA_PERIOD = 30
+FIB_WINDOW = 50
+BB_PERIOD = 21
+BB_DEVIATIONS = 1.0
+ATR_PERIOD = 5
+WARMUP_BARS = 500
+INSERT_PAGE_SIZE = 5000
+
+PARAMS = {
+    'yellow': YELLOW_PERIOD, 'dema': DEMA_PERIOD, 'fib': FIB_WINDOW,
+    'bb': BB_PERIOD, 'bb_deviations': BB_DEVIATIONS, 'atr': ATR_PERIOD,
+}
+
+# Per-slot scalar state: name -> (dtype, initial value)
+SCALARS = {
+    'last_ts': (np.int64, -1), 'n': (np.int64, 0),
+    'yellow_sum': (np.float64, 0.0), 'yellow': (np.float64, np.nan),
+    'ema1_sum': (np.float64, 0.0), 'ema1': (np.float64, np.nan),
+    'ema2_sum': (np.float64, 0.0), 'ema2': (np.float64, np.nan),
+    'bb_mean': (np.float64, 0.0), 'bb_m2': (np.float64, 0.0),
+    'hi': (np.float64, np.nan), 'lo': (np.float64, np.nan),
+    'prev_close': (np.float64, np.nan), 'tr_sum': (np.float64, 0.0), 'atr': (np.float64, np.nan),
+    'trendline': (np.float64, np.nan), 'trend': (np.int64, 0),
+}
+# Per-slot windows: name -> length
+WINDOWS = {'closes': BB_PERIOD, 'highs': FIB_WINDOW, 'lows': FIB_WINDOW}
+
+TABLES = {
+    'yellow': ("yellow_{tf}_new", "(timestamp, symbol, yellow)"),
+    'dema': ("dema_talib_{tf}_new", "(timestamp, symbol, dema)"),
+    'fib': ("fibonacci_{tf}_new", "(timestamp, symbol, fib_61, fib_38)"),
+    'bb_atr': ("bb_atr_{tf}_new", "(timestamp, symbol, bb_upper, bb_lower, bb_signal, trendline, trend)"),
+}
+
+
+def _seeded_average(total, value, n, period, alpha, x):
+    """
+    One step of an SMA-seeded exponential average; n counts x (n < 1 means
+    x is not available yet). Returns the new (total, value).
+    """
+    total = np.where((n >= 1) & (n <= period), total + x, total)
+    value = np.where(n < period, np.nan,
+                     np.where(n == period, total / period, value + alpha * (x - value)))
+    return total, value
+
+
+class _State:
+    """Indicator state for one timeframe"""
+
+    def __init__(self, slots: int):
+        self.scalars = {name: np.full(slots, initial, dtype=dtype) for name, (dtype, initial) in SCALARS.items()}
+        self.windows = {name: np.full((slots, length), np.nan) for name, length in WINDOWS.items()}
+
+    def grow(self, slots: int):
+        extra = slots - len(self.scalars['n'])
+        for name, (dtype, initial) in SCALARS.items():
+            self.scalars[name] = np.concatenate([self.scalars[name], np.full(extra, initial, dtype=dtype)])
+        for name, length in WINDOWS.items():
+            self.windows[name] = np.vstack([self.windows[name], np.full((extra, length), np.nan)])
+
+    def update(self, rows, h, l, c) -> Dict[str, np.ndarray]:
+        """Fold one closed bar per row into the state; returns indicator values (NaN while warming up)"""
+        st, win = self.scalars, self.windows
+        n = st['n'][rows] + 1
+        st['n'][rows] = n
+
+        st['yellow_sum'][rows], st['yellow'][rows] = _seeded_average(
+            st['yellow_sum'][rows], st['yellow'][rows], n, YELLOW_PERIOD, 2 / (YELLOW_PERIOD + 1), c)
+
+        alpha = 2 / (DEMA_PERIOD + 1)
+        ema1_sum, ema1 = _seeded_average(st['ema1_sum'][rows], st['ema1'][rows], n, DEMA_PERIOD, alpha, c)
+        # EMA2 runs over EMA1 once EMA1 exists
+        ema2_sum, ema2 = _seeded_average(st['ema2_sum'][rows], st['ema2'][rows], n - DEMA_PERIOD + 1,
+                                         DEMA_PERIOD, alpha, ema1)
+        st['ema1_sum'][rows], st['ema1'][rows] = ema1_sum, ema1
+        st['ema2_sum'][rows], st['ema2'][rows] = ema2_sum, ema2
+
+        # Sliding mean / sum of squared deviations over the close window
+        closes = win['closes']
+        pos = (n - 1) % BB_PERIOD
+        full = n > BB_PERIOD
+        leaving = closes[rows, pos]
+        mean, m2 = st['bb_mean'][rows], st['bb_m2'][rows]
+        delta = c - mean
+        warm_mean = mean + delta / np.minimum(n, BB_PERIOD)
+        warm_m2 = m2 + delta * (c - warm_mean)
+        slide_mean = mean + (c - leaving) / BB_PERIOD
+        slide_m2 = m2 + (c - leaving) * (c - slide_mean + leaving - mean)
+        mean = np.where(full, slide_mean, warm_mean)
+        m2 = np.where(full, slide_m2, warm_m2)
+        closes[rows, pos] = c
+        resync = (n % BB_PERIOD) == 0
+        if resync.any():
+            window = closes[rows[resync]]
+            mean[resync] = window.mean(axis=1)
+            m2[resync] = ((window - mean[resync, None]) ** 2).sum(axis=1)
+        st['bb_mean'][rows], st['bb_m2'][rows] = mean, m2
+
+        # Rolling high / low: rescan only where the extreme left the window
+        pos = (n - 1) % FIB_WINDOW
+        full = n > FIB_WINDOW
+        for name, ring, x, sign in (('hi', win['highs'], h, 1), ('lo', win['lows'], l, -1)):
+            leaving = ring[rows, pos]
+            old = st[name][rows]
+            ring[rows, pos] = x
+            extreme = np.fmax(old, x) if sign > 0 else np.fmin(old, x)
+            stale = full & (leaving == old) & (sign * x < sign * old)
+            if stale.any():
+                window = ring[rows[stale]]
+                extreme[stale] = window.max(axis=1) if sign > 0 else window.min(axis=1)
+            st[name][rows] = extreme
+
+        # Wilder ATR (true range falls back to high - low on the first bar)
+        prev_close = st['prev_close'][rows]
+        true_range = np.where(np.isnan(prev_close), h - l,
+                              np.fmax(h - l, np.fmax(np.abs(h - prev_close), np.abs(l - prev_close))))
+        st['tr_sum'][rows], st['atr'][rows] = _seeded_average(
+            st['tr_sum'][rows], st['atr'][rows], n, ATR_PERIOD, 1 / ATR_PERIOD, true_range)
+        st['prev_close'][rows] = c
+        atr = st['atr'][rows]
+
+        std = np.sqrt(np.maximum(m2, 0) / BB_PERIOD)
+        bb_ready = n >= BB_PERIOD
+        upper = np.where(bb_ready, mean + BB_DEVIATIONS * std, np.nan)
+        lower = np.where(bb_ready, mean - BB_DEVIATIONS * std, np.nan)
+        signal = np.where(c > upper, 1, np.where(c < lower, -1, 0))
+
+        # Follow line: ratchets with the trend, comparisons against NaN never hold
+        previous = st['trendline'][rows]
+        up = l - atr
+        up = np.where(up < previous, previous, up)
+        down = h + atr
+        down = np.where(down > previous, previous, down)
+        trendline = np.where(signal == 1, up, np.where(signal == -1, down, previous))
+        trend = np.where(trendline > previous, 1, np.where(trendline < previous, -1, st['trend'][rows]))
+        st['trendline'][rows], st['trend'][rows] = trendline, trend
+
+        hi, lo = st['hi'][rows], st['lo'][rows]
+        fib_ready = n >= FIB_WINDOW
+        return {
+            'yellow': st['yellow'][rows],
+            'dema': 2 * ema1 - ema2,
+            'fib_61': np.where(fib_ready, hi - 0.618 * (hi - lo), np.nan),
+            'fib_38': np.where(fib_ready, hi - 0.382 * (hi - lo), np.nan),
+            'bb_upper': upper, 'bb_lower': lower, 'bb_signal': signal,
+            'trendline': trendline, 'trend': trend,
+        }
+
+
+class IndicatorEngine:
+    def __init__(self, timeframes: Sequence[int] = (5, 15, 30, 60), symbols: Optional[Sequence[str]] = None,
+                 write: bool = False):
+        self.timeframes = [int(tf) for tf in timeframes]
+        self.write = write
+        self.symbols: List[str] = []
+        self._slot: Dict[str, int] = {}
+        self._states = {tf: _State(0) for tf in self.timeframes}
+        if symbols:
+            self.slots(symbols)
+
+    def slots(self, symbols: Sequence[str]) -> np.ndarray:
+        """Slot index per symbol, adding unseen symbols (state grows in blocks)"""
+        new = [s for s in dict.fromkeys(symbols) if s not in self._slot]
+        if new:
+            for symbol in new:
+                self._slot[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            allocated = len(next(iter(self._states.values())).scalars['n']) if self._states else 0
+            if len(self.symbols) > allocated:
+                size = max(len(self.symbols), 2 * allocated, 64)
+                for state in self._states.values():
+                    state.grow(size)
+        return np.fromiter((self._slot[s] for s in symbols), dtype=np.int64, count=len(symbols))
+
+    # -------------------------------------------------------------------------
+    # Updates
+    # -------------------------------------------------------------------------
+
+    def update(self, tf: int, symbols: Sequence[str], epoch_s, h, l, c) -> Dict[str, List[tuple]]:
+        """
+        Apply closed tf bars (one per symbol, or several in time order) and
+        return the new rows per table. Bars at or before a symbol's last
+        processed bar are ignored, so replays after a restore are harmless.
+        """
+        epoch_s = np.asarray(epoch_s, dtype=np.int64)
+        h, l, c = (np.asarray(x, dtype=np.float64) for x in (h, l, c))
+        state = self._states[tf]
+        rows = self.slots(symbols)
+        fresh = epoch_s > state.scalars['last_ts'][rows]
+        rows, epoch_s, h, l, c = rows[fresh], epoch_s[fresh], h[fresh], l[fresh], c[fresh]
+
+        out = {key: [] for key in TABLES}
+        with stage('indicator_engine', f"update:{tf}") as s:
+            # Same round-splitting as CandleStore.ingest: each symbol at most once per round
+            order = np.lexsort((epoch_s, rows))
+            rank = np.empty(len(rows), dtype=np.int64)
+            if len(rows):
+                sorted_rows = rows[order]
+                starts = np.r_[0, np.flatnonzero(np.diff(sorted_rows)) + 1]
+                rank[order] = np.arange(len(rows)) - np.repeat(starts, np.diff(np.r_[starts, len(rows)]))
+            for round_no in range(int(rank.max()) + 1 if len(rows) else 0):
+                pick = rank == round_no
+                values = state.update(rows[pick], h[pick], l[pick], c[pick])
+                state.scalars['last_ts'][rows[pick]] = epoch_s[pick]
+                self._append_rows(out, rows[pick], epoch_s[pick], values)
+            s.rows = len(rows)
+        return {TABLES[key][0].format(tf=tf): table_rows for key, table_rows in out.items()}
+
+    def _append_rows(self, out, rows, epoch_s, values):
+        stamps = [datetime.fromtimestamp(t, timezone.utc) for t in epoch_s.tolist()]
+        symbols = [self.symbols[r] for r in rows.tolist()]
+
+        def ready(*names):
+            mask = np.ones(len(rows), dtype=bool)
+            for name in names:
+                mask &= ~np.isnan(values[name])
+            return np.flatnonzero(mask).tolist()
+
+        columns = {name: values[name].tolist() for name in values}
+        out['yellow'].extend((stamps[i], symbols[i], columns['yellow'][i]) for i in ready('yellow'))
+        out['dema'].extend((stamps[i], symbols[i], columns['dema'][i]) for i in ready('dema'))
+        out['fib'].extend((stamps[i], symbols[i], columns['fib_61'][i], columns['fib_38'][i])
+                          for i in ready('fib_61'))
+        out['bb_atr'].extend(
+            (stamps[i], symbols[i], columns['bb_upper'][i], columns['bb_lower'][i], int(columns['bb_signal'][i]),
+             columns['trendline'][i], int(columns['trend'][i]))
+            for i in ready('bb_upper', 'trendline')
+        )
+
+    def store(self, conn, rows: Dict[str, List[tuple]]) -> int:
+        """One batched insert per table; nothing is written unless write=True"""
+        if not self.write:
+            return 0
+        columns = {table.format(tf=tf): cols for tf in self.timeframes for table, cols in TABLES.values()}
+        inserted = 0
+        with conn.cursor() as cur:
+            for table, table_rows in rows.items():
+                if not table_rows:
+                    continue
+                with stage('indicator_engine', f"insert:{table}") as s:
+                    execute_values(cur, f"INSERT INTO {table} {columns[table]} VALUES %s ON CONFLICT DO NOTHING",
+                                   table_rows, page_size=INSERT_PAGE_SIZE)
+                    s.rows = len(table_rows)
+                inserted += len(table_rows)
+        conn.commit()
+        return inserted
+
+    def run(self, conn, store, verbose: bool = True) -> Dict[str, int]:
+        """Feed the newest closed bar of every timeframe from a CandleStore and insert the rows"""
+        counts = {}
+        for tf in self.timeframes:
+            # The newest bar is still forming; the one before it is closed
+            window = store.window(tf, 2)
+            symbols = store.symbols[:len(window['ts'])]
+            closed = np.flatnonzero(window['ts'][:, 0] >= 0)
+            rows = self.update(tf, [symbols[i] for i in closed], window['ts'][closed, 0],
+                               window['high'][closed, 0], window['low'][closed, 0], window['close'][closed, 0])
+            self.store(conn, rows)
+            counts.update({table: len(table_rows) for table, table_rows in rows.items()})
+        if verbose:
+            print("Indicators updated: " + ", ".join(f"{table}={count}" for table, count in counts.items()))
+        return counts
+
+    def warm_up(self, conn, symbols: Optional[Sequence[str]] = None, bars: int = WARMUP_BARS):
+        """Build state from the last `bars` closed bars per symbol (nothing is written)"""
+        from bars import last_bars
+
+        with stage('indicator_engine', 'warm_up') as s:
+            loaded = 0
+            for tf in self.timeframes:
+                history = last_bars(conn, tf, bars + 1, symbols)
+                names, stamps, highs, lows, closes = [], [], [], [], []
+                for symbol, symbol_bars in history.items():
+                    for bucket, _o, high, low, close, _v in symbol_bars[:-1]:  # last one is forming
+                        names.append(symbol)
+                        stamps.append(int(bucket.timestamp()))
+                        highs.append(high)
+                        lows.append(low)
+                        closes.append(close)
+                self.update(tf, names, stamps, highs, lows, closes)
+                loaded += len(names)
+            s.rows = loaded
+        print(f"Indicator state warmed up: {len(self.symbols)} symbols, {loaded} bars")
+
+    # -------------------------------------------------------------------------
+    # Checkpoints
+    # -------------------------------------------------------------------------
+
+    def dump(self, tf: int) -> bytes:
+        """One timeframe's state as an .npz blob"""
+        state = self._states[tf]
+        n = len(self.symbols)
+        arrays = {f"s_{name}": values[:n] for name, values in state.scalars.items()}
+        arrays.update({f"w_{name}": values[:n] for name, values in state.windows.items()})
+        buffer = io.BytesIO()
+        np.savez(buffer, symbols=np.array(self.symbols, dtype=str),
+                 params=np.array(json.dumps(PARAMS)), **arrays)
+        return buffer.getvalue()
+
+    def load(self, tf: int, blob: bytes) -> bool:
+        """Restore one timeframe from dump(); False if it was taken with other parameters"""
+        with np.load(io.BytesIO(blob)) as data:
+            if json.loads(str(data['params'])) != PARAMS:
+                return False
+            rows = self.slots(data['symbols'].tolist())
+            state = self._states[tf]
+            for name in SCALARS:
+                state.scalars[name][rows] = data[f"s_{name}"]
+            for name in WINDOWS:
+                state.windows[name][rows] = data[f"w_{name}"]
+        return True
+
+    def checkpoint(self, conn=None, redis_client=None):
+        """Save every timeframe to indicator_state (Postgres) and/or indicator_state:{tf} (Redis)"""
+        with stage('indicator_engine', 'checkpoint') as s:
+            blobs = {tf: self.dump(tf) for tf in self.timeframes}
+            if conn is not None:
+                with conn.cursor() as cur:
+                    for tf, blob in blobs.items():
+                        cur.execute("""
+                            INSERT INTO indicator_state (tf, state, updated_at) VALUES (%s, %s, NOW())
+                            ON CONFLICT (tf) DO UPDATE SET state = EXCLUDED.state, updated_at = NOW()
+                        """, (tf, blob))
+                conn.commit()
+            if redis_client is not None:
+                pipe = redis_client.pipeline(transaction=False)
+                for tf, blob in blobs.items():
+                    pipe.set(f"indicator_state:{tf}", blob)
+                pipe.execute()
+            s.bytes = sum(len(blob) for blob in blobs.values())
+
+    def restore(self, conn=None, redis_client=None) -> bool:
+        """Load the last checkpoint (Redis first, then Postgres); True if every timeframe was restored"""
+        restored = set()
+        if redis_client is not None:
+            for tf in self.timeframes:
+                blob = redis_client.get(f"indicator_state:{tf}")
+                if blob and self.load(tf, blob):
+                    restored.add(tf)
+        missing = [tf for tf in self.timeframes if tf not in restored]
+        if conn is not None and missing:
+            with conn.cursor() as cur:
+                cur.execute("SELECT tf, state FROM indicator_state WHERE tf = ANY(%s)", (missing,))
+                for tf, blob in cur.fetchall():
+                    if self.load(tf, bytes(blob)):
+                        restored.add(tf)
+        print(f"Indicator state restored for timeframes {sorted(restored)} ({len(self.symbols)} symbols)")
+        return len(restored) == len(self.timeframes)
+
+
+# =============================================================================
+# SELF-CHECK: streaming vs. full recomputation
+# =============================================================================
+
+def _ema_full(x: np.ndarray, period: int, alpha: float) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if len(valid) < period:
+        return out
+    first = valid[0]
+    out[first + period - 1] = x[first:first + period].mean()
+    for i in range(first + period, len(x)):
+        out[i] = out[i - 1] + alpha * (x[i] - out[i - 1])
+    return out
+
+
+def recompute(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> Dict[str, np.ndarray]:
+    """Every indicator for one symbol's full history, computed from scratch"""
+    n = len(close)
+    yellow = _ema_full(close, YELLOW_PERIOD, 2 / (YELLOW_PERIOD + 1))
+    ema1 = _ema_full(close, DEMA_PERIOD, 2 / (DEMA_PERIOD + 1))
+    dema = 2 * ema1 - _ema_full(ema1, DEMA_PERIOD, 2 / (DEMA_PERIOD + 1))
+
+    fib_61, fib_38 = np.full(n, np.nan), np.full(n, np.nan)
+    upper, lower = np.full(n, np.nan), np.full(n, np.nan)
+    for i in range(n):
+        if i >= FIB_WINDOW - 1:
+            hi, lo = high[i - FIB_WINDOW + 1:i + 1].max(), low[i - FIB_WINDOW + 1:i + 1].min()
+            fib_61[i], fib_38[i] = hi - 0.618 * (hi - lo), hi - 0.382 * (hi - lo)
+        if i >= BB_PERIOD - 1:
+            window = close[i - BB_PERIOD + 1:i + 1]
+            upper[i] = window.mean() + BB_DEVIATIONS * window.std()
+            lower[i] = window.mean() - BB_DEVIATIONS * window.std()
+
+    prev_close = np.r_[np.nan, close[:-1]]
+    true_range = np.where(np.isnan(prev_close), high - low,
+                          np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close))))
+    atr = _ema_full(true_range, ATR_PERIOD, 1 / ATR_PERIOD)
+
+    signal = np.where(close > upper, 1, np.where(close < lower, -1, 0))
+    trendline, trend = np.full(n, np.nan), np.zeros(n, dtype=np.int64)
+    previous, current_trend = np.nan, 0
+    for i in range(n):
+        line = previous
+        if signal[i] == 1:
+            line = low[i] - atr[i]
+            if line < previous:
+                line = previous
+        elif signal[i] == -1:
+            line = high[i] + atr[i]
+            if line > previous:
+                line = previous
+        if line > previous:
+            current_trend = 1
+        elif line < previous:
+            current_trend = -1
+        trendline[i], trend[i], previous = line, current_trend, line
+    return {'yellow': yellow, 'dema': dema, 'fib_61': fib_61, 'fib_38': fib_38,
+            'bb_upper': upper, 'bb_lower': lower, 'bb_signal': signal, 'trendline': trendline, 'trend': trend}
+
+
+def self_check(symbols: int = 50, bars: int = 600, seed: int = 11) -> bool:
+    """
+    Stream random bars through the engine (checkpointing and restoring into
+    a fresh engine halfway) and compare every row with recompute()
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"SYM{i:03d}" for i in range(symbols)]
+    close = rng.uniform(50, 5000, symbols)[:, None] * np.exp(np.cumsum(rng.normal(0, 0.004, (symbols, bars)), axis=1))
+    high = close * rng.uniform(1, 1.006, (symbols, bars))
+    low = close * rng.uniform(0.994, 1, (symbols, bars))
+    stamps = 1704080700 + 900 * np.arange(bars)
+    tf = 15
+
+    engine = IndicatorEngine(timeframes=[tf])
+    streamed = {key: {} for key in TABLES}
+    for i in range(bars):
+        if i == bars // 2:
+            # Restart from a checkpoint, replaying the last few bars
+            restored = IndicatorEngine(timeframes=[tf])
+            assert restored.load(tf, engine.dump(tf))
+            engine = restored
+            assert not any(engine.update(tf, names, np.full(symbols, stamps[i - 1]),
+                                         high[:, i - 1], low[:, i - 1], close[:, i - 1]).values())
+        rows = engine.update(tf, names, np.full(symbols, stamps[i]), high[:, i], low[:, i], close[:, i])
+        for key, (table, _columns) in TABLES.items():
+            for row in rows[table.format(tf=tf)]:
+                streamed[key][(row[1], int(row[0].timestamp()))] = row[2:]
+
+    ok = True
+    for s, symbol in enumerate(names):
+        expected = recompute(high[s], low[s], close[s])
+        for i, ts in enumerate(stamps.tolist()):
+            checks = {
+                'yellow': (expected['yellow'][i],),
+                'dema': (expected['dema'][i],),
+                'fib': (expected['fib_61'][i], expected['fib_38'][i]),
+                'bb_atr': (expected['bb_upper'][i], expected['bb_lower'][i], expected['bb_signal'][i],
+                           expected['trendline'][i], expected['trend'][i]),
+            }
+            for key, want in checks.items():
+                got = streamed[key].get((symbol, ts))
+                due = not np.isnan(want[0]) and not (key == 'bb_atr' and np.isnan(want[3]))
+                if due != (got is not None):
+                    print(f"MISMATCH {key} {symbol} bar {i}: streamed {got}, expected {want if due else None}")
+                    ok = False
+                elif due and not np.allclose(got, want, rtol=1e-9, atol=1e-9):
+                    print(f"MISMATCH {key} {symbol} bar {i}: streamed {got}, expected {want}")
+                    ok = False
+
+    try:
+        import talib
+        for s in range(symbols):
+            reference = talib.DEMA(close[s], timeperiod=DEMA_PERIOD)
+            mine = recompute(high[s], low[s], close[s])['dema']
+            if not np.allclose(mine, reference, rtol=1e-9, equal_nan=True):
+                print(f"MISMATCH dema vs talib for {names[s]}")
+                ok = False
+    except ImportError:
+        pass
+
+    print(f"Indicator self-check {'passed' if ok else 'FAILED'}: {symbols} symbols x {bars} bars")
+    return ok
+
+
+def compare_with_tables(conn, tf: int, symbols: Optional[Sequence[str]] = None, bars: int = 2 * WARMUP_BARS,
+                        rtol: float = 1e-6) -> bool:
+    """
+    Stream the last `bars` closed tf bars through a fresh engine and compare
+    its rows with those the existing scripts wrote for the same (symbol,
+    timestamp). Rows computed before the engine has seen WARMUP_BARS bars of
+    a symbol are left out, since its recursive state is still settling.
+    """
+    from bars import last_bars
+
+    engine = IndicatorEngine(timeframes=[tf])
+    computed = {key: {} for key in TABLES}
+    history = last_bars(conn, tf, bars + 1, symbols)
+    for symbol, symbol_bars in history.items():
+        for i, (bucket, _o, high, low, close, _v) in enumerate(symbol_bars[:-1]):  # last one is forming
+            rows = engine.update(tf, [symbol], [int(bucket.timestamp())], [high], [low], [close])
+            if i < WARMUP_BARS:
+                continue
+            for key, (table, _columns) in TABLES.items():
+                for row in rows[table.format(tf=tf)]:
+                    computed[key][(row[1], row[0])] = row[2:]
+
+    ok = True
+    with conn.cursor() as cur:
+        for key, (table, columns) in TABLES.items():
+            table = table.format(tf=tf)
+            ours = computed[key]
+            if not ours:
+                continue
+            start = min(ts for _symbol, ts in ours)
+            names = columns.strip('()').split(', ')
+            cur.execute(f"SELECT {', '.join(names)} FROM {table} WHERE symbol = ANY(%s) AND timestamp >= %s",
+                        (sorted({symbol for symbol, _ts in ours}), start))
+            matched, mismatched = 0, 0
+            for ts, symbol, *theirs in cur.fetchall():
+                mine = ours.get((symbol, ts))
+                if mine is None:
+                    continue
+                theirs = [np.nan if v is None else float(v) for v in theirs]
+                if np.allclose(mine, theirs, rtol=rtol, equal_nan=True):
+                    matched += 1
+                else:
+                    mismatched += 1
+                    if mismatched <= 5:
+                        print(f"MISMATCH {table} {symbol} {ts}: engine {mine}, table {tuple(theirs)}")
+            compared = matched + mismatched
+            print(f"{table}: {len(ours)} rows computed, {compared} found in the table, {mismatched} differ")
+            ok = ok and compared > 0 and mismatched == 0
+    conn.rollback()
+    print(f"Indicator comparison {'passed' if ok else 'FAILED'} for tf={tf}")
+    return ok
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Streaming page3 indicators")
+    parser.add_argument('--self-check', action='store_true', help="verify parity with full recomputation")
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--bars', type=int, default=600)
+    parser.add_argument('--compare', type=int, metavar='TF', help="compare with the live tables of this timeframe")
+    parser.add_argument('--compare-symbols', help="comma-separated symbols (default: every recent symbol)")
+    args = parser.parse_args()
+
+    if args.self_check:
+        sys.exit(0 if self_check(args.symbols, args.bars) else 1)
+    if args.compare:
+        import db
+
+        conn = db.connect()
+        try:
+            symbols = args.compare_symbols.split(',') if args.compare_symbols else None
+            sys.exit(0 if compare_with_tables(conn, args.compare, symbols) else 1)
+        finally:
+            conn.close()
+    parser.print_help()
@@ -0,0 +1,273 @@
+"""
+VWAP and Camarilla Level Builder
+================================
+
+Fills vwap / camarilla (daily), vwap_weekly / camarilla_weekly and
+vwap_monthly / camarilla_monthly for the whole universe from one scan of
+ohlc_live_long: Postgres reduces the candles to one row per (symbol,
+session) and NumPy rolls those up into weeks and months and computes VWAP
+and the ten Camarilla levels for every period at once. Results are
+bulk-upserted, one statement per table.
+
+    VWAP = sum(typical price * volume) / sum(volume), typical = (h + l + c) / 3
+    range = H - L of the period, C = its last close
+    h1..h4 = C + range * 1.1 / (12, 6, 4, 2)     l1..l4 = C - range * 1.1 / (12, 6, 4, 2)
+    h5 = C * H / L                               l5 = C - (h5 - C)
+
+Ranges are widened to whole weeks / months so no partial period is
+written. --workers splits the scan into date ranges across processes; the
+roll-up runs once on the combined daily rows.
+
+    python level_builder.py --rollover                     # after the close
+    python level_builder.py --start 2024-01-01 --end 2024-07-01 --workers 6
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from psycopg2.extras import execute_values
+
+import db
+from metrics import stage
+
+PERIODS = ('daily', 'weekly', 'monthly')
+CAMARILLA_LEVELS = ('h5', 'h4', 'h3', 'h2', 'h1', 'l1', 'l2', 'l3', 'l4', 'l5')
+DAILY_FIELDS = ('pv', 'volume', 'high', 'low', 'close')
+UPSERT_PAGE_SIZE = 5000
+# How far back --rollover looks for the previous session (long holiday runs included)
+SESSION_LOOKBACK_DAYS = 14
+
+
+def period_key(period: str, day: date) -> str:
+    """Python twin of models.PERIOD_KEY_FORMATS"""
+    if period == 'weekly':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if period == 'monthly':
+        return f"{day.year}-{day.month:02d}"
+    return day.isoformat()
+
+
+def period_bounds(period: str, day: date) -> Tuple[date, date]:
+    """[first day, day after the last day] of the period containing day"""
+    if period == 'weekly':
+        first = day - timedelta(days=day.weekday())
+        return first, first + timedelta(days=7)
+    if period == 'monthly':
+        first = day.replace(day=1)
+        return first, (first + timedelta(days=32)).replace(day=1)
+    return day, day + timedelta(days=1)
+
+
+def daily_aggregates(conn, start: date, end: date) -> Dict[str, np.ndarray]:
+    """One row per (symbol, IST session day) in [start, end), ordered by symbol, day"""
+    with stage('level_builder', 'scan') as s, conn.cursor() as cur:
+        cur.execute("""
+            SELECT symbol,
+                   (timestamp AT TIME ZONE 'Asia/Kolkata')::date AS day,
+                   sum((high + low + close) / 3 * volume)::float8,
+                   sum(volume)::float8,
+                   max(high)::float8,
+                   min(low)::float8,
+                   last(close, timestamp)::float8
+            FROM ohlc_live_long
+            WHERE timestamp >= (%s::date)::timestamp AT TIME ZONE 'Asia/Kolkata'
+              AND timestamp < (%s::date)::timestamp AT TIME ZONE 'Asia/Kolkata'
+            GROUP BY symbol, day
+            ORDER BY symbol, day
+        """, (start, end))
+        rows = cur.fetchall()
+        s.rows = len(rows)
+    if not rows:
+        return {'symbol': np.array([], dtype=object), 'day': np.array([], dtype=object),
+                **{name: np.array([]) for name in DAILY_FIELDS}}
+    columns = list(zip(*rows))
+    out = {'symbol': np.array(columns[0], dtype=object), 'day': np.array(columns[1], dtype=object)}
+    for name, values in zip(DAILY_FIELDS, columns[2:]):
+        out[name] = np.array(values, dtype=np.float64)
+    return out
+
+
+def _concat(parts: Sequence[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def roll_up(daily: Dict[str, np.ndarray], period: str) -> Dict[str, np.ndarray]:
+    """Combine daily rows into (symbol, period key) rows; input may be in any order"""
+    if not len(daily['symbol']):
+        return {'symbol': np.array([], dtype=object), 'key': np.array([], dtype=object),
+                **{name: np.array([]) for name in DAILY_FIELDS}}
+    keys = np.array([period_key(period, day) for day in daily['day']], dtype=object)
+    # Sort by symbol, then key, then day so each group is contiguous and its last row has the last close
+    order = np.lexsort((daily['day'].astype('datetime64[D]'), keys.astype(str), daily['symbol'].astype(str)))
+    symbol, key = daily['symbol'][order], keys[order]
+    boundary = np.ones(len(order), dtype=bool)
+    boundary[1:] = (symbol[1:] != symbol[:-1]) | (key[1:] != key[:-1])
+    starts = np.flatnonzero(boundary)
+    ends = np.r_[starts[1:], len(order)] - 1
+    return {
+        'symbol': symbol[starts],
+        'key': key[starts],
+        'pv': np.add.reduceat(daily['pv'][order], starts),
+        'volume': np.add.reduceat(daily['volume'][order], starts),
+        'high': np.maximum.reduceat(daily['high'][order], starts),
+        'low': np.minimum.reduceat(daily['low'][order], starts),
+        'close': daily['close'][order][ends],
+    }
+
+
+def compute_levels(periods: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """VWAP and h1-h5 / l1-l5 for every row of roll_up()"""
+    high, low, close = periods['high'], periods['low'], periods['close']
+    spread = (high - low) * 1.1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vwap = np.where(periods['volume'] > 0, periods['pv'] / periods['volume'], np.nan)
+        h5 = np.where(low > 0, close * high / low, np.nan)
+    return {
+        'vwap': vwap,
+        'h5': h5, 'h4': close + spread / 2, 'h3': close + spread / 4, 'h2': close + spread / 6, 'h1': close + spread / 12,
+        'l1': close - spread / 12, 'l2': close - spread / 6, 'l3': close - spread / 4, 'l4': close - spread / 2,
+        'l5': close - (h5 - close),
+    }
+
+
+def _values(array: np.ndarray) -> list:
+    return [None if v != v else v for v in array.tolist()]
+
+
+def upsert_levels(conn, period: str, periods: Dict[str, np.ndarray], levels: Dict[str, np.ndarray]) -> int:
+    """Bulk upsert one period's VWAP and Camarilla rows"""
+    if not len(periods['symbol']):
+        return 0
+    if period == 'daily':
+        key_column, suffix = 'date', ''
+        keys = [date.fromisoformat(k) for k in periods['key']]
+    else:
+        key_column, suffix = period, f"_{period}"
+        keys = list(periods['key'])
+    symbols = periods['symbol'].tolist()
+    with stage('level_builder', f"upsert:{period}") as s, conn.cursor() as cur:
+        execute_values(cur, f"""
+            INSERT INTO vwap{suffix} ({key_column}, symbol, vwap) VALUES %s
+            ON CONFLICT ({key_column}, symbol) DO UPDATE SET vwap = EXCLUDED.vwap
+        """, list(zip(keys, symbols, _values(levels['vwap']))), page_size=UPSERT_PAGE_SIZE)
+        columns = ", ".join(CAMARILLA_LEVELS)
+        updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in CAMARILLA_LEVELS)
+        execute_values(cur, f"""
+            INSERT INTO camarilla{suffix} ({key_column}, symbol, {columns}) VALUES %s
+            ON CONFLICT ({key_column}, symbol) DO UPDATE SET {updates}
+        """, list(zip(keys, symbols, *(_values(levels[name]) for name in CAMARILLA_LEVELS))),
+            page_size=UPSERT_PAGE_SIZE)
+        s.rows = len(symbols)
+    conn.commit()
+    return len(symbols)
+
+
+def _scan_range(start: date, end: date) -> Dict[str, np.ndarray]:
+    conn = db.connect()
+    try:
+        return daily_aggregates(conn, start, end)
+    finally:
+        conn.close()
+
+
+def _split(start: date, end: date, parts: int) -> List[Tuple[date, date]]:
+    step = max(1, -(-(end - start).days // parts))
+    return [(lower, min(end, lower + timedelta(days=step)))
+            for lower in (start + timedelta(days=i) for i in range(0, (end - start).days, step))]
+
+
+def build_levels(conn, start: date, end: date, periods: Sequence[str] = PERIODS, workers: int = 1) -> Dict[str, int]:
+    """
+    Rebuild the given periods for every period overlapping [start, end).
+    The scan is widened to whole periods and done once for all of them.
+    """
+    scan_start = min(period_bounds(period, start)[0] for period in periods)
+    scan_end = max(period_bounds(period, end - timedelta(days=1))[1] for period in periods)
+    began = perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            ranges = _split(scan_start, scan_end, workers)
+            daily = _concat(list(pool.map(_scan_range, *zip(*ranges))))
+    else:
+        daily = daily_aggregates(conn, scan_start, scan_end)
+    scanned = perf_counter() - began
+
+    written = {}
+    for period in periods:
+        with stage('level_builder', f"compute:{period}"):
+            rolled = roll_up(daily, period)
+            levels = compute_levels(rolled)
+        written[period] = upsert_levels(conn, period, rolled, levels)
+    print(f"Levels {scan_start}..{scan_end - timedelta(days=1)}: {len(daily['symbol'])} symbol-days scanned in "
+          f"{scanned:.1f}s, " + ", ".join(f"{p}={n}" for p, n in written.items())
+          + f" rows in {perf_counter() - began:.1f}s")
+    return written
+
+
+def last_session(conn, before: date) -> Optional[date]:
+    """
+    The last IST day before `before` that has candles. Weekends and exchange
+    holidays have none, so they are skipped without a holiday calendar.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT max((timestamp AT TIME ZONE 'Asia/Kolkata')::date)
+            FROM ohlc_live_long
+            WHERE timestamp >= (%s::date)::timestamp AT TIME ZONE 'Asia/Kolkata'
+              AND timestamp < (%s::date)::timestamp AT TIME ZONE 'Asia/Kolkata'
+        """, (before - timedelta(days=SESSION_LOOKBACK_DAYS), before))
+        return cur.fetchone()[0]
+
+
+def next_weekday(day: date) -> date:
+    day += timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def rollover_periods(conn, today: date) -> Tuple[List[str], Optional[date]]:
+    """
+    For a run after today's close: the last session up to and including
+    today, and the periods it completed. A week / month is complete once the
+    next weekday after today falls outside it, so a session followed by a
+    holiday closes its period on the holiday's run.
+    """
+    session = last_session(conn, today + timedelta(days=1))
+    if session is None:
+        return [], None
+    upcoming = next_weekday(today)
+    periods = ['daily']
+    if period_key('weekly', session) != period_key('weekly', upcoming):
+        periods.append('weekly')
+    if period_key('monthly', session) != period_key('monthly', upcoming):
+        periods.append('monthly')
+    return periods, session
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build VWAP and Camarilla levels for daily/weekly/monthly periods")
+    parser.add_argument('--start', type=date.fromisoformat)
+    parser.add_argument('--end', type=date.fromisoformat, help="exclusive")
+    parser.add_argument('--periods', default=','.join(PERIODS))
+    parser.add_argument('--rollover', action='store_true', help="after the close: today's session and the periods it completed")
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    conn = db.connect()
+    try:
+        if args.rollover:
+            periods, session = rollover_periods(conn, date.today())
+            if session is None:
+                print(f"No session in the last {SESSION_LOOKBACK_DAYS} days, nothing to roll over")
+            else:
+                build_levels(conn, session, session + timedelta(days=1), periods)
+        else:
+            build_levels(conn, args.start, args.end, args.periods.split(','), args.workers)
+    finally:
+        conn.close()
@@ -0,0 +1,192 @@
+"""
+Pipeline Instrumentation
+========================
+
+Lightweight per-stage timing for the pipeline jobs: latency histograms,
+row counts and payload sizes keyed by (job, stage), plus a histogram of
+source-timestamp -> publish-timestamp staleness. No external dependency;
+metrics are exposed as Prometheus text on a local HTTP endpoint and/or
+copied into a Redis hash.
+
+    with stage('page2_15', 'query') as s:
+        rows = cur.fetchall()
+        s.rows = len(rows)
+"""
+
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter
+from typing import Dict, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STALENESS_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.last = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        self.last = value
+
+
+class StageMetrics:
+    def __init__(self):
+        self.seconds = Histogram(LATENCY_BUCKETS)
+        self.rows = 0
+        self.bytes = 0
+
+
+class _Stage:
+    """Handle yielded by stage(); set rows/bytes inside the block"""
+
+    def __init__(self):
+        self.rows = None
+        self.bytes = None
+
+
+_lock = threading.Lock()
+_stages: Dict[Tuple[str, str], StageMetrics] = {}
+_staleness: Dict[str, Histogram] = {}
+
+
+def record(job: str, stage_name: str, seconds: float, rows: Optional[int] = None, nbytes: Optional[int] = None):
+    with _lock:
+        metrics = _stages.get((job, stage_name))
+        if metrics is None:
+            metrics = _stages[(job, stage_name)] = StageMetrics()
+        metrics.seconds.observe(seconds)
+        if rows is not None:
+            metrics.rows += rows
+        if nbytes is not None:
+            metrics.bytes += nbytes
+
+
+@contextmanager
+def stage(job: str, stage_name: str):
+    """Time a block as one stage of a job; the block may set .rows and .bytes"""
+    handle = _Stage()
+    start = perf_counter()
+    try:
+        yield handle
+    finally:
+        record(job, stage_name, perf_counter() - start, handle.rows, handle.bytes)
+
+
+def _utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def stamp(job: str, source_ts: Optional[datetime]) -> dict:
+    """
+    Fields to attach to a published payload: the source timestamp, the
+    publish timestamp and the difference between them in ms. The staleness
+    is also recorded in the job's staleness histogram. Without a source
+    timestamp only published_at is returned.
+    """
+    published_at = _utc_now()
+    if source_ts is None:
+        return {'published_at': published_at.isoformat()}
+    if source_ts.tzinfo is None:
+        source_ts = source_ts.astimezone()
+    staleness = (published_at - source_ts).total_seconds()
+    with _lock:
+        histogram = _staleness.get(job)
+        if histogram is None:
+            histogram = _staleness[job] = Histogram(STALENESS_BUCKETS)
+        histogram.observe(max(0.0, staleness))
+    return {
+        'source_ts': source_ts.isoformat(),
+        'published_at': published_at.isoformat(),
+        'staleness_ms': round(staleness * 1000, 1),
+    }
+
+
+def _histogram_lines(name: str, labels: str, histogram: Histogram) -> list:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+def prometheus_text() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    lines = [
+        '# HELP stockpro_stage_seconds Duration of one pipeline stage',
+        '# TYPE stockpro_stage_seconds histogram',
+    ]
+    with _lock:
+        stages = sorted(_stages.items())
+        staleness = sorted(_staleness.items())
+        for (job, stage_name), metrics in stages:
+            lines += _histogram_lines('stockpro_stage_seconds', f'job="{job}",stage="{stage_name}"', metrics.seconds)
+        lines += ['# HELP stockpro_stage_rows_total Rows handled by a stage', '# TYPE stockpro_stage_rows_total counter']
+        for (job, stage_name), metrics in stages:
+            lines.append(f'stockpro_stage_rows_total{{job="{job}",stage="{stage_name}"}} {metrics.rows}')
+        lines += ['# HELP stockpro_stage_bytes_total Payload bytes produced by a stage', '# TYPE stockpro_stage_bytes_total counter']
+        for (job, stage_name), metrics in stages:
+            lines.append(f'stockpro_stage_bytes_total{{job="{job}",stage="{stage_name}"}} {metrics.bytes}')
+        lines += ['# HELP stockpro_publish_staleness_seconds Source timestamp to publish time',
+                  '# TYPE stockpro_publish_staleness_seconds histogram']
+        for job, histogram in staleness:
+            lines += _histogram_lines('stockpro_publish_staleness_seconds', f'job="{job}"', histogram)
+    return "\n".join(lines) + "\n"
+
+
+def export_to_redis(redis_client, key: str = "metrics:pipeline"):
+    """Copy count / total / last duration, rows and bytes per stage into a Redis hash"""
+    fields = {}
+    with _lock:
+        for (job, stage_name), metrics in _stages.items():
+            prefix = f"{job}:{stage_name}"
+            fields[f"{prefix}:count"] = metrics.seconds.count
+            fields[f"{prefix}:total_ms"] = round(metrics.seconds.sum * 1000, 3)
+            fields[f"{prefix}:last_ms"] = round(metrics.seconds.last * 1000, 3)
+            fields[f"{prefix}:rows"] = metrics.rows
+            fields[f"{prefix}:bytes"] = metrics.bytes
+        for job, histogram in _staleness.items():
+            fields[f"{job}:staleness:last_ms"] = round(histogram.last * 1000, 1)
+    if fields:
+        redis_client.hset(key, mapping=fields)
+
+
+def start_http_server(port: int = 9108, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve prometheus_text() on http://host:port/metrics from a daemon thread"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip('/') != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
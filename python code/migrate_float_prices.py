@@ -0,0 +1,323 @@
+"""
+NUMERIC -> DOUBLE PRECISION Price Migration
+===========================================
+
+Converts the NUMERIC price and indicator columns of existing tables to
+DOUBLE PRECISION (models.PRICE_TYPE) without a table rewrite under an
+exclusive lock. Per table:
+
+    1. add a {col}__f8 shadow column per NUMERIC column, plus a trigger
+       that keeps it in step with rows written during the migration
+    2. backfill in short transactions, one hypertable chunk / batch of heap
+       pages at a time (compressed chunks are decompressed first and the
+       compression policy is paused)
+    3. verify every shadow value equals the NUMERIC value cast to float8;
+       any mismatch aborts the table before anything is dropped
+    4. build a replacement for each continuous aggregate that reads the
+       table, over the shadow columns and under a {view}__f8 name, and
+       refresh it while the live view keeps serving reads
+    5. swap in one short transaction: drop the NUMERIC columns and the old
+       aggregates, rename the shadows and the replacement aggregates, and
+       restore NOT NULL (from a CHECK validated in step 3, so it needs no
+       scan under the lock)
+    6. recompress the chunks that were compressed and resume the
+       compression policy
+
+The converted columns end up last in the table, since the shadows are
+added at the end: anything reading a migrated table positionally
+(SELECT *, INSERT without a column list) must name its columns. Only the
+aggregates models creates (ohlc_{tf}m) get a replacement; any other
+aggregate on a migrated table is dropped by the swap and must be recreated
+by hand. Dropping
+columns of a hypertable with compression enabled needs TimescaleDB
+>= 2.10 (MIN_TIMESCALE_DROP_COLUMN); on older versions such tables are
+skipped before anything is changed.
+
+Re-running after an interruption resumes where it stopped.
+
+    python migrate_float_prices.py --dry-run
+    python migrate_float_prices.py --tables ohlc_live_long,signals_5_new
+"""
+
+import argparse
+import re
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+import db
+import models
+
+SHADOW = "__f8"
+BATCH_PAGES = 2000  # 16 MB of heap per backfill transaction
+SWAP_LOCK_TIMEOUT = '5s'
+# First TimescaleDB release that can DROP COLUMN on a compression-enabled hypertable
+MIN_TIMESCALE_DROP_COLUMN = (2, 10)
+
+
+def candidate_tables(timeframes: List[str], periods: List[str], days: int = 7) -> List[str]:
+    """Every table models creates with NUMERIC price/indicator columns"""
+    tables = ['ohlc_live_long', 'unusual_volume_events', f'prev{days}day_hilo', f'breakout_events{days}']
+    for tf in timeframes:
+        tables += [f'signals_{tf}_new', f'yellow_{tf}_new', f'fibonacci_{tf}_new',
+                   f'dema_talib_{tf}_new', f'bb_atr_{tf}_new']
+        for period in periods:
+            tables += [f'{period}_vwap_cross_events_{tf}', f'{period}_camarilla_cross_events_{tf}']
+    return tables
+
+
+def numeric_columns(cur, table: str) -> Dict[str, bool]:
+    """NUMERIC columns still to convert -> NOT NULL"""
+    cur.execute("""
+        SELECT column_name, is_nullable = 'NO'
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND data_type = 'numeric'
+        ORDER BY ordinal_position
+    """, (table,))
+    return dict(cur.fetchall())
+
+
+def _has_timescale(cur) -> bool:
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+    return cur.fetchone() is not None
+
+
+def _timescale_version(cur) -> Tuple[int, ...]:
+    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'timescaledb'")
+    return tuple(int(part) for part in re.findall(r"\d+", cur.fetchone()[0])[:3])
+
+
+def _is_hypertable(cur, table: str) -> bool:
+    cur.execute("SELECT 1 FROM timescaledb_information.hypertables WHERE hypertable_name = %s", (table,))
+    return cur.fetchone() is not None
+
+
+def _compression_enabled(cur, table: str) -> bool:
+    cur.execute("SELECT compression_enabled FROM timescaledb_information.hypertables WHERE hypertable_name = %s",
+                (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _relations(cur, table: str, hypertable: bool) -> List[Tuple[str, bool]]:
+    """(relation, is_compressed) to backfill: every chunk of a hypertable, else the table itself"""
+    if not hypertable:
+        return [(table, False)]
+    cur.execute("""
+        SELECT format('%%I.%%I', chunk_schema, chunk_name), is_compressed
+        FROM timescaledb_information.chunks
+        WHERE hypertable_name = %s
+        ORDER BY range_start
+    """, (table,))
+    return cur.fetchall()
+
+
+def _compression_job(cur, table: str) -> Optional[int]:
+    cur.execute("""
+        SELECT job_id FROM timescaledb_information.jobs
+        WHERE hypertable_name = %s AND proc_name = 'policy_compression'
+    """, (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _dependent_aggregates(cur, table: str) -> List[str]:
+    cur.execute("""
+        SELECT view_name FROM timescaledb_information.continuous_aggregates
+        WHERE hypertable_name = %s
+    """, (table,))
+    # Replacements left by an interrupted run are rebuilt, not migrated
+    return [row[0] for row in cur.fetchall() if not row[0].endswith(SHADOW)]
+
+
+def prepare(conn, table: str, columns: Dict[str, bool]):
+    """Shadow columns, NOT NULL checks (NOT VALID) and the sync trigger"""
+    with conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE {table} " + ", ".join(
+            f"ADD COLUMN IF NOT EXISTS {col}{SHADOW} DOUBLE PRECISION" for col in columns
+        ))
+        for col, not_null in columns.items():
+            if not_null:
+                cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_{col}{SHADOW}_nn")
+                cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_{col}{SHADOW}_nn "
+                            f"CHECK ({col}{SHADOW} IS NOT NULL) NOT VALID")
+        assignments = " ".join(f"NEW.{col}{SHADOW} := NEW.{col};" for col in columns)
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION {table}{SHADOW}_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN {assignments} RETURN NEW; END $$;
+        """)
+        cur.execute(f"DROP TRIGGER IF EXISTS {table}{SHADOW}_sync ON {table}")
+        cur.execute(f"""
+            CREATE TRIGGER {table}{SHADOW}_sync BEFORE INSERT OR UPDATE ON {table}
+            FOR EACH ROW EXECUTE FUNCTION {table}{SHADOW}_sync()
+        """)
+    conn.commit()
+
+
+def backfill(conn, table: str, columns: Dict[str, bool], relations: List[Tuple[str, bool]]) -> int:
+    """Fill the shadow columns one relation and BATCH_PAGES heap pages per transaction"""
+    sets = ", ".join(f"{col}{SHADOW} = {col}::float8" for col in columns)
+    pending = " OR ".join(f"{col}{SHADOW} IS DISTINCT FROM {col}::float8" for col in columns)
+    updated = 0
+    with conn.cursor() as cur:
+        for relation, compressed in relations:
+            if compressed:
+                cur.execute("SELECT decompress_chunk(%s::regclass, if_compressed => TRUE)", (relation,))
+                conn.commit()
+            cur.execute("SELECT pg_relation_size(%s::regclass) / current_setting('block_size')::int", (relation,))
+            pages = cur.fetchone()[0]
+            # Rows moved by the UPDATE land past `pages` and are already filled
+            for first in range(0, pages, BATCH_PAGES):
+                cur.execute(f"""
+                    UPDATE {relation} SET {sets}
+                    WHERE ctid >= '({first},0)'::tid AND ctid < '({first + BATCH_PAGES},0)'::tid
+                      AND ({pending})
+                """)
+                updated += cur.rowcount
+                conn.commit()
+    return updated
+
+
+def verify(conn, table: str, columns: Dict[str, bool]) -> Tuple[int, float]:
+    """
+    (rows whose shadow differs from the NUMERIC value cast to float8,
+    largest absolute rounding error introduced by the conversion)
+    """
+    mismatch = " OR ".join(f"{col}{SHADOW} IS DISTINCT FROM {col}::float8" for col in columns)
+    error = ", ".join(f"abs({col} - {col}{SHADOW}::numeric)" for col in columns)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FILTER (WHERE {mismatch}), max(GREATEST({error})) FROM {table}")
+        mismatches, max_error = cur.fetchone()
+        # Makes the NOT NULL in swap() a catalog-only change
+        for col, not_null in columns.items():
+            if not_null and not mismatches:
+                cur.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {table}_{col}{SHADOW}_nn")
+    conn.commit()
+    return mismatches, float(max_error or 0)
+
+
+def build_aggregates(conn, columns: Dict[str, bool], aggregates: List[str]) -> Dict[str, str]:
+    """
+    Create and fully refresh a replacement over the shadow columns for each
+    models continuous aggregate; returns live view -> replacement. The live
+    views are not touched, so readers carry on during the refresh.
+    """
+    replacements = {}
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    try:
+        for view in aggregates:
+            match = re.fullmatch(r"ohlc_(\d+)m", view)
+            if not match:
+                print(f"  {view}: not created by models, dropped by the swap; recreate it by hand")
+                continue
+            replacement = f"{view}{SHADOW}"
+            models.create_ohlc_aggregate(conn, match.group(1), name=replacement,
+                                         source={col: f"{col}{SHADOW}" for col in columns})
+            with conn.cursor() as cur:
+                cur.execute("CALL refresh_continuous_aggregate(%s, NULL, NULL)", (replacement,))
+            replacements[view] = replacement
+            print(f"  built and refreshed {replacement}")
+    finally:
+        conn.autocommit = autocommit
+    return replacements
+
+
+def swap(conn, table: str, columns: Dict[str, bool], aggregates: List[str], replacements: Dict[str, str]):
+    """Replace the NUMERIC columns and the aggregates reading them in one short transaction"""
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        for view in aggregates:
+            cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {view}")
+        cur.execute(f"DROP TRIGGER IF EXISTS {table}{SHADOW}_sync ON {table}")
+        cur.execute(f"DROP FUNCTION IF EXISTS {table}{SHADOW}_sync()")
+        cur.execute(f"ALTER TABLE {table} " + ", ".join(f"DROP COLUMN {col}" for col in columns))
+        for col, not_null in columns.items():
+            cur.execute(f"ALTER TABLE {table} RENAME COLUMN {col}{SHADOW} TO {col}")
+            if not_null:
+                cur.execute(f"ALTER TABLE {table} ALTER COLUMN {col} SET NOT NULL")
+                cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_{col}{SHADOW}_nn")
+        for view, replacement in replacements.items():
+            cur.execute(f"ALTER MATERIALIZED VIEW {replacement} RENAME TO {view}")
+            cur.execute(f"ALTER INDEX IF EXISTS idx_{replacement}_symbol_bucket RENAME TO idx_{view}_symbol_bucket")
+    conn.commit()
+
+
+def migrate_table(conn, table: str, dry_run: bool = False) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (table,))
+        if cur.fetchone()[0] is None:
+            return False
+        columns = numeric_columns(cur, table)
+        if not columns:
+            print(f"{table}: already DOUBLE PRECISION")
+            return False
+        timescale = _has_timescale(cur)
+        hypertable = timescale and _is_hypertable(cur, table)
+        relations = _relations(cur, table, hypertable)
+        job = _compression_job(cur, table) if hypertable else None
+        aggregates = _dependent_aggregates(cur, table) if hypertable else []
+        version = _timescale_version(cur) if timescale else None
+        blocked = hypertable and _compression_enabled(cur, table) and version < MIN_TIMESCALE_DROP_COLUMN
+    conn.commit()
+
+    compressed = [relation for relation, is_compressed in relations if is_compressed]
+    print(f"{table}: {', '.join(columns)} ({len(relations)} relations, {len(compressed)} compressed"
+          f"{', aggregates ' + ', '.join(aggregates) if aggregates else ''})")
+    if blocked:
+        print(f"  skipped: TimescaleDB {'.'.join(map(str, version))} cannot drop columns of a compressed "
+              f"hypertable (needs {'.'.join(map(str, MIN_TIMESCALE_DROP_COLUMN))}+)")
+        return False
+    if dry_run:
+        return False
+
+    start = perf_counter()
+    if job is not None:
+        with conn.cursor() as cur:
+            cur.execute("SELECT alter_job(%s, scheduled => FALSE)", (job,))
+        conn.commit()
+    try:
+        prepare(conn, table, columns)
+        updated = backfill(conn, table, columns, relations)
+        mismatches, max_error = verify(conn, table, columns)
+        if mismatches:
+            print(f"  {mismatches} rows do not match after backfill; {table} left unchanged (shadows kept)")
+            return False
+        print(f"  backfilled {updated} rows, verified (max rounding error {max_error:.3g})")
+        replacements = build_aggregates(conn, columns, aggregates)
+        swap(conn, table, columns, aggregates, replacements)
+        with conn.cursor() as cur:
+            for relation in compressed:
+                cur.execute("SELECT compress_chunk(%s::regclass, if_not_compressed => TRUE)", (relation,))
+                conn.commit()
+    finally:
+        conn.rollback()
+        if job is not None:
+            with conn.cursor() as cur:
+                cur.execute("SELECT alter_job(%s, scheduled => TRUE)", (job,))
+            conn.commit()
+    print(f"  {table} converted in {perf_counter() - start:.1f}s")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert NUMERIC price columns to DOUBLE PRECISION online")
+    parser.add_argument('--tables', help="comma-separated tables (default: every models table with prices)")
+    parser.add_argument('--timeframes', default=','.join(models.DEFAULT_TIMEFRAMES))
+    parser.add_argument('--periods', default=','.join(models.DEFAULT_PERIODS))
+    parser.add_argument('--dry-run', action='store_true', help="only list what would be converted")
+    args = parser.parse_args()
+
+    tables = (args.tables.split(',') if args.tables
+              else candidate_tables(args.timeframes.split(','), args.periods.split(',')))
+    conn = db.connect()
+    try:
+        converted = sum(migrate_table(conn, table, args.dry_run) for table in tables)
+    finally:
+        conn.close()
+    print(f"Converted {converted} tables")
+    if converted:
+        print("Create new tables as DOUBLE PRECISION too: models.set_price_type('DOUBLE PRECISION')")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,9 @@ This file contains all CREATE TABLE statements found in datahistory.py
 and the functions folder and its subfolders.
 """
 
+import textwrap
+from itertools import groupby
+
 import psycopg2 
 from typing import Optional
 
@@ -16,6 +19,22 @@ password="2478"
 autocommit=True
 rhost = 'localhost'
 rport = 6379
+
+# Column type for prices and indicator values. NUMERIC is the original
+# schema; DOUBLE PRECISION is smaller on disk, aggregates faster and reads
+# as float instead of Decimal. Existing tables are converted with
+# migrate_float_prices.py.
+PRICE_TYPES = ('NUMERIC', 'DOUBLE PRECISION')
+PRICE_TYPE = 'NUMERIC'
+
+
+def set_price_type(price_type: str):
+    """Choose the price column type used by the create_* functions"""
+    global PRICE_TYPE
+    if price_type not in PRICE_TYPES:
+        raise ValueError(f"price_type must be one of {PRICE_TYPES}, got {price_type!r}")
+    PRICE_TYPE = price_type
+
 # =============================================================================
 # FROM datahistory.py
 # =============================================================================
@@ -23,14 +42,14 @@ rport = 6379
 def create_ohlc_live_long_table(conn):
     """Create main OHLC data table with hypertable partitioning"""
     cur = conn.cursor()
-    cur.execute("""
+    cur.execute(f"""
     CREATE TABLE IF NOT EXISTS ohlc_live_long (
         timestamp TIMESTAMPTZ NOT NULL,
         symbol TEXT NOT NULL,
-        open NUMERIC NOT NULL,
-        high NUMERIC NOT NULL,
-        low NUMERIC NOT NULL,
-        close NUMERIC NOT NULL,
+        open {PRICE_TYPE} NOT NULL,
+        high {PRICE_TYPE} NOT NULL,
+        low {PRICE_TYPE} NOT NULL,
+        close {PRICE_TYPE} NOT NULL,
         volume BIGINT NOT NULL,
         PRIMARY KEY (timestamp, symbol)
     );
@@ -44,6 +63,83 @@ def create_ohlc_live_long_table(conn):
     cur.close()
 
 
+# Bars are aligned to the 09:15 IST session open, not to the UTC epoch
+OHLC_BUCKET_ORIGIN = "2000-01-03 09:15:00+05:30"
+
+
+def ohlc_aggregate_name(tf) -> str:
+    """Continuous aggregate holding {tf}-minute bars"""
+    return f"ohlc_{tf}m"
+
+
+def create_ohlc_aggregate(conn, tf, refresh_lookback: str = '2 days', name: Optional[str] = None,
+                          source: Optional[dict] = None):
+    """
+    Create the {tf}-minute continuous aggregate over ohlc_live_long with a
+    refresh policy. Real-time aggregation stays on, so the still-forming bar
+    is served from raw minutes until the policy materializes it.
+    Needs TimescaleDB >= 2.13 (time_bucket origin in continuous aggregates).
+    name and source (column -> column read instead) build a replacement
+    next to the live view, as migrate_float_prices does.
+    """
+    view = name or ohlc_aggregate_name(tf)
+    col = {c: (source or {}).get(c, c) for c in ('open', 'high', 'low', 'close', 'volume')}
+    # CREATE MATERIALIZED VIEW ... WITH (timescaledb.continuous) cannot run in a transaction
+    autocommit = conn.autocommit
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE MATERIALIZED VIEW IF NOT EXISTS {view}
+                WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS
+                SELECT time_bucket(INTERVAL '{int(tf)} minutes', timestamp,
+                                   origin => TIMESTAMPTZ '{OHLC_BUCKET_ORIGIN}') AS bucket,
+                       symbol,
+                       first({col['open']}, timestamp) AS open,
+                       max({col['high']}) AS high,
+                       min({col['low']}) AS low,
+                       last({col['close']}, timestamp) AS close,
+                       sum({col['volume']}) AS volume
+                FROM ohlc_live_long
+                GROUP BY bucket, symbol
+                WITH NO DATA;
+            """)
+            cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{view}_symbol_bucket ON {view} (symbol, bucket DESC);")
+            cur.execute(f"""
+                SELECT add_continuous_aggregate_policy('{view}',
+                    start_offset => INTERVAL '{refresh_lookback}',
+                    end_offset => INTERVAL '{int(tf)} minutes',
+                    schedule_interval => INTERVAL '{min(int(tf), 15)} minutes',
+                    if_not_exists => TRUE);
+            """)
+    finally:
+        conn.autocommit = autocommit
+
+
+# =============================================================================
+# FROM page1_final.py
+# =============================================================================
+
+def create_movers_table(conn):
+    """Create the movers table if it doesn't exist"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS movers (
+                timestamp TIMESTAMPTZ NOT NULL,
+                symbol TEXT NOT NULL,
+                pullers INTEGER NOT NULL DEFAULT 0,
+                draggers INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (timestamp, symbol)
+            );
+            
+            -- Create index for efficient querying
+            CREATE INDEX IF NOT EXISTS idx_movers_timestamp ON movers(timestamp);
+            CREATE INDEX IF NOT EXISTS idx_movers_symbol ON movers(symbol);
+        """)
+    conn.commit()
+
+
 # =============================================================================
 # FROM app/functions/vwap_crossing.py
 # =============================================================================
@@ -55,10 +151,10 @@ def create_vwap_cross_events_table(conn, tf: str, period: str):
         CREATE TABLE IF NOT EXISTS {period}_vwap_cross_events_{tf} (
             timestamp TIMESTAMPTZ NOT NULL,
             symbol TEXT NOT NULL,
-            open NUMERIC NOT NULL,
-            high NUMERIC NOT NULL,
-            low NUMERIC NOT NULL,
-            close NUMERIC NOT NULL,
+            open {PRICE_TYPE} NOT NULL,
+            high {PRICE_TYPE} NOT NULL,
+            low {PRICE_TYPE} NOT NULL,
+            close {PRICE_TYPE} NOT NULL,
             vwap DOUBLE PRECISION NOT NULL,
             crossed_above BOOLEAN NOT NULL,
             crossed_below BOOLEAN NOT NULL,
@@ -73,6 +169,11 @@ def create_vwap_cross_events_table(conn, tf: str, period: str):
 # FROM app/functions/vwap_camrilla_peridioc_history_store.py
 # =============================================================================
 
+# Period column of the weekly/monthly level tables: ISO week ('2024-W07')
+# or month ('2024-02'), as Postgres to_char() formats; keys sort in time order
+PERIOD_KEY_FORMATS = {'weekly': 'IYYY-"W"IW', 'monthly': 'YYYY-MM'}
+
+
 def create_vwap_camarilla_periodic_tables(conn, period: str):
     """
     Create VWAP and Camarilla tables for periodic data (weekly/monthly)
@@ -155,14 +256,14 @@ def create_camarilla_table(conn):
 def create_unusual_volume_events_table(conn):
     """Create table to store unusual volume events"""
     with conn.cursor() as cur:
-        cur.execute("""
+        cur.execute(f"""
             CREATE TABLE IF NOT EXISTS unusual_volume_events (
                 timestamp TIMESTAMPTZ NOT NULL,
                 symbol TEXT NOT NULL,
-                open NUMERIC NOT NULL,
-                high NUMERIC NOT NULL,
-                low NUMERIC NOT NULL,
-                close NUMERIC NOT NULL,
+                open {PRICE_TYPE} NOT NULL,
+                high {PRICE_TYPE} NOT NULL,
+                low {PRICE_TYPE} NOT NULL,
+                close {PRICE_TYPE} NOT NULL,
                 volume BIGINT NOT NULL,
                 value_traded BIGINT NOT NULL,  -- close * volume
                 threshold_value BIGINT NOT NULL,  -- 16 crores
@@ -189,8 +290,8 @@ def create_prevnday_hilo_table(conn, days: int = 7):
             CREATE TABLE IF NOT EXISTS prev{days}day_hilo (
                 date DATE NOT NULL,
                 symbol TEXT NOT NULL,
-                high NUMERIC,
-                low NUMERIC,
+                high {PRICE_TYPE},
+                low {PRICE_TYPE},
                 PRIMARY KEY (date, symbol)
             );
         """)
@@ -207,14 +308,16 @@ def create_breakout_events_table(conn, days: int = 7):
                 event_time  TIMESTAMPTZ NOT NULL,
                 event_type  TEXT NOT NULL, -- 'HIGH' or 'LOW'
                 candle_time TIMESTAMPTZ NOT NULL,
-                candle_high NUMERIC NOT NULL,
-                candle_low  NUMERIC NOT NULL,
-                candle_close NUMERIC NOT NULL,
-                prev{days}d_high NUMERIC NOT NULL,
-                prev{days}d_low  NUMERIC NOT NULL,
+                candle_high {PRICE_TYPE} NOT NULL,
+                candle_low  {PRICE_TYPE} NOT NULL,
+                candle_close {PRICE_TYPE} NOT NULL,
+                prev{days}d_high {PRICE_TYPE} NOT NULL,
+                prev{days}d_low  {PRICE_TYPE} NOT NULL,
                 PRIMARY KEY (date, symbol)
             );
         """)
+        # page2 reads today's breakouts by event_time range
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_breakout_events{days}_event_time ON breakout_events{days} (event_time DESC);")
     conn.commit()
 
 
@@ -229,10 +332,10 @@ def create_camarilla_cross_events_table(conn, tf: str, period: str):
         CREATE TABLE IF NOT EXISTS {period}_camarilla_cross_events_{tf} (
             timestamp TIMESTAMPTZ NOT NULL,
             symbol TEXT NOT NULL,
-            open NUMERIC NOT NULL,
-            high NUMERIC NOT NULL,
-            low NUMERIC NOT NULL,
-            close NUMERIC NOT NULL,
+            open {PRICE_TYPE} NOT NULL,
+            high {PRICE_TYPE} NOT NULL,
+            low {PRICE_TYPE} NOT NULL,
+            close {PRICE_TYPE} NOT NULL,
             h4 DOUBLE PRECISION,
             h5 DOUBLE PRECISION,
             l4 DOUBLE PRECISION,
@@ -257,7 +360,7 @@ def create_yellow_table(conn, tf: str):
             CREATE TABLE IF NOT EXISTS yellow_{tf}_new (
                 timestamp TIMESTAMPTZ NOT NULL,
                 symbol TEXT NOT NULL,
-                yellow NUMERIC NOT NULL,
+                yellow {PRICE_TYPE} NOT NULL,
                 PRIMARY KEY (timestamp, symbol)
             );
         """)
@@ -280,39 +383,42 @@ def create_signals_table(conn, tf: str):
             symbol TEXT NOT NULL,
             generation_time TIMESTAMPTZ NOT NULL,
             type TEXT NOT NULL CHECK (type IN ('BUY', 'SELL')),
-            entry NUMERIC NOT NULL,
-            sl NUMERIC NOT NULL,
-            tsl NUMERIC NOT NULL,
-            t1 NUMERIC NOT NULL,
-            t2 NUMERIC NOT NULL,
-            t3 NUMERIC NOT NULL,
+            entry {PRICE_TYPE} NOT NULL,
+            sl {PRICE_TYPE} NOT NULL,
+            tsl {PRICE_TYPE} NOT NULL,
+            t1 {PRICE_TYPE} NOT NULL,
+            t2 {PRICE_TYPE} NOT NULL,
+            t3 {PRICE_TYPE} NOT NULL,
             t1_hit BOOLEAN DEFAULT FALSE,
             t2_hit BOOLEAN DEFAULT FALSE,
             t3_hit BOOLEAN DEFAULT FALSE,
             t1_hit_time TIMESTAMPTZ,
             t2_hit_time TIMESTAMPTZ,
             t3_hit_time TIMESTAMPTZ,
-            highest_price NUMERIC,
-            lowest_price NUMERIC,
+            highest_price {PRICE_TYPE},
+            lowest_price {PRICE_TYPE},
             last_tsl_update TIMESTAMPTZ,
-            tsl_at_closing NUMERIC,
+            tsl_at_closing {PRICE_TYPE},
             closing_time TIMESTAMPTZ,
             closing_reason TEXT,
             status TEXT NOT NULL DEFAULT 'ACTIVE' CHECK (status IN ('ACTIVE', 'CLOSED')),
-            yellow_at_generation NUMERIC,
-            prev_yellow_at_generation NUMERIC,
-            dema_at_generation NUMERIC,
-            fib_61_at_generation NUMERIC,
-            fib_38_at_generation NUMERIC,
-            bb_upper_at_generation NUMERIC,
-            bb_lower_at_generation NUMERIC,
-            trendline_at_generation NUMERIC,
-            close_price_at_generation NUMERIC,
+            yellow_at_generation {PRICE_TYPE},
+            prev_yellow_at_generation {PRICE_TYPE},
+            dema_at_generation {PRICE_TYPE},
+            fib_61_at_generation {PRICE_TYPE},
+            fib_38_at_generation {PRICE_TYPE},
+            bb_upper_at_generation {PRICE_TYPE},
+            bb_lower_at_generation {PRICE_TYPE},
+            trendline_at_generation {PRICE_TYPE},
+            close_price_at_generation {PRICE_TYPE},
             UNIQUE(symbol, generation_time, type)
         );
         
         CREATE INDEX IF NOT EXISTS idx_signals_{tf}_symbol_time ON signals_{tf}_new (symbol, generation_time DESC);
         CREATE INDEX IF NOT EXISTS idx_signals_{tf}_status ON signals_{tf}_new (status);
+        -- Most rows are CLOSED; these stay as small as the set of open positions
+        CREATE INDEX IF NOT EXISTS idx_signals_{tf}_active ON signals_{tf}_new (symbol, generation_time DESC) WHERE status = 'ACTIVE';
+        CREATE INDEX IF NOT EXISTS idx_signals_{tf}_active_id ON signals_{tf}_new (id) WHERE status = 'ACTIVE';
     """)
     conn.commit()
     cur.close()
@@ -329,8 +435,8 @@ def create_fibonacci_table(conn, tf: str):
         CREATE TABLE IF NOT EXISTS fibonacci_{tf}_new (
             timestamp TIMESTAMPTZ NOT NULL,
             symbol TEXT NOT NULL,
-            fib_61 NUMERIC NOT NULL,
-            fib_38 NUMERIC NOT NULL,
+            fib_61 {PRICE_TYPE} NOT NULL,
+            fib_38 {PRICE_TYPE} NOT NULL,
             PRIMARY KEY (timestamp, symbol)
         );
     """)
@@ -349,7 +455,7 @@ def create_dema_table(conn, tf: int):
             CREATE TABLE IF NOT EXISTS dema_talib_{tf}_new (
                 timestamp TIMESTAMPTZ NOT NULL,
                 symbol TEXT NOT NULL,
-                dema NUMERIC NOT NULL,
+                dema {PRICE_TYPE} NOT NULL,
                 PRIMARY KEY (timestamp, symbol)
             );
         """)
@@ -367,10 +473,10 @@ def create_bb_atr_table(conn, tf: str):
             CREATE TABLE IF NOT EXISTS bb_atr_{tf}_new (
                 timestamp TIMESTAMPTZ NOT NULL,
                 symbol TEXT NOT NULL,
-                bb_upper NUMERIC NOT NULL,
-                bb_lower NUMERIC NOT NULL,
+                bb_upper {PRICE_TYPE} NOT NULL,
+                bb_lower {PRICE_TYPE} NOT NULL,
                 bb_signal INT NOT NULL,
-                trendline NUMERIC NOT NULL,
+                trendline {PRICE_TYPE} NOT NULL,
                 trend INT NOT NULL,
                 PRIMARY KEY (timestamp, symbol)
             );
@@ -379,33 +485,181 @@ def create_bb_atr_table(conn, tf: str):
 
 
 # =============================================================================
-# HELPER FUNCTIONS
+# FROM indicator_engine.py
+# =============================================================================
+
+def create_indicator_state_table(conn):
+    """Create the streaming indicator checkpoint table (one state blob per timeframe)"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS indicator_state (
+                tf         INT PRIMARY KEY,
+                state      BYTEA NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+        """)
+    conn.commit()
+
+
 # =============================================================================
+# HYPERTABLES, COMPRESSION AND RETENTION
+# =============================================================================
+
+# Chunks older than this are compressed (segmented by symbol)
+COMPRESS_AFTER = '7 days'
 
-def create_all_tables(conn, timeframes: list = ['5', '15', '30', '60'], periods: list = ['daily', 'weekly', 'monthly']):
+# Table family -> how long to keep rows (None keeps everything).
+# Families: 'events' (volume/vwap/camarilla cross events), 'indicators'
+# (yellow/dema/bb_atr/fibonacci) and 'movers'.
+RETENTION = {
+    'events': None,
+    'indicators': None,
+    'movers': None,
+}
+
+
+def indicator_chunk_interval(tf) -> str:
+    """About the same number of rows per chunk whatever the timeframe"""
+    return '1 day' if int(tf) <= 5 else '7 days'
+
+
+def make_hypertable(conn, table: str, chunk_interval: str, compress_after: Optional[str] = COMPRESS_AFTER,
+                    retention: Optional[str] = None, time_column: str = 'timestamp'):
     """
-    Create all tables for the StockPro application
-    
-    Args:
-        conn: Database connection
-        timeframes: List of timeframes (e.g., ['5', '15', '30', '60'])
-        periods: List of periods (e.g., ['daily', 'weekly', 'monthly'])
+    Convert table to a hypertable on time_column (existing rows are migrated
+    into chunks) and add compression / retention policies. Safe to re-run.
     """
-    # Core tables
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT create_hypertable('{table}', '{time_column}', chunk_time_interval => INTERVAL '{chunk_interval}', "
+            f"if_not_exists => TRUE, migrate_data => TRUE);"
+        )
+        if compress_after:
+            # Compression settings cannot be changed once chunks are compressed
+            cur.execute(f"""
+                DO $$
+                BEGIN
+                    IF NOT (SELECT compression_enabled FROM timescaledb_information.hypertables
+                            WHERE hypertable_name = '{table}') THEN
+                        ALTER TABLE {table} SET (
+                            timescaledb.compress,
+                            timescaledb.compress_segmentby = 'symbol',
+                            timescaledb.compress_orderby = '{time_column} DESC'
+                        );
+                    END IF;
+                END $$;
+            """)
+            cur.execute(f"SELECT add_compression_policy('{table}', INTERVAL '{compress_after}', if_not_exists => TRUE);")
+    set_retention_policy(conn, table, retention)
+
+
+def set_retention_policy(conn, table: str, retention: Optional[str]):
+    """Replace table's retention policy (None removes it)"""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT remove_retention_policy('{table}', if_exists => TRUE);")
+        if retention:
+            cur.execute(f"SELECT add_retention_policy('{table}', INTERVAL '{retention}');")
+    conn.commit()
+
+
+def hypertable_families(timeframes: list, periods: list) -> list:
+    """(table, RETENTION family, chunk interval) for every table made a hypertable"""
+    tables = [('unusual_volume_events', 'events', '7 days'), ('movers', 'movers', '30 days')]
+    for tf in timeframes:
+        for table in (f"yellow_{tf}_new", f"fibonacci_{tf}_new", f"dema_talib_{tf}_new", f"bb_atr_{tf}_new"):
+            tables.append((table, 'indicators', indicator_chunk_interval(tf)))
+        for period in periods:
+            for table in (f"{period}_vwap_cross_events_{tf}", f"{period}_camarilla_cross_events_{tf}"):
+                tables.append((table, 'events', '7 days'))
+    return tables
+
+
+# =============================================================================
+# SCHEMA MIGRATIONS
+# =============================================================================
+#
+# The applied version is kept in schema_migrations. Pending migrations run
+# in order; consecutive transactional ones share a single transaction, the
+# others (continuous aggregates cannot be created inside a transaction)
+# run on their own. Every statement is idempotent, so a database created
+# before the registry existed is brought under it by replaying from v1.
+# Migrations create the tables of the timeframes and periods they run with;
+# create_all_tables adds the missing ones for timeframes or periods asked
+# for later, without bumping the version.
+
+SCHEMA_LOCK_ID = 4720101  # pg_advisory_lock key serialising concurrent migrators
+
+# Every timeframe page3_final.SIGNAL_TIMEFRAMES reads signals for
+DEFAULT_TIMEFRAMES = ['5', '15', '30', '60', '240', '1440']
+DEFAULT_PERIODS = ['daily', 'weekly', 'monthly']
+
+
+class Migration:
+    def __init__(self, version: int, description: str, apply, transactional: bool = True):
+        self.version = version
+        self.description = description
+        # apply(conn, timeframes, periods, retention)
+        self.apply = apply
+        self.transactional = transactional
+
+
+class _InTransaction:
+    """Connection stand-in whose commit() is deferred to the migration runner"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def commit(self):
+        pass
+
+
+class _Recorder:
+    """Connection stand-in collecting the statements create_* functions would run"""
+
+    autocommit = False
+
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        sql = textwrap.dedent(sql).strip()
+        self.statements.append(sql if sql.endswith(';') else sql + ';')
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def _base_tables(conn, timeframes, periods, retention):
     create_ohlc_live_long_table(conn)
     create_unusual_volume_events_table(conn)
+    create_movers_table(conn)
     create_vwap_table(conn)
     create_camarilla_table(conn)
-    
+
     # Period-specific tables
     for period in periods:
         if period in ['weekly', 'monthly']:
             create_vwap_camarilla_periodic_tables(conn, period)
-    
+
     # N-day high/low tables (commonly used with 7 days)
     create_prevnday_hilo_table(conn, 7)
     create_breakout_events_table(conn, 7)
-    
+
     # Timeframe-specific tables
     for tf in timeframes:
         # Technical indicator tables
@@ -414,41 +668,252 @@ def create_all_tables(conn, timeframes: list = ['5', '15', '30', '60'], periods:
         create_dema_table(conn, int(tf))
         create_bb_atr_table(conn, tf)
         create_signals_table(conn, tf)
-        
+
         # Crossing event tables
         for period in periods:
             create_vwap_cross_events_table(conn, tf, period)
             create_camarilla_cross_events_table(conn, tf, period)
-    
-    print("All tables created successfully!")
 
 
-def get_table_creation_sql() -> str:
+def _hypertables(conn, timeframes, periods, retention):
+    for table, family, chunk_interval in hypertable_families(timeframes, periods):
+        make_hypertable(conn, table, chunk_interval, retention=retention[family])
+
+
+def _ohlc_aggregates(conn, timeframes, periods, retention):
+    # Resampled bars, read through bars.fetch_bars
+    for tf in timeframes:
+        create_ohlc_aggregate(conn, tf)
+
+
+def _indicator_state(conn, timeframes, periods, retention):
+    create_indicator_state_table(conn)
+
+
+MIGRATIONS = [
+    Migration(1, "base tables and indexes", _base_tables),
+    Migration(2, "hypertables, compression and retention", _hypertables),
+    Migration(3, "multi-timeframe OHLC continuous aggregates", _ohlc_aggregates, transactional=False),
+    Migration(4, "streaming indicator checkpoints", _indicator_state),
+]
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+CREATE_SCHEMA_MIGRATIONS = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version     INT PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at  TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+"""
+
+_schema_current = False
+
+
+def schema_version(conn) -> int:
+    """Highest applied migration (0 on a database the registry has not touched)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cur.fetchone()[0]
+
+
+def _record(cur, migration: Migration):
+    cur.execute(
+        "INSERT INTO schema_migrations (version, description) VALUES (%s, %s) ON CONFLICT (version) DO NOTHING",
+        (migration.version, migration.description),
+    )
+
+
+def migrate(conn, timeframes: list = DEFAULT_TIMEFRAMES, periods: list = DEFAULT_PERIODS,
+            retention: Optional[dict] = None) -> int:
+    """Apply every pending migration; returns the resulting schema version"""
+    retention = {**RETENTION, **(retention or {})}
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_ID,))
+        cur.execute(CREATE_SCHEMA_MIGRATIONS)
+    conn.commit()
+    try:
+        current = schema_version(conn)
+        pending = [m for m in MIGRATIONS if m.version > current]
+        for transactional, group in groupby(pending, key=lambda m: m.transactional):
+            group = list(group)
+            if transactional:
+                try:
+                    for migration in group:
+                        migration.apply(_InTransaction(conn), timeframes, periods, retention)
+                        with conn.cursor() as cur:
+                            _record(cur, migration)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            else:
+                for migration in group:
+                    try:
+                        migration.apply(conn, timeframes, periods, retention)
+                        with conn.cursor() as cur:
+                            _record(cur, migration)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+            for migration in group:
+                print(f"Applied schema migration {migration.version}: {migration.description}")
+        return max([current] + [m.version for m in pending])
+    finally:
+        # A failed migration leaves the transaction aborted; without the
+        # rollback the unlock itself fails, masking the real error and
+        # leaving the session lock held on a pooled connection
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_ID,))
+        conn.commit()
+
+
+def ensure_schema(conn):
+    """
+    Per-cycle schema check: once the database is known to be at
+    SCHEMA_VERSION this is free; until then it is one version lookup,
+    applying pending migrations if the database is behind.
+    """
+    global _schema_current
+    if _schema_current:
+        return
+    if schema_version(conn) < SCHEMA_VERSION:
+        migrate(conn)
+    _schema_current = True
+
+
+def set_retention_policies(conn, retention: dict, timeframes: list = DEFAULT_TIMEFRAMES,
+                           periods: list = DEFAULT_PERIODS):
+    """Re-apply RETENTION (with overrides) to an already migrated database"""
+    retention = {**RETENTION, **retention}
+    for table, family, _chunk_interval in hypertable_families(timeframes, periods):
+        set_retention_policy(conn, table, retention[family])
+
+
+def _missing_relations(conn, names: list) -> set:
+    """Those of names (tables or views) that do not exist yet"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT n FROM unnest(%s::text[]) AS n WHERE to_regclass(n) IS NULL", (list(names),))
+        return {row[0] for row in cur.fetchall()}
+
+
+def add_missing_tables(conn, timeframes: list = DEFAULT_TIMEFRAMES, periods: list = DEFAULT_PERIODS,
+                       retention: Optional[dict] = None, applied: int = SCHEMA_VERSION) -> int:
+    """
+    Create the per-timeframe / per-period tables of the migrations up to
+    version applied that are missing for timeframes and periods (a migration
+    only creates those it ran with). Existing tables and their retention
+    policies are left alone. Returns how many relations were created.
+    """
+    retention = {**RETENTION, **(retention or {})}
+    families = hypertable_families(timeframes, periods)
+    views = {ohlc_aggregate_name(tf): tf for tf in timeframes}
+    names = [f"signals_{tf}_new" for tf in timeframes] + [table for table, _f, _c in families] + list(views)
+    missing = _missing_relations(conn, names)
+    if not missing:
+        return 0
+    try:
+        # Every CREATE is IF NOT EXISTS, so replaying the base tables only adds the missing ones
+        _base_tables(_InTransaction(conn), timeframes, periods, retention)
+        if applied >= 2:
+            for table, family, chunk_interval in families:
+                if table in missing:
+                    make_hypertable(_InTransaction(conn), table, chunk_interval, retention=retention[family])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if applied >= 3:
+        for view, tf in views.items():
+            if view in missing:
+                create_ohlc_aggregate(conn, tf)
+    print(f"Created {len(missing)} missing tables/views: {', '.join(sorted(missing))}")
+    return len(missing)
+
+
+# =============================================================================
+# HELPER FUNCTIONS
+# =============================================================================
+
+def create_all_tables(conn, timeframes: list = DEFAULT_TIMEFRAMES, periods: list = DEFAULT_PERIODS,
+                      retention: Optional[dict] = None, price_type: Optional[str] = None):
+    """
+    Create all tables for the StockPro application by applying the pending
+    schema migrations, then adding the tables already applied migrations
+    did not create for timeframes / periods (one existence check when
+    nothing is missing)
+    
+    Args:
+        conn: Database connection
+        timeframes: List of timeframes (e.g., ['5', '15', '30', '60', '240', '1440'])
+        periods: List of periods (e.g., ['daily', 'weekly', 'monthly'])
+        retention: Overrides for RETENTION (e.g., {'events': '90 days'}),
+            re-applied even when the schema is already current
+        price_type: 'NUMERIC' or 'DOUBLE PRECISION' for new tables (default PRICE_TYPE)
+    """
+    if price_type:
+        set_price_type(price_type)
+    before = schema_version(conn)
+    version = migrate(conn, timeframes, periods, retention)
+    if before:
+        add_missing_tables(conn, timeframes, periods, retention, applied=before)
+    if retention and before >= 2:
+        set_retention_policies(conn, retention, timeframes, periods)
+    print(f"All tables created successfully! (schema version {version})")
+
+
+def get_table_creation_sql(timeframes: list = DEFAULT_TIMEFRAMES, periods: list = DEFAULT_PERIODS,
+                           retention: Optional[dict] = None) -> str:
     """
     Returns SQL script with all table creation statements
     Can be used for database migrations or documentation
     """
-    sql_statements = []
-    
-    # Add each CREATE TABLE statement as a string
-    # This is useful for generating migration scripts
+    retention = {**RETENTION, **(retention or {})}
+    sql_statements = [textwrap.dedent(CREATE_SCHEMA_MIGRATIONS).strip()]
+    for migration in MIGRATIONS:
+        recorder = _Recorder()
+        migration.apply(recorder, timeframes, periods, retention)
+        header = f"-- Migration {migration.version}: {migration.description}"
+        if migration.transactional:
+            body = ["BEGIN;"] + recorder.statements
+        else:
+            header += "\n-- (not transactional: run each statement on its own)"
+            body = recorder.statements
+        body.append(
+            f"INSERT INTO schema_migrations (version, description) "
+            f"VALUES ({migration.version}, '{migration.description}') ON CONFLICT (version) DO NOTHING;"
+        )
+        if migration.transactional:
+            body.append("COMMIT;")
+        sql_statements.append(header + "\n\n" + "\n\n".join(body))
     
     return "\n\n".join(sql_statements)
 
 
 if __name__ == "__main__":
-    # Example usage
-    from app.config.settings import host, dbname, user, password
-    
-    conn = psycopg2.connect(
-        host=host,
-        dbname=dbname,
-        user=user,
-        password=password
-    )
-    
-    # Create all tables with default timeframes and periods
-    create_all_tables(conn)
-    
-    conn.close()
-    print("Database models setup completed!")
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply the StockPro schema migrations")
+    parser.add_argument('--sql', action='store_true', help="print the full schema script instead of applying it")
+    args = parser.parse_args()
+    if args.sql:
+        print(get_table_creation_sql())
+    else:
+        from app.config.settings import host, dbname, user, password
+
+        conn = psycopg2.connect(
+            host=host,
+            dbname=dbname,
+            user=user,
+            password=password
+        )
+
+        # Create all tables with default timeframes and periods
+        create_all_tables(conn)
+
+        conn.close()
+        print("Database models setup completed!")
@@ -0,0 +1,222 @@
+"""
+Concurrent Index Movers Fetch
+=============================
+
+Fans the NSE/BSE puller/dragger requests out on a thread pool so a tick
+takes as long as the slowest exchange endpoint rather than the sum of all
+of them. Every source has its own deadline; a source that misses it (or
+raises) falls back to its last good snapshot.
+
+Every worker thread keeps its own keep-alive session, so connections are
+reused across ticks without threads sharing headers or cookies. Fetchers
+that take a `session` argument get the worker's session passed. For the
+others (the app.functions helpers) the `requests` name in their module is
+pointed at a stand-in: while a movers worker runs a source, module-level
+calls and new Sessions go through that worker's session; every other
+caller gets the real module. A snapshot older than MAX_SNAPSHOT_AGE is not
+served; the index is left out instead.
+"""
+
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+from time import monotonic
+from typing import Callable, Dict, Optional, Set, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.functions.bsedat import get_sensex_pullers_draggers
+from app.functions.nsedat import get_pullers_draggers
+
+# index name -> (fetch function, kwargs, timeout in seconds)
+MOVER_SOURCES: Dict[str, Tuple[Callable, dict, float]] = {
+    'sensex': (get_sensex_pullers_draggers, {'index_code': '16'}, 8.0),
+    'bankex': (get_sensex_pullers_draggers, {'index_code': '53'}, 8.0),
+    'nifty50': (get_pullers_draggers, {'index_name': 'NIFTY 50'}, 8.0),
+    'banknifty': (get_pullers_draggers, {'index_name': 'NIFTY BANK'}, 8.0),
+    'niftymidcap': (get_pullers_draggers, {'index_name': 'NIFTY MIDCAP SELECT'}, 8.0),
+}
+
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+}
+
+# Older snapshots are dropped rather than served as stale
+MAX_SNAPSHOT_AGE = timedelta(minutes=5)
+
+_local = threading.local()
+_patch_lock = threading.Lock()
+
+# Twice the number of sources so a hung request from the previous tick
+# cannot starve the next one of workers
+_executor = ThreadPoolExecutor(max_workers=2 * len(MOVER_SOURCES), thread_name_prefix='movers')
+_inflight = {}
+_last_good: Dict[str, Tuple[dict, datetime]] = {}
+
+
+def get_http_session() -> requests.Session:
+    """The calling thread's keep-alive session, created on first use"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=2)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(HTTP_HEADERS)
+        _local.session = session
+    return session
+
+
+class _SharedSession:
+    """The worker's session as a fetcher-created Session: closing it is a no-op"""
+
+    def __init__(self, session: requests.Session):
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+
+def _worker_session() -> Optional[requests.Session]:
+    """The session to divert to: only inside a movers worker running a source"""
+    return get_http_session() if getattr(_local, 'active', False) else None
+
+
+class _SharedRequests:
+    """
+    Stand-in for the requests module. Inside a movers worker, get/post/...
+    and Session() go through the worker's session; anywhere else they are
+    the module's own. Everything else (exceptions, adapters) is the module.
+    """
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+    def request(self, method, url, **kwargs):
+        session = _worker_session()
+        return (session or requests).request(method, url, **kwargs)
+
+    def get(self, url, params=None, **kwargs):
+        session = _worker_session()
+        return (session or requests).get(url, params=params, **kwargs)
+
+    def post(self, url, data=None, json=None, **kwargs):
+        session = _worker_session()
+        return (session or requests).post(url, data=data, json=json, **kwargs)
+
+    def head(self, url, **kwargs):
+        session = _worker_session()
+        return (session or requests).head(url, **kwargs)
+
+    def Session(self):
+        session = _worker_session()
+        return _SharedSession(session) if session is not None else requests.Session()
+
+    session = Session
+
+
+_shared_requests = _SharedRequests()
+
+
+def _accepts_session(func: Callable) -> bool:
+    try:
+        return 'session' in inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def share_session(func: Callable):
+    """Let movers workers route the requests calls of func's module through their sessions"""
+    module = inspect.getmodule(func)
+    if module is not None and getattr(module, 'requests', None) is requests:
+        with _patch_lock:
+            module.requests = _shared_requests
+
+
+def _call_source(func: Callable, kwargs: dict):
+    """Run one source on a worker thread with that worker's session"""
+    session = get_http_session()
+    if _accepts_session(func):
+        return func(session=session, **kwargs)
+    share_session(func)
+    _local.active = True
+    try:
+        return func(**kwargs)
+    finally:
+        _local.active = False
+
+
+def snapshot_time(name: str) -> Optional[datetime]:
+    """When the data currently served for an index was fetched"""
+    snapshot = _last_good.get(name)
+    return snapshot[1] if snapshot else None
+
+
+def fetch_all_movers(sources: Optional[Dict[str, Tuple[Callable, dict, float]]] = None) -> Tuple[Dict[str, dict], Set[str]]:
+    """
+    Fetch every index's pullers/draggers concurrently.
+
+    Returns:
+        (data by index name, names of indices served from the last good snapshot)
+        Indices that failed and have no snapshot younger than
+        MAX_SNAPSHOT_AGE are left out.
+    """
+    sources = sources or MOVER_SOURCES
+    start = monotonic()
+
+    futures = {}
+    for name, (func, kwargs, _timeout) in sources.items():
+        previous = _inflight.get(name)
+        if previous is not None and not previous.done():
+            # Last tick's request is still hanging; don't pile another on it
+            futures[name] = previous
+            continue
+        future = _executor.submit(_call_source, func, kwargs)
+        _inflight[name] = future
+        futures[name] = future
+
+    results = {}
+    stale = set()
+    # Collect in deadline order so every wait is bounded by its own timeout
+    for name in sorted(sources, key=lambda n: sources[n][2]):
+        remaining = max(0.0, start + sources[name][2] - monotonic())
+        try:
+            data = futures[name].result(timeout=remaining)
+            if data:
+                _last_good[name] = (data, datetime.now())
+                results[name] = data
+                continue
+            reason = 'empty response'
+        except FutureTimeout:
+            reason = f'timed out after {sources[name][2]:.1f}s'
+        except Exception as e:
+            reason = f'error: {e}'
+
+        snapshot = _last_good.get(name)
+        if snapshot is not None and datetime.now() - snapshot[1] > MAX_SNAPSHOT_AGE:
+            del _last_good[name]
+            print(f"{name}: {reason}, snapshot from {snapshot[1]:%H:%M:%S} too old, dropped")
+        elif snapshot is not None:
+            data, fetched_at = snapshot
+            results[name] = data
+            stale.add(name)
+            print(f"{name}: {reason}, using snapshot from {fetched_at:%H:%M:%S}")
+        else:
+            print(f"{name}: {reason}, no previous snapshot")
+
+    print(f"Fetched movers for {len(results)}/{len(sources)} indices in {monotonic() - start:.2f}s")
+    return results, stale
@@ -0,0 +1,321 @@
+"""
+Bulk OHLC Loader
+================
+
+Backfills minute candles into ohlc_live_long through binary COPY instead of
+row-wise INSERTs. Rows are read in batches of BATCH_ROWS (CSV, Parquet or
+in-memory arrays), copied into an unlogged per-worker staging table and
+merged with INSERT ... ON CONFLICT (timestamp, symbol), one transaction per
+batch, so memory stays bounded whatever the size of the input. Date ranges
+or files can be loaded by parallel worker processes.
+
+Input columns: timestamp, symbol, open, high, low, close, volume.
+Naive timestamps are taken as IST.
+
+    python ohlc_loader.py candles_2024-*.csv --workers 4
+    python ohlc_loader.py history.parquet --start 2024-01-01 --end 2024-07-01 --workers 6
+    python ohlc_loader.py eod.csv --today          # end-of-day catch-up
+"""
+
+import argparse
+import csv
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta, timezone
+from io import BytesIO
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import db
+from metrics import stage
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow.dataset as pa_dataset
+except ImportError:
+    pa_dataset = None
+
+IST = timezone(timedelta(hours=5, minutes=30))
+BATCH_ROWS = 200_000
+COLUMNS = ('timestamp', 'symbol', 'open', 'high', 'low', 'close', 'volume')
+
+# Postgres binary COPY framing
+_PG_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+_PG_EPOCH_S = 946_684_800  # 2000-01-01 in Unix seconds
+_PG_EPOCH_US = _PG_EPOCH_S * 1_000_000
+_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+_TRAILER = struct.pack('>h', -1)
+_ROW_HEAD = struct.Struct('>hiq')  # field count, timestamp length, timestamp
+_ROW_TAIL = struct.Struct('>' + 'id' * 4 + 'iq')  # open..close, volume
+
+# (micros since 2000-01-01 UTC, symbols, open, high, low, close, volume)
+Batch = Tuple[Sequence[int], Sequence[str], Sequence[float], Sequence[float],
+              Sequence[float], Sequence[float], Sequence[int]]
+
+
+def _pg_micros(ts: datetime) -> int:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=IST)
+    return (ts - _PG_EPOCH) // timedelta(microseconds=1)
+
+
+def _in_range(ts: datetime, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    return (start is None or ts >= start) and (end is None or ts < end)
+
+
+# =============================================================================
+# SOURCES
+# =============================================================================
+
+def iter_csv(path: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             batch_rows: int = BATCH_ROWS) -> Iterator[Batch]:
+    """Stream a CSV with a header row (COLUMNS, any order) in batches"""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        rows = []
+        for record in reader:
+            ts = datetime.fromisoformat(record['timestamp'])
+            if ts.tzinfo is None:
+                ts = ts.replace(tzinfo=IST)
+            if not _in_range(ts, start, end):
+                continue
+            rows.append((_pg_micros(ts), record['symbol'], float(record['open']), float(record['high']),
+                         float(record['low']), float(record['close']), int(float(record['volume']))))
+            if len(rows) >= batch_rows:
+                yield tuple(zip(*rows))
+                rows = []
+        if rows:
+            yield tuple(zip(*rows))
+
+
+def iter_parquet(path: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 batch_rows: int = BATCH_ROWS) -> Iterator[Batch]:
+    """Stream a Parquet file or dataset directory; the date range is pushed down as a filter"""
+    if pa_dataset is None or np is None:
+        raise RuntimeError("Parquet input needs pyarrow and numpy")
+    dataset = pa_dataset.dataset(path, format='parquet')
+    expression = None
+    for bound, op in ((start, '__ge__'), (end, '__lt__')):
+        if bound is not None:
+            condition = getattr(pa_dataset.field('timestamp'), op)(bound)
+            expression = condition if expression is None else expression & condition
+    # tz-aware Parquet timestamps come out of to_numpy() as UTC
+    utc = getattr(dataset.schema.field('timestamp').type, 'tz', None) is not None
+    for record_batch in dataset.to_batches(columns=list(COLUMNS), filter=expression, batch_size=batch_rows):
+        if record_batch.num_rows == 0:
+            continue
+        columns = {name: record_batch.column(name).to_numpy(zero_copy_only=False) for name in COLUMNS}
+        yield arrays_batch(columns, utc=utc)
+
+
+def arrays_batch(columns: Dict[str, Sequence], utc: bool = False) -> Batch:
+    """
+    One batch from column arrays (numpy or lists). Timestamps may be
+    datetime64 (IST wall time, or UTC with utc=True), aware datetimes or
+    naive datetimes (IST).
+    """
+    timestamps = columns['timestamp']
+    if np is not None and isinstance(timestamps, np.ndarray) and timestamps.dtype.kind == 'M':
+        micros = timestamps.astype('datetime64[us]').astype(np.int64)
+        if not utc:
+            micros = micros - IST.utcoffset(None) // timedelta(microseconds=1)
+        micros = (micros - _PG_EPOCH_US).tolist()
+    else:
+        micros = [_pg_micros(ts) for ts in timestamps]
+
+    def as_list(values, kind):
+        if np is not None and isinstance(values, np.ndarray):
+            return values.astype(kind).tolist()
+        return [kind(v) for v in values]
+
+    return (micros, [str(s) for s in columns['symbol']],
+            as_list(columns['open'], float), as_list(columns['high'], float),
+            as_list(columns['low'], float), as_list(columns['close'], float),
+            as_list(columns['volume'], int))
+
+
+def iter_arrays(columns: Dict[str, Sequence], batch_rows: int = BATCH_ROWS, utc: bool = False) -> Iterator[Batch]:
+    """Slice in-memory column arrays into batches"""
+    total = len(columns['symbol'])
+    for first in range(0, total, batch_rows):
+        yield arrays_batch({name: columns[name][first:first + batch_rows] for name in COLUMNS}, utc=utc)
+
+
+# =============================================================================
+# COPY AND MERGE
+# =============================================================================
+
+def encode_binary(batch: Batch) -> BytesIO:
+    """Batch -> Postgres binary COPY stream for the staging table"""
+    encoded_symbols = {}
+    out = BytesIO()
+    write = out.write
+    write(_HEADER)
+    for micros, symbol, o, h, l, c, v in zip(*batch):
+        raw = encoded_symbols.get(symbol)
+        if raw is None:
+            encoded = symbol.encode()
+            raw = encoded_symbols[symbol] = struct.pack('>i', len(encoded)) + encoded
+        write(_ROW_HEAD.pack(7, 8, micros))
+        write(raw)
+        write(_ROW_TAIL.pack(8, o, 8, h, 8, l, 8, c, 8, v))
+    write(_TRAILER)
+    out.seek(0)
+    return out
+
+
+def _staging_table() -> str:
+    return f"ohlc_staging_{os.getpid()}"
+
+
+def create_staging_table(conn, staging: str):
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {staging} (
+                timestamp TIMESTAMPTZ NOT NULL,
+                symbol TEXT NOT NULL,
+                open DOUBLE PRECISION NOT NULL,
+                high DOUBLE PRECISION NOT NULL,
+                low DOUBLE PRECISION NOT NULL,
+                close DOUBLE PRECISION NOT NULL,
+                volume BIGINT NOT NULL
+            );
+        """)
+    conn.commit()
+
+
+def load_batches(conn, batches: Iterable[Batch], label: str = "load", store=None) -> Tuple[int, float]:
+    """
+    COPY each batch into staging and merge it into ohlc_live_long in its own
+    transaction. Committed batches are also fed to store (a
+    candle_store.CandleStore) when given. Returns (rows merged, seconds).
+    """
+    staging = _staging_table()
+    create_staging_table(conn, staging)
+    total = 0
+    start = perf_counter()
+    try:
+        for batch in batches:
+            with conn.cursor() as cur:
+                cur.execute(f"TRUNCATE {staging}")
+                with stage('ohlc_loader', 'copy') as s:
+                    stream = encode_binary(batch)
+                    s.bytes = stream.getbuffer().nbytes
+                    cur.copy_expert(f"COPY {staging} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT binary)", stream)
+                    s.rows = len(batch[0])
+                with stage('ohlc_loader', 'merge') as s:
+                    # DISTINCT ON: a key repeated within one batch would otherwise
+                    # make ON CONFLICT touch the same row twice
+                    cur.execute(f"""
+                        INSERT INTO ohlc_live_long (timestamp, symbol, open, high, low, close, volume)
+                        SELECT DISTINCT ON (timestamp, symbol) timestamp, symbol, open, high, low, close, volume
+                        FROM {staging}
+                        ORDER BY timestamp, symbol
+                        ON CONFLICT (timestamp, symbol) DO UPDATE SET
+                            open = EXCLUDED.open,
+                            high = EXCLUDED.high,
+                            low = EXCLUDED.low,
+                            close = EXCLUDED.close,
+                            volume = EXCLUDED.volume
+                    """)
+                    s.rows = cur.rowcount
+                merged = cur.rowcount
+            conn.commit()
+            if store is not None:
+                micros, symbols, o, h, l, c, v = batch
+                store.ingest(symbols, [m // 1_000_000 + _PG_EPOCH_S for m in micros], o, h, l, c, v)
+            total += merged
+            elapsed = perf_counter() - start
+            print(f"[{label}] {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {staging}")
+        conn.commit()
+    return total, perf_counter() - start
+
+
+def _source(path: str, start, end, batch_rows: int) -> Iterator[Batch]:
+    if path.endswith('.parquet') or os.path.isdir(path):
+        return iter_parquet(path, start, end, batch_rows)
+    return iter_csv(path, start, end, batch_rows)
+
+
+def load_file(path: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+              batch_rows: int = BATCH_ROWS) -> Tuple[int, float]:
+    """Load one file (or one date range of it) on a dedicated connection"""
+    conn = db.connect()
+    try:
+        label = os.path.basename(path.rstrip('/'))
+        if start or end:
+            label += f" {start:%Y-%m-%d}..{end:%Y-%m-%d}" if start and end else f" {start or ''}..{end or ''}"
+        return load_batches(conn, _source(path, start, end, batch_rows), label)
+    finally:
+        conn.close()
+
+
+def split_range(start: datetime, end: datetime, parts: int) -> List[Tuple[datetime, datetime]]:
+    """Split [start, end) into at most `parts` whole-day ranges"""
+    days = max(1, (end.date() - start.date()).days)
+    step = max(1, -(-days // parts))
+    ranges = []
+    lower = start
+    while lower < end:
+        upper = min(end, datetime.combine(lower.date() + timedelta(days=step), time(), tzinfo=lower.tzinfo))
+        ranges.append((lower, upper))
+        lower = upper
+    return ranges
+
+
+def load_parallel(paths: List[str], start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  workers: int = 4, batch_rows: int = BATCH_ROWS) -> Tuple[int, float]:
+    """
+    Load files in worker processes: one task per file, or per date range of
+    each file when a start/end window is given (ranges do not overlap, so
+    workers never merge the same keys).
+    """
+    tasks = []
+    for path in paths:
+        if start and end:
+            tasks += [(path, lower, upper) for lower, upper in split_range(start, end, workers)]
+        else:
+            tasks.append((path, start, end))
+    total = 0
+    began = perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(load_file, path, lower, upper, batch_rows) for path, lower, upper in tasks]
+        for future in as_completed(futures):
+            rows, _seconds = future.result()
+            total += rows
+    elapsed = perf_counter() - began
+    print(f"Loaded {total:,} rows from {len(tasks)} tasks in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+    return total, elapsed
+
+
+def _parse_day(value: str) -> datetime:
+    return datetime.combine(date.fromisoformat(value), time(), tzinfo=IST)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load minute candles into ohlc_live_long")
+    parser.add_argument('paths', nargs='+', help="CSV files, Parquet files or Parquet dataset directories")
+    parser.add_argument('--start', type=_parse_day, help="first day to load (IST)")
+    parser.add_argument('--end', type=_parse_day, help="day after the last day to load (IST)")
+    parser.add_argument('--today', action='store_true', help="only today's candles (end-of-day catch-up)")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    args = parser.parse_args()
+
+    if args.today:
+        args.start = datetime.combine(datetime.now(IST).date(), time(), tzinfo=IST)
+        args.end = args.start + timedelta(days=1)
+    if args.workers > 1:
+        load_parallel(args.paths, args.start, args.end, args.workers, args.batch_rows)
+    else:
+        for path in args.paths:
+            load_file(path, args.start, args.end, args.batch_rows)
@@ -1,12 +1,16 @@
-from app.functions.bsedat import get_sensex_pullers_draggers
-from app.functions.nsedat import get_pullers_draggers
-from app.config.settings import rhost, rport, host, dbname, user, password
+from app.config.settings import rhost, rport
+from movers_fetch import fetch_all_movers, snapshot_time
+from metrics import record, stage, stamp
 
 from datetime import datetime
 from typing import List, Tuple, Dict
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-import psycopg2 as psycopg
+from time import perf_counter
+from psycopg2.extras import execute_values
+from db import pooled_connection
+from models import ensure_schema
+from redis_batch import RedisBatch, redis_batch
 
 
 class StockMovers(BaseModel):
@@ -25,176 +29,189 @@ import json
 # Create Redis client (adjust host/port as needed)
 r = redis.Redis(host=rhost, port=rport, db=0, decode_responses=True)
 
-def create_movers_table():
-    """Create the movers table if it doesn't exist"""
-    conn = psycopg.connect(host=host, dbname=dbname, user=user, password=password)
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS movers (
-                    timestamp TIMESTAMPTZ NOT NULL,
-                    symbol TEXT NOT NULL,
-                    pullers INTEGER NOT NULL DEFAULT 0,
-                    draggers INTEGER NOT NULL DEFAULT 0,
-                    PRIMARY KEY (timestamp, symbol)
-                );
-                
-                -- Create index for efficient querying
-                CREATE INDEX IF NOT EXISTS idx_movers_timestamp ON movers(timestamp);
-                CREATE INDEX IF NOT EXISTS idx_movers_symbol ON movers(symbol);
-            """)
-        conn.commit()
-    finally:
-        conn.close()
-
-def store_movers_data(timestamp: datetime, index_name: str, pullers_count: int, draggers_count: int):
-    """Store movers data in PostgreSQL"""
-    conn = psycopg.connect(host=host, dbname=dbname, user=user, password=password)
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                INSERT INTO movers (timestamp, symbol, pullers, draggers)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (timestamp, symbol) 
-                DO UPDATE SET 
-                    pullers = EXCLUDED.pullers,
-                    draggers = EXCLUDED.draggers
-            """, (timestamp, index_name, pullers_count, draggers_count))
-        conn.commit()
-    finally:
-        conn.close()
-
-def store_advance_decline_redis():
-    """Store latest 5 advance/decline datapoints from movers table to Redis"""
-    conn = psycopg.connect(host=host, dbname=dbname, user=user, password=password)
-    try:
-        with conn.cursor() as cur:
-            # Fetch up to 375 latest datapoints per symbol using a window function
-            cur.execute("""
-                WITH numbered AS (
-                  SELECT timestamp, symbol, pullers, draggers,
-                         ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) AS rn
-                  FROM movers
-                  WHERE symbol IN ('sensex', 'nifty50', 'banknifty', 'niftymidcap', 'bankex')
-                )
-                SELECT timestamp, symbol, pullers, draggers
-                FROM numbered
-                WHERE rn <= 375
-                ORDER BY symbol, timestamp DESC
-            """)
-            rows = cur.fetchall()
-
-            # Group by symbol; rows are newest-first per symbol because of ORDER BY
-            data_by_symbol = {
-                'sensex': [],
-                'nifty50': [],
-                'banknifty': [],
-                'niftymidcap': [],
-                'bankex': []
-            }
-
-            for timestamp, symbol, pullers, draggers in rows:
-                if symbol in data_by_symbol:
-                    data_by_symbol[symbol].append((timestamp, pullers, draggers))
-            
-            # Create AdvanceDecline object
-            advance_decline = AdvanceDecline(
-                AD_sensex=data_by_symbol['sensex'],
-                AD_nifty=data_by_symbol['nifty50'],
-                AD_banknifty=data_by_symbol['banknifty'],
-                AD_midcap=data_by_symbol['niftymidcap'],
-                AD_smallcap=data_by_symbol['bankex']  # Using bankex as smallcap placeholder
+# Advance/decline series: one capped Redis list per index, newest point first
+AD_SERIES_LEN = 375
+AD_SERIES_KEY = "advance_decline:series:{symbol}"
+AD_FIELDS = {
+    'sensex': 'AD_sensex',
+    'nifty50': 'AD_nifty',
+    'banknifty': 'AD_banknifty',
+    'niftymidcap': 'AD_midcap',
+    'bankex': 'AD_smallcap',  # Using bankex as smallcap placeholder
+}
+# False rebuilds the whole snapshot from Postgres every tick (old behaviour)
+AD_INCREMENTAL = True
+
+_ad_series_ready = False
+_ad_last_ts: Dict[str, datetime] = {}
+
+def store_movers_batch(conn, rows: List[Tuple[datetime, str, int, int]]):
+    """
+    Upsert every index's movers row for a tick in a single statement.
+    rows: (timestamp, index_name, pullers_count, draggers_count)
+    """
+    if not rows:
+        return
+    with conn.cursor() as cur:
+        execute_values(cur, """
+            INSERT INTO movers (timestamp, symbol, pullers, draggers)
+            VALUES %s
+            ON CONFLICT (timestamp, symbol) 
+            DO UPDATE SET 
+                pullers = EXCLUDED.pullers,
+                draggers = EXCLUDED.draggers
+        """, rows, page_size=len(rows))
+    conn.commit()
+
+def store_advance_decline_redis(conn, redis_client=r):
+    """
+    Rebuild the advance/decline series (up to 375 points per index) from
+    the movers table, reseed the per-index Redis lists and announce the
+    full set on chan:advance_decline:seed. Only needed on cold start; later
+    ticks go through append_advance_decline_redis, whose new points are the
+    only payloads on chan:advance_decline.
+    """
+    with conn.cursor() as cur:
+        # Fetch up to 375 latest datapoints per symbol using a window function
+        cur.execute("""
+            WITH numbered AS (
+              SELECT timestamp, symbol, pullers, draggers,
+                     ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY timestamp DESC) AS rn
+              FROM movers
+              WHERE symbol IN ('sensex', 'nifty50', 'banknifty', 'niftymidcap', 'bankex')
             )
-            
-            # Store in Redis (no expiry) and publish the payload
-            payload = advance_decline.model_dump_json()
-            r.set("advance_decline:latest", payload)
-            r.publish("chan:advance_decline", payload)
-
-            print(f"Stored advance/decline data (up to 375 points per index) for {len([k for k, v in data_by_symbol.items() if v])} indices")
-            
-    finally:
-        conn.close()
+            SELECT timestamp, symbol, pullers, draggers
+            FROM numbered
+            WHERE rn <= 375
+            ORDER BY symbol, timestamp DESC
+        """)
+        rows = cur.fetchall()
+
+        # Group by symbol; rows are newest-first per symbol because of ORDER BY
+        data_by_symbol = {
+            'sensex': [],
+            'nifty50': [],
+            'banknifty': [],
+            'niftymidcap': [],
+            'bankex': []
+        }
+
+        for timestamp, symbol, pullers, draggers in rows:
+            if symbol in data_by_symbol:
+                data_by_symbol[symbol].append((timestamp, pullers, draggers))
+        
+        # Create AdvanceDecline object
+        advance_decline = AdvanceDecline(
+            AD_sensex=data_by_symbol['sensex'],
+            AD_nifty=data_by_symbol['nifty50'],
+            AD_banknifty=data_by_symbol['banknifty'],
+            AD_midcap=data_by_symbol['niftymidcap'],
+            AD_smallcap=data_by_symbol['bankex']  # Using bankex as smallcap placeholder
+        )
+        
+        # The lists are the stored state; the seed is announced on its own
+        # channel so chan:advance_decline carries one payload shape
+        payload = advance_decline.model_dump_json()
+        with redis_batch(redis_client, "advance_decline") as batch:
+            batch.delete("advance_decline:latest")
+            batch.publish("chan:advance_decline:seed", payload)
+
+            # Seed the per-index series used by the incremental path
+            for symbol, points in data_by_symbol.items():
+                key = AD_SERIES_KEY.format(symbol=symbol)
+                batch.delete(key)
+                if points:
+                    batch.rpush(key, *[json.dumps([ts.isoformat(), p, d]) for ts, p, d in points])
+                    _ad_last_ts[symbol] = points[0][0]
+
+        print(f"Stored advance/decline data (up to 375 points per index) for {len([k for k, v in data_by_symbol.items() if v])} indices")
+
+def append_advance_decline_redis(rows: List[Tuple[datetime, str, int, int]], redis_client=r):
+    """
+    Append this tick's points to the capped per-index series and publish only
+    the new points on chan:advance_decline, in the AdvanceDecline shape with
+    one point per index that has a reading.
+    """
+    if not rows:
+        return
+    new_points = {field: [] for field in AD_FIELDS.values()}
+    with redis_batch(redis_client, "advance_decline") as batch:
+        for timestamp, symbol, pullers, draggers in rows:
+            if symbol not in AD_FIELDS:
+                continue
+            # Tick times are naive local; match the offset-aware points from Postgres
+            timestamp = timestamp.astimezone()
+            key = AD_SERIES_KEY.format(symbol=symbol)
+            point = json.dumps([timestamp.isoformat(), pullers, draggers])
+            if _ad_last_ts.get(symbol) == timestamp:
+                # Same minute ran again: the upsert replaced the row, so replace the head
+                batch.lset(key, 0, point)
+            else:
+                batch.lpush(key, point)
+                batch.ltrim(key, 0, AD_SERIES_LEN - 1)
+            _ad_last_ts[symbol] = timestamp
+            new_points[AD_FIELDS[symbol]].append((timestamp, pullers, draggers))
+        message = AdvanceDecline(**new_points).model_dump(mode='json')
+        message.update(stamp('fetch_stock_movers', rows[0][0]))
+        batch.publish("chan:advance_decline", json.dumps(message))
 
 def fetch_stock_movers() -> Dict[str, StockMovers]:
-    # Ensure table exists
-    create_movers_table()
-    
+    global _ad_series_ready
     # Get current timestamp (rounded to minute with 00 seconds)
     current_time = datetime.now().replace(second=0, microsecond=0)
     
-    # Fetch data from all indices
-    sensex_data = get_sensex_pullers_draggers(index_code="16")  # SENSEX index code
-    bankex_data = get_sensex_pullers_draggers(index_code="53")  # BANKEX index code
-    nifty_data = get_pullers_draggers(index_name="NIFTY 50")
-    banknifty_data = get_pullers_draggers(index_name="NIFTY BANK")
-    niftymidcap_data = get_pullers_draggers(index_name="NIFTY MIDCAP SELECT")
+    # Fetch data from all indices concurrently; stale entries are last good snapshots
+    with stage('fetch_stock_movers', 'exchange_fetch') as s:
+        movers_data, stale = fetch_all_movers()
+        s.rows = len(movers_data)
     
     # Create separate StockMovers objects for each index
     indices_data = {}
+    movers_rows = []
+    # Every Redis write of the tick goes out in one transaction at the end
+    batch = RedisBatch(r, "fetch_stock_movers")
     
-    if sensex_data:
-        sensex_movers = StockMovers(pullers=sensex_data.get('pullers', []), draggers=sensex_data.get('draggers', []))
-        payload = sensex_movers.model_dump_json()
-        r.set("stock_movers:sensex", payload)
-        r.publish("chan:stock_movers:sensex", payload)
-        indices_data['sensex'] = sensex_movers
-        
-        # Store in PostgreSQL
-        pullers_count = len(sensex_data.get('pullers', []))
-        draggers_count = len(sensex_data.get('draggers', []))
-        store_movers_data(current_time, 'sensex', pullers_count, draggers_count)
-    
-    if bankex_data:
-        bankex_movers = StockMovers(pullers=bankex_data.get('pullers', []), draggers=bankex_data.get('draggers', []))
-        payload = bankex_movers.model_dump_json()
-        r.set("stock_movers:bankex", payload)
-        r.publish("chan:stock_movers:bankex", payload)
-        indices_data['bankex'] = bankex_movers
-        
-        # Store in PostgreSQL
-        pullers_count = len(bankex_data.get('pullers', []))
-        draggers_count = len(bankex_data.get('draggers', []))
-        store_movers_data(current_time, 'bankex', pullers_count, draggers_count)
-    
-    if nifty_data:
-        nifty_movers = StockMovers(pullers=nifty_data.get('pullers', []), draggers=nifty_data.get('draggers', []))
-        payload = nifty_movers.model_dump_json()
-        r.set("stock_movers:nifty50", payload)
-        r.publish("chan:stock_movers:nifty50", payload)
-        indices_data['nifty50'] = nifty_movers
-        
-        # Store in PostgreSQL
-        pullers_count = len(nifty_data.get('pullers', []))
-        draggers_count = len(nifty_data.get('draggers', []))
-        store_movers_data(current_time, 'nifty50', pullers_count, draggers_count)
-    
-    if banknifty_data:
-        banknifty_movers = StockMovers(pullers=banknifty_data.get('pullers', []), draggers=banknifty_data.get('draggers', []))
-        payload = banknifty_movers.model_dump_json()
-        r.set("stock_movers:banknifty", payload)
-        r.publish("chan:stock_movers:banknifty", payload)
-        indices_data['banknifty'] = banknifty_movers
-        
-        # Store in PostgreSQL
-        pullers_count = len(banknifty_data.get('pullers', []))
-        draggers_count = len(banknifty_data.get('draggers', []))
-        store_movers_data(current_time, 'banknifty', pullers_count, draggers_count)
-    
-    if niftymidcap_data:
-        niftymidcap_movers = StockMovers(pullers=niftymidcap_data.get('pullers', []), draggers=niftymidcap_data.get('draggers', []))
-        payload = niftymidcap_movers.model_dump_json()
-        r.set("stock_movers:niftymidcap", payload)
-        r.publish("chan:stock_movers:niftymidcap", payload)
-        indices_data['niftymidcap'] = niftymidcap_movers
-        
-        # Store in PostgreSQL
-        pullers_count = len(niftymidcap_data.get('pullers', []))
-        draggers_count = len(niftymidcap_data.get('draggers', []))
-        store_movers_data(current_time, 'niftymidcap', pullers_count, draggers_count)
-
-    # Store advance/decline data in Redis after all data is processed
-    store_advance_decline_redis()
+    with stage('fetch_stock_movers', 'validate_encode') as s:
+        for index_name, data in movers_data.items():
+            movers = StockMovers(pullers=data.get('pullers', []), draggers=data.get('draggers', []))
+            # Payload carries when its data was fetched (older for a stale snapshot)
+            message = movers.model_dump(mode='json')
+            message.update(stamp('fetch_stock_movers', snapshot_time(index_name)))
+            payload = json.dumps(message)
+            batch.set_and_publish(f"stock_movers:{index_name}", payload)
+            indices_data[index_name] = movers
+            
+            # Queue for the batched PostgreSQL upsert; a stale snapshot is not a
+            # reading for this minute, so it is not recorded in history
+            if index_name not in stale:
+                pullers_count = len(data.get('pullers', []))
+                draggers_count = len(data.get('draggers', []))
+                movers_rows.append((current_time, index_name, pullers_count, draggers_count))
+        s.rows = len(indices_data)
+        s.bytes = batch.payload_bytes
+
+    # All database work for the tick shares one pooled connection:
+    # schema version check (free once current), a single batched upsert,
+    # then (cold start only) the advance/decline rebuild; warm ticks append
+    # to the Redis series instead
+    try:
+        with batch:
+            db_start = perf_counter()
+            with pooled_connection() as conn:
+                ensure_schema(conn)
+                store_movers_batch(conn, movers_rows)
+                if not AD_INCREMENTAL or not _ad_series_ready:
+                    store_advance_decline_redis(conn, batch)
+            db_ms = (perf_counter() - db_start) * 1000
+            record('fetch_stock_movers', 'db', db_ms / 1000, rows=len(movers_rows))
+            if AD_INCREMENTAL and _ad_series_ready:
+                append_advance_decline_redis(movers_rows, batch)
+    except Exception:
+        # The series may have missed this tick; rebuild it from Postgres next time
+        _ad_series_ready = False
+        raise
+    _ad_series_ready = True
+    print(f"DB time for tick {current_time:%H:%M}: {db_ms:.1f} ms ({len(movers_rows)} movers rows)")
 
     return indices_data
 
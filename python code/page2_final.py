@@ -1,10 +1,18 @@
-import psycopg2
 import redis
 import json
-from typing import List, Tuple, Dict
+from contextlib import contextmanager
+from itertools import count
+from time import time
+from typing import Iterator, List, Optional, Sequence, Tuple, Dict, Set
 from pydantic import BaseModel
-from datetime import datetime
-from app.config.settings import host, dbname, user, password , rhost, rport
+from datetime import date, datetime, timedelta
+from app.config.settings import rhost, rport
+from db import pooled_connection
+from redis_batch import redis_batch
+import compact
+import fast_json
+from fast_json import model_builder, row_encoder
+from metrics import stage, stamp
 
 
 class NDayHighLow(BaseModel):
@@ -28,80 +36,106 @@ class Camarilla(BaseModel):
     type: str 
     camarilla: float
 
-def fetch_breakout_events(conn) -> List[NDayHighLow]:
-    cur = conn.cursor()
-    cur.execute("""
+# Rows are read again from this far behind the high-water mark so events
+# committed late for an earlier candle are still picked up
+WATERMARK_OVERLAP = timedelta(minutes=15)
+
+# Only today's rows; GREATEST() ignores a NULL watermark on the first read.
+# Both bounds are constants, so the (timestamp DESC) indexes can be used.
+TODAY_SINCE_WATERMARK = """
+    {column} >= GREATEST(CURRENT_DATE::timestamptz, %s::timestamptz)
+    AND {column} < (CURRENT_DATE + 1)::timestamptz
+"""
+
+
+class DayCache:
+    """Today's events read from one table, keyed by row identity, plus its high-water mark"""
+
+    def __init__(self):
+        self.day = None
+        self.watermark = None
+        self.events = {}
+
+    def since(self):
+        """Lower bound for the next read, resetting at session rollover"""
+        today = date.today()
+        if self.day != today:
+            self.day = today
+            self.watermark = None
+            self.events = {}
+        if self.watermark is None:
+            return None
+        return self.watermark - WATERMARK_OVERLAP
+
+    def merge(self, key, event, ts: datetime):
+        self.events[key] = event
+        if self.watermark is None or ts > self.watermark:
+            self.watermark = ts
+
+    def values(self) -> list:
+        return list(self.events.values())
+
+
+_day_caches: Dict[str, DayCache] = {}
+
+
+def _day_cache(name: str) -> DayCache:
+    if name not in _day_caches:
+        _day_caches[name] = DayCache()
+    return _day_caches[name]
+
+
+def _fetch_today(conn, table: str, query: str, model, fast: bool, identity=lambda row: (row[0], row[1])) -> list:
+    """
+    Read the rows of table past its high-water mark with query (columns in
+    the model's field order, timestamp first), merge them into the day cache
+    and return the whole day. fast=True caches plain dicts built straight
+    from the rows instead of validated models.
+    """
+    cache = _day_cache(f"{table}:{'rows' if fast else 'models'}")
+    build = row_encoder(model) if fast else model_builder(model)
+    with stage('page2', f"query:{table}") as s:
+        cur = conn.cursor()
+        cur.execute(query, (cache.since(),))
+        rows = cur.fetchall()
+        cur.close()
+        s.rows = len(rows)
+
+    with stage('page2', f"build:{table}") as s:
+        for row in rows:
+            cache.merge(identity(row), build(row), row[0])
+        s.rows = len(rows)
+
+    return cache.values()
+
+
+# Row shapes shared by the today fetchers and the history generators below
+BREAKOUT_SELECT = """
         SELECT 
-            symbol,
             event_time,
-            event_type,
+            symbol,
+            LOWER(event_type) AS type,
             CASE 
                 WHEN event_type = 'HIGH' THEN prev7d_high
                 WHEN event_type = 'LOW' THEN prev7d_low
             END AS value
         FROM breakout_events7
-        WHERE DATE(event_time) = CURRENT_DATE
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    
-    events = []
-    for row in rows:
-        symbol, event_time, event_type, value = row
-        event = NDayHighLow(
-            timestamp=event_time,
-            symbol=symbol,
-            type=event_type.lower(),
-            value=value
-        )
-        events.append(event)
-    
-    return events
+"""
 
-
-def fetch_vwap_cross_events(conn) -> List[VWAP]:
-    """
-    Fetch VWAP cross events for the current date.
-    Returns: List of VWAP models.
-    """
-    cur = conn.cursor()
-    query = """
+VWAP_SELECT = """
         SELECT 
             timestamp, 
             symbol, 
-            vwap, 
             CASE 
                 WHEN crossed_above = true THEN 'above'
                 WHEN crossed_below = true THEN 'below'
                 ELSE NULL
-            END AS type
-        FROM weekly_vwap_cross_events_15
-        WHERE DATE(timestamp) = CURRENT_DATE;
-    """
-    cur.execute(query)
-    rows = cur.fetchall()
-    cur.close()
-    
-    events = []
-    for row in rows:
-        timestamp, symbol, vwap, event_type = row
-        event = VWAP(
-            timestamp=timestamp,
-            symbol=symbol,
-            type=event_type,
-            vwap=vwap
-        )
-        events.append(event)
-    
-    return events
+            END AS type,
+            vwap
+        FROM {table}
+"""
 
-def fetch_camarilla_cross_events(conn, tf, period) -> List[Camarilla]:
-    """
-    Fetch Camarilla crossing events for the current date.
-    Returns: List of Camarilla models.
-    """
-    cur = conn.cursor()
-    query = f"""
+CAMARILLA_SELECT = """
         SELECT 
             timestamp AS ts,
             symbol,
@@ -119,57 +153,153 @@ def fetch_camarilla_cross_events(conn, tf, period) -> List[Camarilla]:
                 WHEN crossed_below = 'l5' THEN l5
                 ELSE NULL
             END AS value
-        FROM {period}_camarilla_cross_events_{tf}
-        WHERE DATE(timestamp) = CURRENT_DATE
-        AND (crossed_above IN ('h4', 'h5') OR crossed_below IN ('l4', 'l5'));
-    """
-    cur.execute(query)
-    rows = cur.fetchall()
-    cur.close()
-    
-    events = []
-    for row in rows:
-        ts, symbol, event_type, value = row
-        event = Camarilla(
-            timestamp=ts,
-            symbol=symbol,
-            type=event_type,
-            camarilla=value
-        )
-        events.append(event)
-    
-    return events
+        FROM {table}
+"""
+CAMARILLA_CROSSED = "(crossed_above IN ('h4', 'h5') OR crossed_below IN ('l4', 'l5'))"
 
-
-def fetch_unusual_volume_events(conn) -> List[Vals]:
-    """
-    Fetch unusual volume events for the current date.
-    Returns: List of Vals models.
-    """
-    cur = conn.cursor()
-    query = """
+VOLUME_SELECT = """
         SELECT 
             timestamp AS ts,
             symbol,
             value_traded
         FROM unusual_volume_events
-        WHERE DATE(timestamp) = CURRENT_DATE;
+"""
+
+
+def fetch_breakout_events(conn, fast: bool = False) -> List[NDayHighLow]:
+    query = f"""{BREAKOUT_SELECT}
+        WHERE {TODAY_SINCE_WATERMARK.format(column='event_time')}
     """
-    cur.execute(query)
-    rows = cur.fetchall()
-    cur.close()
-    
-    events = []
-    for row in rows:
-        ts, symbol, value_traded = row
-        event = Vals(
-            timestamp=ts,
-            symbol=symbol,
-            value=value_traded
-        )
-        events.append(event)
-    
-    return events
+    # One breakout per symbol per day (PRIMARY KEY (date, symbol))
+    return _fetch_today(conn, "breakout_events7", query, NDayHighLow, fast, identity=lambda row: row[1])
+
+
+def fetch_vwap_cross_events(conn, fast: bool = False) -> List[VWAP]:
+    """
+    Fetch VWAP cross events for the current date.
+    Only rows past the table's high-water mark are read; they are merged
+    into the day cache, which is returned whole.
+    Returns: List of VWAP models (dicts when fast=True).
+    """
+    query = f"""{VWAP_SELECT.format(table='weekly_vwap_cross_events_15')}
+        WHERE {TODAY_SINCE_WATERMARK.format(column='timestamp')};
+    """
+    return _fetch_today(conn, "weekly_vwap_cross_events_15", query, VWAP, fast)
+
+def fetch_camarilla_cross_events(conn, tf, period, fast: bool = False) -> List[Camarilla]:
+    """
+    Fetch Camarilla crossing events for the current date.
+    Only rows past the table's high-water mark are read; they are merged
+    into the day cache, which is returned whole.
+    Returns: List of Camarilla models (dicts when fast=True).
+    """
+    table = f"{period}_camarilla_cross_events_{tf}"
+    query = f"""{CAMARILLA_SELECT.format(table=table)}
+        WHERE {TODAY_SINCE_WATERMARK.format(column='timestamp')}
+        AND {CAMARILLA_CROSSED};
+    """
+    return _fetch_today(conn, table, query, Camarilla, fast)
+
+
+def fetch_unusual_volume_events(conn, fast: bool = False) -> List[Vals]:
+    """
+    Fetch unusual volume events for the current date.
+    Only rows past the table's high-water mark are read; they are merged
+    into the day cache, which is returned whole.
+    Returns: List of Vals models (dicts when fast=True).
+    """
+    query = f"""{VOLUME_SELECT}
+        WHERE {TODAY_SINCE_WATERMARK.format(column='timestamp')};
+    """
+    return _fetch_today(conn, "unusual_volume_events", query, Vals, fast)
+
+
+# --- history: any date range, streamed ---------------------------------
+# Rows come through a named (server-side) cursor HISTORY_ITERSIZE at a time,
+# ordered by (time, symbol). Pass the last event's page_key() as `after` to
+# continue where a page stopped (keyset pagination: no OFFSET scans).
+
+HISTORY_ITERSIZE = 2000
+
+_history_cursor_ids = count()
+
+
+def page_key(event) -> Tuple[datetime, str]:
+    """Keyset position of an event (model or dict) for the next page's `after`"""
+    event = event.model_dump() if isinstance(event, BaseModel) else event
+    return event['timestamp'], event['symbol']
+
+
+def _iter_history(conn, name: str, select: str, time_column: str, model, start: datetime,
+                  end: Optional[datetime], symbols: Optional[Sequence[str]], after: Optional[Tuple[datetime, str]],
+                  limit: Optional[int], fast: bool, extra: Optional[str] = None) -> Iterator:
+    conditions, params = [f"{time_column} >= %s"], [start]
+    if end is not None:
+        conditions.append(f"{time_column} < %s")
+        params.append(end)
+    if symbols:
+        conditions.append("symbol = ANY(%s)")
+        params.append(list(symbols))
+    if after is not None:
+        conditions.append(f"({time_column}, symbol) > (%s, %s)")
+        params.extend(after)
+    if extra:
+        conditions.append(extra)
+    query = f"{select}\n        WHERE {' AND '.join(conditions)}\n        ORDER BY {time_column}, symbol"
+    if limit is not None:
+        query += "\n        LIMIT %s"
+        params.append(limit)
+
+    build = row_encoder(model) if fast else model_builder(model)
+    cur = conn.cursor(name=f"history_{name}_{next(_history_cursor_ids)}")
+    cur.itersize = HISTORY_ITERSIZE
+    rows = 0
+    try:
+        with stage('page2', f"history:{name}") as s:
+            cur.execute(query, params)
+            for row in cur:
+                rows += 1
+                yield build(row)
+            s.rows = rows
+    finally:
+        cur.close()
+
+
+def iter_breakout_events(conn, start: datetime, end: Optional[datetime] = None,
+                         symbols: Optional[Sequence[str]] = None, after: Optional[Tuple[datetime, str]] = None,
+                         limit: Optional[int] = None, fast: bool = False) -> Iterator[NDayHighLow]:
+    """Breakout events with start <= event_time < end (open-ended without end), oldest first"""
+    return _iter_history(conn, "breakout_events7", BREAKOUT_SELECT, "event_time", NDayHighLow,
+                         start, end, symbols, after, limit, fast)
+
+
+def iter_vwap_cross_events(conn, start: datetime, end: Optional[datetime] = None,
+                           symbols: Optional[Sequence[str]] = None, after: Optional[Tuple[datetime, str]] = None,
+                           limit: Optional[int] = None, fast: bool = False, tf=15,
+                           period: str = 'weekly') -> Iterator[VWAP]:
+    """VWAP cross events in [start, end) from {period}_vwap_cross_events_{tf}, oldest first"""
+    table = f"{period}_vwap_cross_events_{tf}"
+    return _iter_history(conn, table, VWAP_SELECT.format(table=table), "timestamp", VWAP,
+                         start, end, symbols, after, limit, fast)
+
+
+def iter_camarilla_cross_events(conn, start: datetime, end: Optional[datetime] = None,
+                                symbols: Optional[Sequence[str]] = None,
+                                after: Optional[Tuple[datetime, str]] = None, limit: Optional[int] = None,
+                                fast: bool = False, tf=15, period: str = 'weekly') -> Iterator[Camarilla]:
+    """h4/h5/l4/l5 crosses in [start, end) from {period}_camarilla_cross_events_{tf}, oldest first"""
+    table = f"{period}_camarilla_cross_events_{tf}"
+    return _iter_history(conn, table, CAMARILLA_SELECT.format(table=table), "timestamp", Camarilla,
+                         start, end, symbols, after, limit, fast, extra=CAMARILLA_CROSSED)
+
+
+def iter_unusual_volume_events(conn, start: datetime, end: Optional[datetime] = None,
+                               symbols: Optional[Sequence[str]] = None,
+                               after: Optional[Tuple[datetime, str]] = None, limit: Optional[int] = None,
+                               fast: bool = False) -> Iterator[Vals]:
+    """Unusual volume events in [start, end), oldest first"""
+    return _iter_history(conn, "unusual_volume_events", VOLUME_SELECT, "timestamp", Vals,
+                         start, end, symbols, after, limit, fast)
 
 class DateTimeEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -177,49 +307,187 @@ class DateTimeEncoder(json.JSONEncoder):
             return obj.isoformat()
         return super().default(obj)
 
+# Skip pydantic and encode rows straight to JSON when orjson is installed
+FAST_JSON = fast_json.AVAILABLE
+
+def encode_events(data):
+    if FAST_JSON:
+        return fast_json.dumps(data)
+    return json.dumps(data, cls=DateTimeEncoder)
+
+# Append-only delta feed kept alongside each snapshot key
+EVENT_STREAM_MAXLEN = 20000
+# Keep pushing the whole day's list on chan:{key} for existing SSE readers
+PUBLISH_FULL_SNAPSHOTS = True
+# Feeds large enough to also publish in the compact columnar format
+COMPACT_KEYS = {"volume_events", "camarilla_events"}
+
+_published_keys: Dict[str, Set[str]] = {}
+_published_day: Dict[str, date] = {}
+_snapshot_written: Set[str] = set()
+_last_stream_id: Dict[str, Tuple[int, int]] = {}
+
+
+def _event_key(event: dict) -> str:
+    """Identity of an event within a feed: candle time, symbol and type"""
+    return f"{event['timestamp'].isoformat()}|{event['symbol']}|{event.get('type') or ''}"
+
+
+def _published_today(redis_client, key: str) -> Set[str]:
+    """
+    Event identities already on today's stream for key. On cold start (or
+    after the day rolls over) they are read back from the stream itself so
+    a restart never republishes an event.
+    """
+    today = date.today()
+    if _published_day.get(key) != today:
+        day_start_ms = int(datetime.combine(today, datetime.min.time()).timestamp() * 1000)
+        entries = redis_client.xrange(f"stream:{key}", min=f"{day_start_ms}-0")
+        _published_keys[key] = {fields['event_key'] for _id, fields in entries}
+        if entries:
+            last_ms, last_seq = entries[-1][0].split('-')
+            _last_stream_id[key] = (int(last_ms), int(last_seq))
+        _published_day[key] = today
+        _snapshot_written.discard(key)
+    return _published_keys[key]
+
+
+def _next_stream_id(key: str) -> str:
+    """
+    Monotonic stream ID assigned client-side, so the delta announcement can
+    carry it in the same transaction as the XADD
+    """
+    now_ms = int(time() * 1000)
+    last_ms, last_seq = _last_stream_id.get(key, (0, -1))
+    if now_ms > last_ms:
+        next_id = (now_ms, 0)
+    else:
+        next_id = (last_ms, last_seq + 1)
+    _last_stream_id[key] = next_id
+    return f"{next_id[0]}-{next_id[1]}"
+
+
+@contextmanager
+def _event_batch(redis_client, name: str):
+    """
+    redis_batch that forgets which events it marked as published if the
+    flush fails, so the next cycle re-reads the streams instead of skipping them
+    """
+    try:
+        with redis_batch(redis_client, name) as batch:
+            yield batch
+    except Exception:
+        _published_day.clear()
+        _snapshot_written.clear()
+        _last_stream_id.clear()
+        raise
+
+
+def _snapshot_present(redis_client, key: str) -> bool:
+    """
+    Whether the snapshot keys still exist: the API routes cache them with an
+    expiry, and a Redis flush or restart drops them, so the in-process
+    _snapshot_written flag alone would leave them missing until a new event
+    """
+    keys = [key]
+    if compact.ENABLED and key in COMPACT_KEYS:
+        keys.append(f"{key}:cols")
+    return redis_client.exists(*keys) == len(keys)
+
+
+def store_events_to_redis(redis_client, key: str, data: List[dict]):
+    """
+    Store a day's events under the snapshot key and append the ones not seen
+    before to stream:{key} (trimmed to EVENT_STREAM_MAXLEN). The new events are
+    announced once on chan:{key}:delta as [{"id": stream_id, "event": {...},
+    "source_ts", "published_at", "staleness_ms"}],
+    so a consumer can resume with XRANGE stream:{key} (last_id +.
+    Keys in COMPACT_KEYS also get the columnar binary snapshot (see compact.py)
+    under {key}:cols, announced on chan:{key}:cols.
+    redis_client may be a RedisBatch collecting the whole cycle.
+    """
+    with _event_batch(redis_client, key) as batch:
+        published = _published_today(batch.client, key)
+        new_events = []
+        for event in data:
+            event_key = _event_key(event)
+            if event_key not in published:
+                new_events.append((event_key, event))
+        if not new_events and key in _snapshot_written and _snapshot_present(batch.client, key):
+            # Nothing new since the last cycle: snapshot and subscribers are current
+            return
+
+        with stage('page2', f"encode:{key}") as s:
+            payload = encode_events(data)
+            s.rows = len(data)
+            s.bytes = len(payload)
+        batch.set(key, payload)
+        if PUBLISH_FULL_SNAPSHOTS:
+            batch.publish(f"chan:{key}", payload)
+        if compact.ENABLED and key in COMPACT_KEYS:
+            with stage('page2', f"encode_compact:{key}") as s:
+                packed = compact.encode_events(data)
+                s.rows = len(data)
+                s.bytes = len(packed)
+            batch.set(f"{key}:cols", packed)
+            if PUBLISH_FULL_SNAPSHOTS:
+                batch.publish(f"chan:{key}:cols", packed)
+
+        delta = []
+        for event_key, event in new_events:
+            stream_id = _next_stream_id(key)
+            # Candle timestamp -> publish time, so consumers can see staleness
+            stamped = stamp(f"page2:{key}", event['timestamp'])
+            batch.xadd(
+                f"stream:{key}",
+                {'event_key': event_key, 'data': encode_events(event), 'published_at': stamped['published_at']},
+                id=stream_id,
+                maxlen=EVENT_STREAM_MAXLEN,
+                approximate=True,
+            )
+            delta.append({'id': stream_id, 'event': event, **stamped})
+        if delta:
+            batch.publish(f"chan:{key}:delta", encode_events(delta))
+        published.update(event_key for event_key, _event in new_events)
+        _snapshot_written.add(key)
+
+def _as_dicts(events) -> List[dict]:
+    # Fast-path fetchers already return dicts
+    return [event.model_dump() if isinstance(event, BaseModel) else event for event in events]
+
 def store_breakout_events_to_redis(redis_client, events: List[NDayHighLow], key: str = "breakout_events"):
     """Store breakout events to Redis as JSON."""
-    data = [event.model_dump() for event in events]
-    payload = json.dumps(data, cls=DateTimeEncoder)
-    redis_client.set(key, payload)
-    redis_client.publish(f"chan:{key}", payload)
+    store_events_to_redis(redis_client, key, _as_dicts(events))
 
 def store_vwap_events_to_redis(redis_client, events: List[VWAP], key: str = "vwap_events"):
     """Store VWAP cross events to Redis as JSON."""
-    data = [event.model_dump() for event in events]
-    payload = json.dumps(data, cls=DateTimeEncoder)
-    redis_client.set(key, payload)
-    redis_client.publish(f"chan:{key}", payload)
+    store_events_to_redis(redis_client, key, _as_dicts(events))
 
 def store_camarilla_events_to_redis(redis_client, events: List[Camarilla], key: str = "camarilla_events"):
     """Store Camarilla cross events to Redis as JSON."""
-    data = [event.model_dump() for event in events]
-    payload = json.dumps(data, cls=DateTimeEncoder)
-    redis_client.set(key, payload)
-    redis_client.publish(f"chan:{key}", payload)
+    store_events_to_redis(redis_client, key, _as_dicts(events))
 
 def store_volume_events_to_redis(redis_client, events: List[Vals], key: str = "volume_events"):
     """Store unusual volume events to Redis as JSON."""
-    data = [event.model_dump() for event in events]
-    payload = json.dumps(data, cls=DateTimeEncoder)
-    redis_client.set(key, payload)
-    redis_client.publish(f"chan:{key}", payload)
+    store_events_to_redis(redis_client, key, _as_dicts(events))
 
 def page2_15(conn, redis_client,tf=15, period='weekly'):
     
-    events = fetch_breakout_events(conn)
-    events2 = fetch_vwap_cross_events(conn)
-    events3 = fetch_camarilla_cross_events(conn, tf=tf, period=period)
+    events = fetch_breakout_events(conn, fast=FAST_JSON)
+    events2 = fetch_vwap_cross_events(conn, fast=FAST_JSON)
+    events3 = fetch_camarilla_cross_events(conn, tf=tf, period=period, fast=FAST_JSON)
 
-    # Store events to Redis
-    store_breakout_events_to_redis(redis_client, events)
-    store_vwap_events_to_redis(redis_client, events2)
-    store_camarilla_events_to_redis(redis_client, events3)
+    # Store events to Redis in one transaction
+    with _event_batch(redis_client, "page2_15") as batch:
+        store_breakout_events_to_redis(batch, events)
+        store_vwap_events_to_redis(batch, events2)
+        store_camarilla_events_to_redis(batch, events3)
 
 
 def page2_1(conn, redis_client):
-    events4 = fetch_unusual_volume_events(conn)
-    store_volume_events_to_redis(redis_client, events4)
+    events4 = fetch_unusual_volume_events(conn, fast=FAST_JSON)
+    with _event_batch(redis_client, "page2_1") as batch:
+        store_volume_events_to_redis(batch, events4)
 
 ##############################################################################################
 ##############################################################################################
@@ -228,20 +496,20 @@ def page2_1(conn, redis_client):
 ##############################################################################################
 
 if __name__ == "__main__":
-    conn = psycopg2.connect(host=host, dbname=dbname, user=user, password=password)
     redis_client = redis.Redis(host=rhost, port=rport, db=0, decode_responses=True)
 
-    events = fetch_breakout_events(conn)
-    events2 = fetch_vwap_cross_events(conn)
-    events3 = fetch_camarilla_cross_events(conn, tf=15, period='weekly')
-    events4 = fetch_unusual_volume_events(conn)
+    with pooled_connection() as conn:
+        events = fetch_breakout_events(conn)
+        events2 = fetch_vwap_cross_events(conn)
+        events3 = fetch_camarilla_cross_events(conn, tf=15, period='weekly')
+        events4 = fetch_unusual_volume_events(conn)
     
     # Store events to Redis
-    store_breakout_events_to_redis(redis_client, events)
-    store_vwap_events_to_redis(redis_client, events2)
-    store_camarilla_events_to_redis(redis_client, events3)
-    store_volume_events_to_redis(redis_client, events4)
+    with _event_batch(redis_client, "page2") as batch:
+        store_breakout_events_to_redis(batch, events)
+        store_vwap_events_to_redis(batch, events2)
+        store_camarilla_events_to_redis(batch, events3)
+        store_volume_events_to_redis(batch, events4)
     
     # for event in events3:
     #     print(event)
-    conn.close()
\ No newline at end of file
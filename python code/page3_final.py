@@ -1,10 +1,16 @@
-import psycopg
 import redis
 import json
+from contextlib import contextmanager
 from datetime import datetime
 from decimal import Decimal
+from typing import Dict, List
 from pydantic import BaseModel
-from app.config.settings import host, dbname, user, password, rport , rhost
+from app.config.settings import rport , rhost
+from db import pooled_connection
+from redis_batch import redis_batch
+import fast_json
+from fast_json import field_names, model_builder, row_encoder
+from metrics import stage, stamp
 
 # --- new model & encoder --------------------------------------------
 class ActiveSignal(BaseModel):
@@ -47,34 +53,165 @@ class DateTimeEncoder(json.JSONEncoder):
             return float(obj)
         return super().default(obj)
 
+# Skip pydantic and encode rows straight to JSON when orjson is installed
+FAST_JSON = fast_json.AVAILABLE
+SIGNAL_COLUMNS = ", ".join(field_names(ActiveSignal))
+SIGNAL_TIMEFRAMES = [5, 15, 30, 60, 240, 1440]
+
 # --- existing code...
-def fetch_active_signals(conn, tf):
-    cur = conn.cursor()
-    cur.execute(f"SELECT * FROM signals_{tf}_new WHERE status = 'ACTIVE'")
-    cols = [desc[0] for desc in cur.description]
-    rows = cur.fetchall()
-    cur.close()
-    raw = [dict(zip(cols, row)) for row in rows]
-    return [ActiveSignal(**r) for r in raw]
+def fetch_active_signals(conn, tf, fast: bool = False):
+    """Active signals for tf as ActiveSignal models, or plain dicts when fast=True"""
+    with stage('page3', f"query:{tf}") as s:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {SIGNAL_COLUMNS} FROM signals_{tf}_new WHERE status = 'ACTIVE'")
+        rows = cur.fetchall()
+        cur.close()
+        s.rows = len(rows)
+    with stage('page3', f"build:{tf}") as s:
+        build = row_encoder(ActiveSignal) if fast else model_builder(ActiveSignal)
+        s.rows = len(rows)
+        return [build(row) for row in rows]
+
+def _encode(obj):
+    return fast_json.dumps(obj) if FAST_JSON else json.dumps(obj, cls=DateTimeEncoder)
+
+# Field changes reported as their own lifecycle event; anything else is 'update'
+LIFECYCLE_EVENTS = {'t1_hit': 't1_hit', 't2_hit': 't2_hit', 't3_hit': 't3_hit', 'tsl': 'tsl_move'}
+
+# Last published active set per snapshot key, by signal id
+_previous_active: Dict[str, Dict[int, dict]] = {}
+
+def diff_signals(previous: Dict[int, dict], current: Dict[int, dict]) -> List[dict]:
+    """
+    Field-level changes between two active sets:
+      {"change": "new", "id", "signal"}                      - newly active
+      {"change": "update", "id", "symbol", "events", "fields"} - t1/t2/t3 hits, TSL moves, price extremes
+      {"change": "closed", "id", "symbol"}                   - left the active set
+    """
+    changes = []
+    for sig_id, sig in current.items():
+        old = previous.get(sig_id)
+        if old is None:
+            changes.append({'change': 'new', 'id': sig_id, 'signal': sig})
+            continue
+        fields = {name: value for name, value in sig.items() if old.get(name) != value}
+        if fields:
+            events = [event for name, event in LIFECYCLE_EVENTS.items() if name in fields] or ['update']
+            changes.append({'change': 'update', 'id': sig_id, 'symbol': sig['symbol'], 'events': events, 'fields': fields})
+    for sig_id, old in previous.items():
+        if sig_id not in current:
+            changes.append({'change': 'closed', 'id': sig_id, 'symbol': old['symbol']})
+    return changes
+
+SIGNAL_TIME_FIELDS = ('generation_time', 't1_hit_time', 't2_hit_time', 't3_hit_time', 'last_tsl_update', 'closing_time')
+
+def _signal_source_ts(sig):
+    """Most recent event time recorded on a signal (None for a closed one we no longer hold)"""
+    if sig is None:
+        return None
+    times = [sig[name] for name in SIGNAL_TIME_FIELDS if sig.get(name) is not None]
+    return max(times) if times else None
+
+@contextmanager
+def _signal_batch(redis_client, name: str):
+    """
+    redis_batch that forgets the published active sets if the flush fails,
+    so the next cycle rewrites the snapshots instead of diffing against
+    state that never reached Redis
+    """
+    try:
+        with redis_batch(redis_client, name) as batch:
+            yield batch
+    except Exception:
+        _previous_active.clear()
+        raise
 
 def store_signals_to_redis(r, key, signals):
-    payload = [sig.model_dump() for sig in signals]
-    j = json.dumps(payload, cls=DateTimeEncoder)
-    r.set(key, j)
-    r.publish(f"chan:{key}", j)
+    """
+    Refresh the snapshot under key only when the active set changed, and
+    publish just the changes on chan:{key}:changes. The first call in a
+    process always writes the snapshot; an unchanged set is rewritten (not
+    republished) if the key has gone missing, since the API routes cache it
+    with an expiry and a Redis flush drops it.
+    """
+    with stage('page3', f"diff:{key}") as s:
+        current = {}
+        for sig in signals:
+            sig = sig.model_dump() if isinstance(sig, BaseModel) else sig
+            current[sig['id']] = sig
+        previous = _previous_active.get(key)
+        changes = None if previous is None else diff_signals(previous, current)
+        s.rows = len(changes or [])
+
+    with _signal_batch(r, key) as batch:
+        if changes == [] and batch.client.exists(key):
+            return
+        with stage('page3', f"encode:{key}") as s:
+            j = _encode(list(current.values()))
+            if changes:
+                # Stamp each change with its newest signal time -> publish time
+                for change in changes:
+                    change.update(stamp(f"page3:{key}", _signal_source_ts(current.get(change['id']))))
+                message = _encode(changes)
+            s.rows = len(current)
+            s.bytes = len(j)
+        if changes == []:
+            batch.set(key, j)
+        else:
+            batch.set_and_publish(key, j)
+        if changes:
+            batch.publish(f"chan:{key}:changes", message)
+    _previous_active[key] = current
+
+def fetch_active_signals_all(conn, tfs=None, fast: bool = False) -> Dict[int, list]:
+    """
+    Active signals for every timeframe in one round trip (UNION ALL over the
+    signals_{tf}_new tables, each served by its partial ACTIVE index).
+    Returns: {tf: [ActiveSignal | dict]} with an entry for every tf.
+    """
+    tfs = list(tfs or SIGNAL_TIMEFRAMES)
+    query = "\nUNION ALL\n".join(
+        f"(SELECT {int(tf)} AS tf, {SIGNAL_COLUMNS} FROM signals_{tf}_new WHERE status = 'ACTIVE')"
+        for tf in tfs
+    )
+    with stage('page3', "query:all") as s:
+        cur = conn.cursor()
+        cur.execute(query)
+        rows = cur.fetchall()
+        cur.close()
+        s.rows = len(rows)
+    with stage('page3', "build:all") as s:
+        build = row_encoder(ActiveSignal) if fast else model_builder(ActiveSignal)
+        by_tf = {int(tf): [] for tf in tfs}
+        for row in rows:
+            by_tf[row[0]].append(build(row[1:]))
+        s.rows = len(rows)
+    return by_tf
+
+def page3_all(conn, redis_client, tfs=None):
+    """
+    Fetch and store active signals for all timeframes with one query and
+    one Redis flush.
+    """
+    by_tf = fetch_active_signals_all(conn, tfs, fast=FAST_JSON)
+    with _signal_batch(redis_client, "page3") as batch:
+        for tf, sigs in by_tf.items():
+            store_signals_to_redis(batch, f"active_signals_{tf}", sigs)
 
 def page3(conn, redis_client, tf: int):
     """
     Fetch and store active signals for a single timeframe tf.
     """
-    sigs = fetch_active_signals(conn, tf)
+    sigs = fetch_active_signals(conn, tf, fast=FAST_JSON)
     store_signals_to_redis(redis_client, f"active_signals_{tf}", sigs)
 
 if __name__ == "__main__":
     # ...existing code...
-    with psycopg.connect(host=host, dbname=dbname, user=user, password=password) as conn:
+    with pooled_connection() as conn:
         r = redis.Redis(host=rhost, port=rport, db=0, decode_responses=True)
         # call for a single tf, e.g., 5 or 60
         tf = 5
         page3(conn, r, tf)
         print(f"Stored {tf}-min active signals to Redis.")
+        # or every timeframe in one round trip:
+        # page3_all(conn, r)
@@ -0,0 +1,328 @@
+"""
+Historical Replay
+=================
+
+Re-runs past sessions through the live code paths: ohlc_live_long is read
+in timestamp order through a server-side cursor and fed minute by minute
+into a CandleStore, the EventDetector, the IndicatorEngine and the
+SignalTracker, and optionally into the page2 Redis publish path.
+
+Output goes to a separate schema (default "replay"): the event, indicator
+and signal tables are created there LIKE their public counterparts and
+the output connection runs with search_path = <schema>, public, so levels
+(vwap, camarilla, prev7day_hilo) are still read from public while every
+write lands in the replay schema. Signals generated in the window are
+copied in with their lifecycle reset; signal timeframes without a public
+table are skipped. Redis output goes to --redis-db.
+
+Every rule is per symbol, so --workers partitions the symbols across
+processes, each with its own cursor and output connection. The page2
+snapshots cover the whole universe, so Redis output needs --workers 1.
+
+    python replay.py --start 2024-03-01 --end 2024-03-02                  # as fast as possible
+    python replay.py --start 2024-03-01 --end 2024-04-01 --workers 8
+    python replay.py --start 2024-03-01 --end 2024-03-02 --speed 60 --redis-db 15
+"""
+
+import argparse
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from time import perf_counter, sleep
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import db
+from bars import fetch_bars
+from candle_store import CandleStore
+from event_detector import IST, LAST_MINUTE, EventDetector
+from indicator_engine import TABLES as INDICATOR_TABLES, WARMUP_BARS, IndicatorEngine
+from metrics import stage
+from page3_final import SIGNAL_TIMEFRAMES
+from signal_tracker import SignalTracker
+
+REPLAY_SCHEMA = 'replay'
+CURSOR_ITERSIZE = 20000
+REPORT_EVERY_S = 10
+INDICATOR_TIMEFRAMES = [5, 15, 30, 60]
+WARMUP_DAYS = 30
+MAX_PACED_GAP = timedelta(hours=1)
+
+# Signal columns copied as generated; the lifecycle columns keep their defaults
+SIGNAL_SEED_COLUMNS = (
+    "id, symbol, generation_time, type, entry, sl, t1, t2, t3, yellow_at_generation, "
+    "prev_yellow_at_generation, dema_at_generation, fib_61_at_generation, fib_38_at_generation, "
+    "bb_upper_at_generation, bb_lower_at_generation, trendline_at_generation, close_price_at_generation"
+)
+
+
+def output_tables(tf: int, period: str, indicator_tfs: Sequence[int], signal_tfs: Sequence[int]) -> List[str]:
+    tables = ['unusual_volume_events', f"{period}_vwap_cross_events_{tf}",
+              f"{period}_camarilla_cross_events_{tf}", 'breakout_events7']
+    tables += [table.format(tf=itf) for itf in indicator_tfs for table, _columns in INDICATOR_TABLES.values()]
+    tables += [f"signals_{stf}_new" for stf in signal_tfs]
+    return tables
+
+
+def prepare_schema(conn, schema: str, tables: Sequence[str], start: datetime, end: datetime,
+                   signal_tfs: Sequence[int]) -> List[int]:
+    """
+    Empty copies of the output tables in schema, seeded with the window's
+    signals. Signal tables missing from public are skipped with a warning;
+    any other missing table is an error. Returns the signal timeframes kept.
+    """
+    if schema == 'public':
+        raise ValueError("replay output must not go to the public schema")
+    with conn.cursor() as cur:
+        cur.execute("SELECT t FROM unnest(%s::text[]) AS t WHERE to_regclass('public.' || t) IS NULL",
+                    (list(tables),))
+        missing = {row[0] for row in cur.fetchall()}
+        skipped = [tf for tf in signal_tfs if f"signals_{tf}_new" in missing]
+        required = missing - {f"signals_{tf}_new" for tf in skipped}
+        if required:
+            raise ValueError(f"output tables missing from public: {', '.join(sorted(required))}")
+        if skipped:
+            print(f"Warning: no public signals table for timeframes {skipped}, not tracking them")
+        tables = [table for table in tables if table not in missing]
+        signal_tfs = [tf for tf in signal_tfs if tf not in skipped]
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        for table in tables:
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{table} (LIKE public.{table} INCLUDING ALL)")
+            cur.execute(f"TRUNCATE {schema}.{table}")
+        for tf in signal_tfs:
+            cur.execute(f"""
+                INSERT INTO {schema}.signals_{tf}_new ({SIGNAL_SEED_COLUMNS}, tsl)
+                SELECT {SIGNAL_SEED_COLUMNS}, sl FROM public.signals_{tf}_new
+                WHERE generation_time >= %s AND generation_time < %s
+            """, (start, end))
+    conn.commit()
+    print(f"Replay schema {schema} prepared ({len(tables)} tables)")
+    return signal_tfs
+
+
+def output_connection(schema: str):
+    conn = db.connect()
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {schema}, public")
+    conn.commit()
+    return conn
+
+
+def replay_symbols(conn, start: datetime, end: datetime) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT symbol FROM ohlc_live_long WHERE timestamp >= %s AND timestamp < %s",
+                    (start, end))
+        return sorted(row[0] for row in cur.fetchall())
+
+
+def partition(symbols: Sequence[str], parts: int) -> List[List[str]]:
+    """Stable symbol -> worker assignment"""
+    out = [[] for _ in range(parts)]
+    for symbol in symbols:
+        out[zlib.crc32(symbol.encode()) % parts].append(symbol)
+    return out
+
+
+def warm_indicators(conn, engine: IndicatorEngine, symbols: Sequence[str], start: datetime):
+    """Indicator state as of start, from the ohlc_{tf}m aggregates"""
+    for tf in engine.timeframes:
+        history = fetch_bars(conn, tf, symbols, start - timedelta(days=WARMUP_DAYS), start)
+        names, stamps, highs, lows, closes = [], [], [], [], []
+        for symbol, symbol_bars in history.items():
+            for bucket, _o, high, low, close, _v in symbol_bars[-WARMUP_BARS:]:
+                names.append(symbol)
+                stamps.append(int(bucket.timestamp()))
+                highs.append(high)
+                lows.append(low)
+                closes.append(close)
+        engine.update(tf, names, stamps, highs, lows, closes)
+
+
+def _page2_events(rows: Dict[str, List[tuple]], tf: int, period: str) -> Dict[str, List[tuple]]:
+    """Detector rows in the page2 feed shapes, with page2's row identities"""
+    feeds = {'volume_events': [], 'vwap_events': [], 'camarilla_events': [], 'breakout_events': []}
+    for ts, symbol, _o, _h, _l, _c, _volume, value, _threshold in rows.get('unusual_volume_events', []):
+        feeds['volume_events'].append(((ts, symbol), {'timestamp': ts, 'symbol': symbol, 'value': value}))
+    for ts, symbol, _o, _h, _l, _c, vwap, above, _below in rows.get(f"{period}_vwap_cross_events_{tf}", []):
+        feeds['vwap_events'].append(((ts, symbol), {'timestamp': ts, 'symbol': symbol,
+                                                    'type': 'above' if above else 'below', 'vwap': vwap}))
+    for ts, symbol, _o, _h, _l, _c, h4, h5, l4, l5, above, below in rows.get(f"{period}_camarilla_cross_events_{tf}", []):
+        kind = above or below
+        value = {'h4': h4, 'h5': h5, 'l4': l4, 'l5': l5}[kind]
+        feeds['camarilla_events'].append(((ts, symbol), {'timestamp': ts, 'symbol': symbol,
+                                                         'type': kind, 'camarilla': value}))
+    for _day, symbol, event_time, kind, *_candle, prev_high, prev_low in rows.get('breakout_events7', []):
+        feeds['breakout_events'].append((symbol, {'timestamp': event_time, 'symbol': symbol, 'type': kind.lower(),
+                                                  'value': prev_high if kind == 'HIGH' else prev_low}))
+    return feeds
+
+
+class _Publisher:
+    """The replayed day's events per page2 feed, published through page2_final"""
+
+    def __init__(self, redis_client):
+        import page2_final
+
+        self.page2 = page2_final
+        self.redis = redis_client
+        self.day = None
+        self.feeds: Dict[str, Dict] = {}
+
+    def publish(self, day: date, rows: Dict[str, List[tuple]], tf: int, period: str):
+        if day != self.day:
+            self.day, self.feeds = day, {}
+        changed = False
+        for key, events in _page2_events(rows, tf, period).items():
+            feed = self.feeds.setdefault(key, {})
+            for identity, event in events:
+                # First detection wins, as with ON CONFLICT DO NOTHING
+                if identity not in feed:
+                    feed[identity] = event
+                    changed = True
+        if not changed:
+            return
+        with self.page2._event_batch(self.redis, "replay") as batch:
+            for key, feed in self.feeds.items():
+                self.page2.store_events_to_redis(batch, key, list(feed.values()))
+
+
+def replay_partition(symbols: Sequence[str], start: datetime, end: datetime, speed: float = 0,
+                     schema: str = REPLAY_SCHEMA, redis_db: Optional[int] = None, tf: int = 15,
+                     period: str = 'weekly', label: str = "replay",
+                     signal_tfs: Sequence[int] = SIGNAL_TIMEFRAMES) -> Tuple[int, float]:
+    """Replay [start, end) for symbols; returns (bars, seconds)"""
+    read_conn = db.connect()
+    out_conn = output_connection(schema)
+    publisher = None
+    if redis_db is not None:
+        import redis
+        from app.config.settings import rhost, rport
+        publisher = _Publisher(redis.Redis(host=rhost, port=rport, db=redis_db, decode_responses=True))
+
+    store = CandleStore(timeframes=sorted({1, tf, *INDICATOR_TIMEFRAMES}), symbols=symbols)
+    detector = EventDetector(tf=tf, period=period)
+    engine = IndicatorEngine(timeframes=INDICATOR_TIMEFRAMES, symbols=symbols, write=True)
+    tracker = SignalTracker(signal_tfs, write=True)
+    try:
+        warm_indicators(read_conn, engine, symbols, start)
+        tracker.sync(out_conn)
+
+        cur = read_conn.cursor(name=f"{label}_cursor")
+        cur.itersize = CURSOR_ITERSIZE
+        cur.execute("""
+            SELECT timestamp, symbol, open::float8, high::float8, low::float8, close::float8, volume
+            FROM ohlc_live_long
+            WHERE timestamp >= %s AND timestamp < %s AND symbol = ANY(%s)
+            ORDER BY timestamp, symbol
+        """, (start, end, list(symbols)))
+
+        began = perf_counter()
+        last_report, reported_bars, bars = began, 0, 0
+        anchor_ts, anchor_wall, previous_ts = None, began, None
+        session_day, session_closed = None, False
+
+        def close_session():
+            # The session's last bars are closed by no later tick: evaluate them now, on their own day
+            with stage('replay', 'session_close'):
+                rows = detector.run(out_conn, store, final=True, verbose=False)
+                if publisher is not None:
+                    publisher.publish(session_day, rows, tf, period)
+
+        for ts, minute in groupby(cur, key=lambda row: row[0]):
+            minute = list(minute)
+            day = ts.astimezone(IST).date()
+            if session_day is not None and day != session_day:
+                close_session()
+            session_day, session_closed = day, ts.astimezone(IST).time() >= LAST_MINUTE
+            if speed > 0:
+                # Pace within a session; gaps (nights, weekends) are skipped
+                if previous_ts is None or ts - previous_ts > MAX_PACED_GAP:
+                    anchor_ts, anchor_wall = ts, perf_counter()
+                due = anchor_wall + (ts - anchor_ts).total_seconds() / speed
+                if due > perf_counter():
+                    sleep(due - perf_counter())
+                previous_ts = ts
+
+            with stage('replay', 'minute') as s:
+                _ts, names, o, h, l, c, v = zip(*minute)
+                epoch = np.full(len(names), int(ts.timestamp()), dtype=np.int64)
+                store.ingest(names, epoch, o, h, l, c, v)
+                rows = detector.run(out_conn, store, verbose=False)
+                engine.run(out_conn, store, verbose=False)
+                tracker.tick(out_conn, names, epoch, h, l)
+                if publisher is not None:
+                    publisher.publish(day, rows, tf, period)
+                s.rows = len(minute)
+            bars += len(minute)
+
+            now = perf_counter()
+            if now - last_report >= REPORT_EVERY_S:
+                print(f"[{label}] {ts.astimezone(IST):%Y-%m-%d %H:%M} {bars} bars, "
+                      f"{(bars - reported_bars) / (now - last_report):,.0f} bars/s")
+                last_report, reported_bars = now, bars
+        cur.close()
+        if session_closed:
+            close_session()
+        elapsed = perf_counter() - began
+        print(f"[{label}] done: {bars} bars in {elapsed:.1f}s ({bars / max(elapsed, 1e-9):,.0f} bars/s), "
+              f"{len(tracker)} signals still active")
+        return bars, elapsed
+    finally:
+        read_conn.close()
+        out_conn.close()
+
+
+def _run_partition(args) -> Tuple[int, float]:
+    return replay_partition(*args)
+
+
+def replay(start: datetime, end: datetime, workers: int = 1, speed: float = 0, schema: str = REPLAY_SCHEMA,
+           redis_db: Optional[int] = None, tf: int = 15, period: str = 'weekly') -> Tuple[int, float]:
+    """Prepare the output schema and replay [start, end), symbols split across workers"""
+    if redis_db is not None and workers > 1:
+        raise ValueError("Redis output publishes whole-universe snapshots; use --workers 1")
+    conn = db.connect()
+    try:
+        tables = output_tables(tf, period, INDICATOR_TIMEFRAMES, SIGNAL_TIMEFRAMES)
+        signal_tfs = prepare_schema(conn, schema, tables, start, end, SIGNAL_TIMEFRAMES)
+        symbols = replay_symbols(conn, start, end)
+    finally:
+        conn.close()
+    print(f"Replaying {start:%Y-%m-%d %H:%M} .. {end:%Y-%m-%d %H:%M}: {len(symbols)} symbols, "
+          f"{workers} worker(s), speed {'max' if speed <= 0 else f'{speed:g}x'}")
+
+    began = perf_counter()
+    if workers > 1:
+        jobs = [(part, start, end, speed, schema, redis_db, tf, period, f"replay{i}", signal_tfs)
+                for i, part in enumerate(partition(symbols, workers)) if part]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_partition, jobs))
+        bars = sum(n for n, _seconds in results)
+    else:
+        bars, _seconds = replay_partition(symbols, start, end, speed, schema, redis_db, tf, period,
+                                          signal_tfs=signal_tfs)
+    elapsed = perf_counter() - began
+    print(f"Replay finished: {bars} bars in {elapsed:.1f}s ({bars / max(elapsed, 1e-9):,.0f} bars/s)")
+    return bars, elapsed
+
+
+def _parse_day(value: str) -> datetime:
+    """YYYY-MM-DD -> midnight IST"""
+    return datetime.combine(date.fromisoformat(value), datetime.min.time(), tzinfo=IST)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay past sessions through the live pipeline")
+    parser.add_argument('--start', type=_parse_day, required=True)
+    parser.add_argument('--end', type=_parse_day, required=True, help="exclusive")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--speed', type=float, default=0, help="market minutes per wall minute (0 = max)")
+    parser.add_argument('--schema', default=REPLAY_SCHEMA)
+    parser.add_argument('--redis-db', type=int, help="also publish page2 feeds to this Redis database")
+    parser.add_argument('--tf', type=int, default=15)
+    parser.add_argument('--period', default='weekly')
+    args = parser.parse_args()
+
+    replay(args.start, args.end, args.workers, args.speed, args.schema, args.redis_db, args.tf, args.period)
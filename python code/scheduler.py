@@ -0,0 +1,185 @@
+"""
+StockPro Job Scheduler
+======================
+
+One resident process running every pipeline job on its cadence, instead of
+separate script invocations that reconnect and re-import each time:
+
+    fetch_stock_movers   every minute
+    page2_1              every minute
+    page2_15             every 15 minutes
+    page3 (per tf)       at each tf candle close (5/15/30/60/240/1440)
+
+Ticks are aligned to the session open (09:15 IST) plus a small settle delay
+so the candle's rows have landed. Postgres (shared pool) and Redis stay
+connected for the life of the process, and per-stage metrics are served
+on http://127.0.0.1:9108/metrics and copied to the metrics:pipeline hash
+after every run. A job never overlaps itself: if it
+is still running when its next tick comes, that tick is skipped, and the
+schedule resumes from the next aligned slot after now (missed ticks are
+coalesced, not replayed).
+
+    python scheduler.py                 # session hours only
+    python scheduler.py --all-day --only page2_1,page3_5
+"""
+
+import argparse
+import asyncio
+import signal
+from datetime import datetime, time, timedelta, timezone
+from time import perf_counter
+from typing import Callable, List, Optional
+
+import redis
+
+from app.config.settings import rhost, rport
+from db import close_pool, pooled_connection
+from models import ensure_schema
+import metrics
+
+IST = timezone(timedelta(hours=5, minutes=30))
+SESSION_OPEN = time(9, 15)
+SESSION_CLOSE = time(15, 30)
+SESSION_MINUTES = 375
+SETTLE_SECONDS = 5
+
+
+class Job:
+    """A job function with its cadence and run bookkeeping"""
+
+    def __init__(self, name: str, fn: Callable[[], None], every_minutes: int,
+                 settle_seconds: int = SETTLE_SECONDS, at_close: bool = False, close_only: bool = False):
+        self.name = name
+        self.fn = fn
+        self.every = timedelta(minutes=every_minutes)
+        self.settle = timedelta(seconds=settle_seconds)
+        # at_close: also run for the partial candle ending at the session close
+        # close_only: run once a day at the session close (daily candles)
+        self.at_close = at_close
+        self.close_only = close_only
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_duration_ms = 0.0
+
+    def next_run(self, now: datetime) -> datetime:
+        """First aligned slot (session open + k * every + settle) strictly after now"""
+        close = datetime.combine(now.date(), SESSION_CLOSE, tzinfo=IST) + self.settle
+        if self.close_only:
+            return close if now < close else close + timedelta(days=1)
+        anchor = datetime.combine(now.date(), SESSION_OPEN, tzinfo=IST) + self.settle
+        if now < anchor:
+            return anchor
+        slot = anchor + ((now - anchor) // self.every + 1) * self.every
+        if self.at_close and now < close < slot:
+            return close
+        return slot
+
+
+def in_session(now: datetime) -> bool:
+    if now.weekday() >= 5:
+        return False
+    # Allow the tick that lands just after the closing candle
+    close = datetime.combine(now.date(), SESSION_CLOSE, tzinfo=IST) + timedelta(minutes=1)
+    return datetime.combine(now.date(), SESSION_OPEN, tzinfo=IST) <= now <= close
+
+
+def build_jobs(redis_client) -> List[Job]:
+    import page1_final
+    import page2_final
+    import page3_final
+
+    def with_conn(fn):
+        def run():
+            with pooled_connection() as conn:
+                fn(conn)
+        return run
+
+    jobs = [
+        Job('fetch_stock_movers', page1_final.fetch_stock_movers, 1),
+        Job('page2_1', with_conn(lambda conn: page2_final.page2_1(conn, redis_client)), 1),
+        Job('page2_15', with_conn(lambda conn: page2_final.page2_15(conn, redis_client, tf=15, period='weekly')), 15),
+    ]
+    for tf in page3_final.SIGNAL_TIMEFRAMES:
+        run = with_conn(lambda conn, tf=tf: page3_final.page3(conn, redis_client, tf))
+        jobs.append(Job(f"page3_{tf}", run, tf,
+                        at_close=SESSION_MINUTES % tf != 0, close_only=tf >= SESSION_MINUTES))
+    return jobs
+
+
+async def _execute(job: Job, redis_client):
+    job.running = True
+    start = perf_counter()
+    try:
+        await asyncio.to_thread(job.fn)
+        job.runs += 1
+    except Exception as e:
+        job.failures += 1
+        print(f"[{job.name}] failed: {e}")
+    finally:
+        job.last_duration_ms = (perf_counter() - start) * 1000
+        job.running = False
+        metrics.record(job.name, 'total', job.last_duration_ms / 1000)
+        try:
+            await asyncio.to_thread(metrics.export_to_redis, redis_client)
+        except Exception as e:
+            print(f"[{job.name}] metrics export failed: {e}")
+        print(f"[{job.name}] done in {job.last_duration_ms:.0f} ms "
+              f"(runs={job.runs} skipped={job.skipped} failures={job.failures})")
+
+
+async def run_schedule(job: Job, all_day: bool, tasks: set, redis_client):
+    while True:
+        now = datetime.now(IST)
+        due = job.next_run(now)
+        await asyncio.sleep((due - now).total_seconds())
+        if not all_day and not in_session(datetime.now(IST)):
+            continue
+        if job.running:
+            job.skipped += 1
+            print(f"[{job.name}] previous run still going, skipping {due:%H:%M}")
+            continue
+        task = asyncio.create_task(_execute(job, redis_client))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+async def main(all_day: bool = False, only: Optional[List[str]] = None, metrics_port: Optional[int] = None):
+    redis_client = redis.Redis(host=rhost, port=rport, db=0, decode_responses=True)
+    if metrics_port:
+        metrics.start_http_server(metrics_port)
+        print(f"Metrics on http://127.0.0.1:{metrics_port}/metrics")
+    with pooled_connection() as conn:
+        # One version lookup; applies pending migrations on a fresh database
+        ensure_schema(conn)
+    jobs = build_jobs(redis_client)
+    if only:
+        jobs = [job for job in jobs if job.name in only]
+
+    running: set = set()
+    loops = [asyncio.create_task(run_schedule(job, all_day, running, redis_client)) for job in jobs]
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"Scheduler started with {len(jobs)} jobs: {', '.join(job.name for job in jobs)}")
+    await stop.wait()
+
+    print("Stopping: waiting for running jobs to finish")
+    for task in loops:
+        task.cancel()
+    await asyncio.gather(*loops, return_exceptions=True)
+    await asyncio.gather(*running, return_exceptions=True)
+    close_pool()
+    redis_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the StockPro pipeline jobs on their cadences")
+    parser.add_argument('--all-day', action='store_true', help="also run outside session hours")
+    parser.add_argument('--only', help="comma-separated job names to run")
+    parser.add_argument('--metrics-port', type=int, default=9108, help="Prometheus text endpoint (0 disables)")
+    args = parser.parse_args()
+    asyncio.run(main(args.all_day, args.only.split(',') if args.only else None, args.metrics_port))
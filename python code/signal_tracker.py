@@ -0,0 +1,257 @@
+"""
+Signal Lifecycle Tracker
+========================
+
+Keeps every ACTIVE row of signals_{tf}_new (all timeframes) in memory,
+indexed by symbol, and applies incoming minute bars only to the signals of
+the symbols in the bar batch. Per tick the work is proportional to the
+touched symbols' signals, not to all open signals; the changed signals are
+written back with one UPDATE ... FROM (VALUES ...) per timeframe table and
+set of changed columns. Only the changed columns are written, and only
+where they still hold the values the tracker last saw, so a concurrent
+writer is never overwritten; sync() reloads any held signal whose row was
+changed elsewhere.
+
+Per bar, for each signal generated at or before the bar:
+
+    highest_price / lowest_price   running extremes since generation
+    stop                           BUY: low <= tsl, SELL: high >= tsl -> CLOSED
+                                   ('SL_HIT' while tsl is the original sl, else 'TSL_HIT');
+                                   checked before targets, so an ambiguous bar is a loss
+    t1 / t2 / t3                   BUY: high >= t, SELL: low <= t -> tN_hit, tN_hit_time
+    tsl ladder                     t1 -> entry, t2 -> t1, t3 -> t2 (last_tsl_update);
+                                   with CLOSE_ON_T3 a t3 hit closes the signal ('T3_HIT')
+
+These rules are the tracker's own and have not been reconciled with the
+existing signal generator, so nothing is written unless the tracker is
+created with write=True (replay does, into its own schema); otherwise
+flush() only counts the changes it would make.
+
+    tracker = SignalTracker(write=False)
+    tracker.sync(conn)                                   # at startup / every minute
+    tracker.tick(conn, symbols, epoch_s, high, low)
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+from psycopg2.extras import execute_values
+
+from metrics import stage
+from page3_final import SIGNAL_TIMEFRAMES, fetch_active_signals_all
+
+CLOSE_ON_T3 = True
+UPDATE_PAGE_SIZE = 5000
+
+# Columns written back, with the casts the VALUES list needs (NULLs included)
+UPDATE_COLUMNS = (
+    ('tsl', 'float8'), ('t1_hit', 'bool'), ('t2_hit', 'bool'), ('t3_hit', 'bool'),
+    ('t1_hit_time', 'timestamptz'), ('t2_hit_time', 'timestamptz'), ('t3_hit_time', 'timestamptz'),
+    ('highest_price', 'float8'), ('lowest_price', 'float8'), ('last_tsl_update', 'timestamptz'),
+    ('tsl_at_closing', 'float8'), ('closing_time', 'timestamptz'), ('closing_reason', 'text'),
+    ('status', 'text'),
+)
+
+
+class _Signal:
+    """The mutable lifecycle fields of one active signal"""
+
+    __slots__ = ('id', 'tf', 'symbol', 'generation_time', 'buy', 'entry', 'sl', 'targets', 'stored') + tuple(
+        name for name, _cast in UPDATE_COLUMNS)
+
+    def __init__(self, tf: int, row: dict):
+        self.tf = tf
+        self.buy = row['type'] == 'BUY'
+        self.targets = (row['t1'], row['t2'], row['t3'])
+        for name in ('id', 'symbol', 'generation_time', 'entry', 'sl'):
+            setattr(self, name, row[name])
+        for name, _cast in UPDATE_COLUMNS:
+            setattr(self, name, row[name])
+        # The row as last read or written, to diff against and guard updates with
+        self.stored = {name: row[name] for name, _cast in UPDATE_COLUMNS}
+        if self.highest_price is None:
+            self.highest_price = row['entry']
+        if self.lowest_price is None:
+            self.lowest_price = row['entry']
+
+    def current(self) -> tuple:
+        return tuple(getattr(self, name) for name, _cast in UPDATE_COLUMNS)
+
+    def changed(self) -> tuple:
+        """Names of the columns that differ from the stored row"""
+        return tuple(name for name, _cast in UPDATE_COLUMNS if getattr(self, name) != self.stored[name])
+
+    def values(self, columns: Sequence[str]) -> tuple:
+        """id, the new values of columns, then their stored values"""
+        return ((self.id,) + tuple(getattr(self, name) for name in columns)
+                + tuple(self.stored[name] for name in columns))
+
+    def mark_stored(self):
+        self.stored = {name: getattr(self, name) for name, _cast in UPDATE_COLUMNS}
+
+    def apply(self, ts: datetime, high: float, low: float) -> bool:
+        """Fold one bar in; True if any field changed"""
+        changed = False
+        if high > self.highest_price:
+            self.highest_price, changed = high, True
+        if low < self.lowest_price:
+            self.lowest_price, changed = low, True
+
+        stopped = low <= self.tsl if self.buy else high >= self.tsl
+        if stopped:
+            self._close(ts, 'SL_HIT' if self.tsl == self.sl else 'TSL_HIT')
+            return True
+
+        # Each hit moves the stop one rung: entry, t1, t2
+        ladder = (self.entry,) + self.targets[:2]
+        for i, target in enumerate(self.targets):
+            name = f"t{i + 1}_hit"
+            if getattr(self, name) or not (high >= target if self.buy else low <= target):
+                continue
+            setattr(self, name, True)
+            setattr(self, f"{name}_time", ts)
+            if i == 2 and CLOSE_ON_T3:
+                self._close(ts, 'T3_HIT')
+                return True
+            tighter = ladder[i] > self.tsl if self.buy else ladder[i] < self.tsl
+            if tighter:
+                self.tsl, self.last_tsl_update = ladder[i], ts
+            changed = True
+        return changed
+
+    def _close(self, ts: datetime, reason: str):
+        self.tsl_at_closing = self.tsl
+        self.closing_time = ts
+        self.closing_reason = reason
+        self.status = 'CLOSED'
+
+
+CASTS = dict(UPDATE_COLUMNS)
+
+
+class SignalTracker:
+    def __init__(self, tfs: Optional[Sequence[int]] = None, write: bool = False):
+        self.tfs = [int(tf) for tf in (SIGNAL_TIMEFRAMES if tfs is None else tfs)]
+        self.write = write
+        self._by_symbol: Dict[str, List[_Signal]] = {}
+        self._by_id: Dict[tuple, _Signal] = {}
+        self._dirty: Dict[tuple, _Signal] = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def add(self, tf: int, row: dict):
+        key = (tf, row['id'])
+        if key in self._by_id:
+            return
+        signal = _Signal(tf, row)
+        self._by_id[key] = signal
+        self._by_symbol.setdefault(signal.symbol, []).append(signal)
+
+    def _drop(self, key: tuple):
+        signal = self._by_id.pop(key)
+        remaining = [s for s in self._by_symbol[signal.symbol] if s is not signal]
+        if remaining:
+            self._by_symbol[signal.symbol] = remaining
+        else:
+            del self._by_symbol[signal.symbol]
+
+    def sync(self, conn):
+        """
+        Pick up newly generated signals, forget ones closed elsewhere and
+        reload held signals whose row was changed by another writer. Pending
+        changes are flushed first, so any difference left is external.
+        """
+        self.flush(conn)
+        with stage('signal_tracker', 'sync') as s:
+            by_tf = fetch_active_signals_all(conn, self.tfs, fast=True) if self.tfs else {}
+            active = set()
+            reloaded = 0
+            for tf, rows in by_tf.items():
+                for row in rows:
+                    key = (tf, row['id'])
+                    active.add(key)
+                    held = self._by_id.get(key)
+                    if held is not None and held.current() != _Signal(tf, row).current():
+                        self._drop(key)
+                        reloaded += 1
+                    self.add(tf, row)
+            for key in [key for key in self._by_id if key not in active]:
+                self._drop(key)
+            s.rows = len(self._by_id)
+        if reloaded:
+            print(f"Signal tracker: reloaded {reloaded} signals changed elsewhere")
+
+    def apply(self, symbols: Sequence[str], epoch_s: Sequence[int], high: Sequence[float],
+              low: Sequence[float]) -> int:
+        """Apply minute bars (in time order per symbol) to the touched symbols' signals"""
+        touched = 0
+        with stage('signal_tracker', 'apply') as s:
+            for symbol, t, h, l in zip(symbols, epoch_s, high, low):
+                signals = self._by_symbol.get(symbol)
+                if not signals:
+                    continue
+                ts = datetime.fromtimestamp(int(t), timezone.utc)
+                closed = False
+                for signal in signals:
+                    if ts < signal.generation_time:
+                        continue
+                    if signal.apply(ts, float(h), float(l)):
+                        self._dirty[(signal.tf, signal.id)] = signal
+                        touched += 1
+                        closed = closed or signal.status == 'CLOSED'
+                if closed:
+                    for signal in [s for s in signals if s.status == 'CLOSED']:
+                        self._drop((signal.tf, signal.id))
+            s.rows = touched
+        return touched
+
+    def flush(self, conn) -> int:
+        """
+        Write pending changes: one UPDATE ... FROM (VALUES ...) per timeframe
+        table and set of changed columns, applied only where those columns
+        still hold their stored values. Returns the signals written (or, with
+        write=False, that would have been).
+        """
+        if not self._dirty:
+            return 0
+        groups: Dict[tuple, List[tuple]] = {}
+        for (tf, _id), signal in self._dirty.items():
+            columns = signal.changed()
+            if columns:
+                groups.setdefault((tf, columns), []).append(signal.values(columns))
+            signal.mark_stored()
+        self._dirty.clear()
+        pending = sum(len(rows) for rows in groups.values())
+        if not self.write:
+            return pending
+
+        written = 0
+        with conn.cursor() as cur:
+            for (tf, columns), rows in groups.items():
+                with stage('signal_tracker', f"update:{tf}") as s:
+                    names = ", ".join(columns)
+                    old_names = ", ".join(f"old_{name}" for name in columns)
+                    assignments = ", ".join(f"{name} = v.{name}" for name in columns)
+                    unchanged = " AND ".join(f"s.{name} IS NOT DISTINCT FROM v.old_{name}" for name in columns)
+                    casts = [f"%s::{CASTS[name]}" for name in columns]
+                    template = "(" + ", ".join(["%s::int"] + casts + casts) + ")"
+                    updated = execute_values(cur, f"""
+                        UPDATE signals_{tf}_new AS s SET {assignments}
+                        FROM (VALUES %s) AS v (id, {names}, {old_names})
+                        WHERE s.id = v.id AND s.status = 'ACTIVE' AND {unchanged}
+                        RETURNING s.id
+                    """, rows, template=template, page_size=UPDATE_PAGE_SIZE, fetch=True)
+                    s.rows = len(updated)
+                written += len(updated)
+        conn.commit()
+        if written < pending:
+            # Changed elsewhere since the last sync; the next sync reloads them
+            print(f"Signal tracker: {pending - written} updates skipped, rows changed concurrently")
+        return written
+
+    def tick(self, conn, symbols: Sequence[str], epoch_s: Sequence[int], high: Sequence[float],
+             low: Sequence[float]) -> int:
+        """apply() then flush(); returns the number of signals written"""
+        self.apply(symbols, epoch_s, high, low)
+        return self.flush(conn)
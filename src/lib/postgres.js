@@ -10,4 +10,17 @@ export async function query(text, params) {
   return res;
 }
 
+// signals_{tf}_new columns in table-definition order. Named explicitly: the
+// NUMERIC -> DOUBLE PRECISION migration moves the price columns to the end,
+// which would reorder SELECT * results.
+export const SIGNAL_COLUMNS = [
+  'id', 'symbol', 'generation_time', 'type', 'entry', 'sl', 'tsl', 't1', 't2', 't3',
+  't1_hit', 't2_hit', 't3_hit', 't1_hit_time', 't2_hit_time', 't3_hit_time',
+  'highest_price', 'lowest_price', 'last_tsl_update', 'tsl_at_closing', 'closing_time',
+  'closing_reason', 'status', 'yellow_at_generation', 'prev_yellow_at_generation',
+  'dema_at_generation', 'fib_61_at_generation', 'fib_38_at_generation',
+  'bb_upper_at_generation', 'bb_lower_at_generation', 'trendline_at_generation',
+  'close_price_at_generation',
+].join(', ');
+
 export default pool;
@@ -2,6 +2,25 @@ import { createClient, type RedisClientType } from 'redis';
 import { getRedisClient } from './redis';
 
 type Listener = (message: string) => void;
+type DeltaListener = (id: string, event: unknown) => void;
+
+// Redis stream IDs are "<ms>-<seq>"; compare numerically part by part.
+function compareStreamIds(a: string, b: string): number {
+  const [aMs, aSeq = '0'] = a.split('-');
+  const [bMs, bSeq = '0'] = b.split('-');
+  const msDiff = Number(aMs) - Number(bMs);
+  return msDiff !== 0 ? msDiff : Number(aSeq) - Number(bSeq);
+}
+
+// A resume ID is only honoured if it is a well-formed stream ID from today:
+// "0", garbage, or an ID from an earlier day would replay the whole retained
+// multi-day stream, so those callers get a fresh snapshot instead.
+export function resumeId(since: string | undefined): string | null {
+  if (!since || !/^\d+-\d+$/.test(since)) return null;
+  const dayStart = new Date();
+  dayStart.setHours(0, 0, 0, 0);
+  return Number(since.split('-')[0]) >= dayStart.getTime() ? since : null;
+}
 
 class SSEHub {
   private subClient: RedisClientType | null = null;
@@ -12,6 +31,8 @@ class SSEHub {
   private lastActivity = Date.now();
   private idleTimeoutMs = 60_000; // 1 minute
   private idleTimer: NodeJS.Timeout | null = null;
+  // Newest stream ID per key, looked up once per published snapshot
+  private snapshotIds: Map<string, { message: string; id: Promise<string | null> }> = new Map();
 
   private async ensureSubscriber() {
     if (this.subClient && this.subClient.isOpen) return;
@@ -91,11 +112,77 @@ class SSEHub {
     };
   }
 
+  // Replay stream:{key} entries after sinceId, then follow chan:{key}:delta.
+  // The channel is subscribed before the replay read so nothing published in
+  // between is lost; IDs at or below the last one sent are dropped.
+  async followDeltas(key: string, sinceId: string, listener: DeltaListener): Promise<() => void> {
+    let lastId = sinceId;
+    let replaying = true;
+    const buffered: { id: string; event: unknown }[] = [];
+    const emit = (id: string, event: unknown) => {
+      if (compareStreamIds(id, lastId) <= 0) return;
+      lastId = id;
+      listener(id, event);
+    };
+
+    const unsubscribe = await this.subscribe(`chan:${key}:delta`, (message: string) => {
+      let items: { id: string; event: unknown }[];
+      try { items = JSON.parse(message); } catch { return; }
+      for (const item of items) {
+        if (replaying) buffered.push(item); else emit(item.id, item.event);
+      }
+    });
+
+    try {
+      const client = await getRedisClient();
+      const entries = await client.xRange(`stream:${key}`, `(${sinceId}`, '+');
+      for (const entry of entries) {
+        try { emit(entry.id, JSON.parse(entry.message.data as string)); } catch {}
+      }
+    } finally {
+      replaying = false;
+      for (const item of buffered) emit(item.id, item.event);
+    }
+    return unsubscribe;
+  }
+
   async getInitial(key: string): Promise<string | null> {
     const client = await getRedisClient();
     const data = await client.get(key);
     return data;
   }
+
+  async lastStreamId(key: string): Promise<string | null> {
+    const client = await getRedisClient();
+    const entries = await client.xRevRange(`stream:${key}`, '+', '-', { COUNT: 1 });
+    return entries.length ? entries[0].id : null;
+  }
+
+  // Snapshot and newest stream ID read in one MULTI, so a client resuming
+  // from that ID gets exactly the events the snapshot does not contain.
+  async getInitialWithId(key: string): Promise<{ data: string | null; id: string | null }> {
+    const client = await getRedisClient();
+    const [data, entries] = await client
+      .multi()
+      .get(key)
+      .xRevRange(`stream:${key}`, '+', '-', { COUNT: 1 })
+      .exec() as unknown as [string | null, { id: string }[]];
+    return { data, id: entries.length ? entries[0].id : null };
+  }
+
+  // Follow chan:{key} snapshots, each tagged with the newest stream ID. The
+  // publisher sets the snapshot, publishes it and XADDs in one MULTI, so by
+  // the time the message arrives the stream already holds its events.
+  async subscribeSnapshots(key: string, listener: (id: string | null, message: string) => void): Promise<() => void> {
+    return this.subscribe(`chan:${key}`, (message: string) => {
+      let entry = this.snapshotIds.get(key);
+      if (!entry || entry.message !== message) {
+        entry = { message, id: this.lastStreamId(key).catch(() => null) };
+        this.snapshotIds.set(key, entry);
+      }
+      entry.id.then((id) => listener(id, message));
+    });
+  }
 }
 
 let singleton: SSEHub | null = null;
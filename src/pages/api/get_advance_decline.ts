@@ -3,14 +3,6 @@ import { getRedisClient } from '../../lib/redis.js';
 import { query } from '../../lib/postgres.js';
 import crypto from 'crypto';
 
-interface AdvanceDeclineData {
-  AD_sensex: [string, number, number][];
-  AD_nifty: [string, number, number][];
-  AD_banknifty: [string, number, number][];
-  AD_midcap: [string, number, number][];
-  AD_smallcap: [string, number, number][];
-}
-
 interface AdvanceDeclinePoint {
   timestamp: string;
   pullers: number;
@@ -88,89 +80,56 @@ async function getAdvanceDeclineFromPostgres(): Promise<TransformedData> {
   }
 }
 
+// Per-index capped lists maintained incrementally by page1 (newest first,
+// each element a JSON [timestamp, pullers, draggers] tuple).
+const seriesKeys: Record<keyof TransformedData, string> = {
+  sensex: 'advance_decline:series:sensex',
+  nifty: 'advance_decline:series:nifty50',
+  banknifty: 'advance_decline:series:banknifty',
+  midcap: 'advance_decline:series:niftymidcap',
+  smallcap: 'advance_decline:series:bankex'
+};
+
+async function getAdvanceDeclineFromSeries(redis: Awaited<ReturnType<typeof getRedisClient>>): Promise<{ data: TransformedData; raw: string } | null> {
+  const names = Object.keys(seriesKeys) as (keyof TransformedData)[];
+  const lists: string[][] = await Promise.all(names.map((name) => redis.lRange(seriesKeys[name], 0, 374)));
+  if (lists.some((items) => items.length < 100)) return null;
+
+  const data = {} as TransformedData;
+  names.forEach((name, i) => {
+    data[name] = lists[i].map((item) => {
+      const [timestamp, pullers, draggers] = JSON.parse(item) as [string, number, number];
+      return {
+        timestamp: new Date(timestamp).toISOString(),
+        pullers,
+        draggers,
+        net: pullers - draggers
+      };
+    });
+  });
+  return { data, raw: lists.map((items) => items[0]).join('|') };
+}
+
 export default async function handler(req: NextApiRequest, res: NextApiResponse) {
   if (req.method !== 'GET') {
     return res.status(405).json({ error: 'Method not allowed' });
   }
 
-  let transformedData: TransformedData | null = null;
   const redis = await getRedisClient();
-  const data = await redis.get('advance_decline:latest');
-
-  let etag: string | null = null;
 
-  if (data) {
-    etag = crypto.createHash('md5').update(data).digest('hex');
-    const advanceDeclineData: AdvanceDeclineData = JSON.parse(data);
-
-    // If any index has fewer than 100 points, fall back to Postgres and
-    // refresh Redis with up to 375 datapoints per index (no expiry).
-    const lengths = [
-      (advanceDeclineData.AD_sensex || []).length,
-      (advanceDeclineData.AD_nifty || []).length,
-      (advanceDeclineData.AD_banknifty || []).length,
-      (advanceDeclineData.AD_midcap || []).length,
-      (advanceDeclineData.AD_smallcap || []).length
-    ];
-
-    const hasEnough = lengths.every(l => l >= 100);
-    if (hasEnough) {
-      transformedData = {
-        sensex: advanceDeclineData.AD_sensex.map(([timestamp, pullers, draggers]) => ({
-          timestamp: new Date(timestamp).toISOString(),
-          pullers,
-          draggers,
-          net: pullers - draggers
-        })),
-        nifty: advanceDeclineData.AD_nifty.map(([timestamp, pullers, draggers]) => ({
-          timestamp: new Date(timestamp).toISOString(),
-          pullers,
-          draggers,
-          net: pullers - draggers
-        })),
-        banknifty: advanceDeclineData.AD_banknifty.map(([timestamp, pullers, draggers]) => ({
-          timestamp: new Date(timestamp).toISOString(),
-          pullers,
-          draggers,
-          net: pullers - draggers
-        })),
-        midcap: advanceDeclineData.AD_midcap.map(([timestamp, pullers, draggers]) => ({
-          timestamp: new Date(timestamp).toISOString(),
-          pullers,
-          draggers,
-          net: pullers - draggers
-        })),
-        smallcap: advanceDeclineData.AD_smallcap.map(([timestamp, pullers, draggers]) => ({
-          timestamp: new Date(timestamp).toISOString(),
-          pullers,
-          draggers,
-          net: pullers - draggers
-        }))
-      };
-      res.setHeader('ETag', etag);
-      return res.status(200).json(transformedData);
-    }
-    // else fall through to refresh from Postgres
+  // The per-index series are the only advance/decline state in Redis;
+  // page1 appends to them every tick.
+  const series = await getAdvanceDeclineFromSeries(redis);
+  if (series) {
+    const etag = crypto.createHash('md5').update(series.raw).digest('hex');
+    res.setHeader('ETag', etag);
+    return res.status(200).json(series.data);
   }
 
-  // If no data in Redis, fetch from Postgres, update Redis, and return
-  // If we reached here, either Redis had no data or it had insufficient
-  // datapoints. Fetch from Postgres (up to 375 per symbol), update Redis and
-  // return the fresh transformed data. Do not set an expiry on the Redis key.
-  transformedData = await getAdvanceDeclineFromPostgres();
-
-  // Prepare data in Redis format (arrays of [timestamp, pullers, draggers])
-  const advanceDeclineData: AdvanceDeclineData = {
-    AD_sensex: transformedData.sensex.map(({ timestamp, pullers, draggers }) => [timestamp, pullers, draggers]),
-    AD_nifty: transformedData.nifty.map(({ timestamp, pullers, draggers }) => [timestamp, pullers, draggers]),
-    AD_banknifty: transformedData.banknifty.map(({ timestamp, pullers, draggers }) => [timestamp, pullers, draggers]),
-    AD_midcap: transformedData.midcap.map(({ timestamp, pullers, draggers }) => [timestamp, pullers, draggers]),
-    AD_smallcap: transformedData.smallcap.map(({ timestamp, pullers, draggers }) => [timestamp, pullers, draggers])
-  };
-  const redisData = JSON.stringify(advanceDeclineData);
-  await redis.set('advance_decline:latest', redisData);
-
-  etag = crypto.createHash('md5').update(redisData).digest('hex');
+  // Fewer than 100 points in some series (or none yet): read up to 375 per
+  // index from Postgres. The series themselves are left to page1.
+  const transformedData = await getAdvanceDeclineFromPostgres();
+  const etag = crypto.createHash('md5').update(JSON.stringify(transformedData)).digest('hex');
   res.setHeader('ETag', etag);
   return res.status(200).json(transformedData);
 }
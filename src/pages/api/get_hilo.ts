@@ -1,7 +1,7 @@
 
 import type { NextApiRequest, NextApiResponse } from 'next';
 import { getRedisClient } from '@/lib/redis';
-import { getSSEHub } from '../../lib/sseHub';
+import { getSSEHub, resumeId } from '../../lib/sseHub';
 import { query as pgQuery } from '../../lib/postgres';
 
 export default async function handler(req: NextApiRequest, res: NextApiResponse) {
@@ -50,7 +50,6 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
   try {
     const hub = getSSEHub();
     const redisKey = 'breakout_events';
-    const channel = `chan:${redisKey}`;
 
     res.setHeader('Content-Type', 'text/event-stream');
     res.setHeader('Cache-Control', 'no-cache, no-transform');
@@ -59,9 +58,11 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
     res.flushHeaders?.();
 
     let closed = false;
-    const send = (event: string, data: any) => {
+    const send = (event: string, data: any, id?: string | null) => {
       if (closed) return;
       const payload = typeof data === 'string' ? data : JSON.stringify(data);
+      // The id becomes the client's Last-Event-ID, so a reconnect resumes with deltas
+      if (id) res.write(`id: ${id}\n`);
       res.write(`event: ${event}\n`);
       res.write(`data: ${payload}\n\n`);
     };
@@ -70,10 +71,25 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
       if (!closed) res.write(`event: ping\ndata: ${Date.now()}\n\n`);
     }, 15000);
 
-    const initial = await hub.getInitial(redisKey);
-    if (initial) send('update', JSON.parse(initial)); else send('init', { message: 'No breakout data found' });
-  const unsubscribe = await hub.subscribe(channel, (message: string) => {
-      try { send('update', JSON.parse(message)); } catch {}
+    // Resume from a stream ID: replay only the events the client missed
+    const since = resumeId((req.headers['last-event-id'] as string | undefined) || (req.query.since as string | undefined));
+    if (since) {
+      const stopDeltas = await hub.followDeltas(redisKey, since, (id, event) => {
+        if (!closed) res.write(`id: ${id}\nevent: delta\ndata: ${JSON.stringify(event)}\n\n`);
+      });
+      req.on('close', () => {
+        closed = true;
+        clearInterval(heartbeat);
+        stopDeltas();
+        res.end();
+      });
+      return;
+    }
+
+    const { data: initial, id: initialId } = await hub.getInitialWithId(redisKey);
+    if (initial) send('update', JSON.parse(initial), initialId); else send('init', { message: 'No breakout data found' });
+    const unsubscribe = await hub.subscribeSnapshots(redisKey, (id, message) => {
+      try { send('update', JSON.parse(message), id); } catch {}
     });
 
     req.on('close', () => {
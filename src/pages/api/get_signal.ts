@@ -1,7 +1,7 @@
 import type { NextApiRequest, NextApiResponse } from 'next';
 import { getRedisClient } from '@/lib/redis';
 import { getSSEHub } from '../../lib/sseHub';
-import { query as pgQuery } from '../../lib/postgres';
+import { query as pgQuery, SIGNAL_COLUMNS } from '../../lib/postgres';
 
 export default async function handler(req: NextApiRequest, res: NextApiResponse) {
   if (req.method !== 'GET') return res.status(405).json({ error: 'Method not allowed' });
@@ -33,7 +33,7 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
       if (!data) {
         // Fallback to Postgres
         try {
-          const pgRes = await pgQuery(`SELECT * FROM signals_${tf}_new WHERE status = 'ACTIVE'`);
+          const pgRes = await pgQuery(`SELECT ${SIGNAL_COLUMNS} FROM signals_${tf}_new WHERE status = 'ACTIVE'`);
           if (!pgRes.rows || pgRes.rows.length === 0) {
             return res.status(404).json({ 
               error: `No active signals found for ${tf}-minute timeframe`,
@@ -1,5 +1,5 @@
 import { getRedisClient } from '@/lib/redis';
-import { getSSEHub } from '../../lib/sseHub';
+import { getSSEHub, resumeId } from '../../lib/sseHub';
 import { query as pgQuery } from '../../lib/postgres';
 import type { NextApiRequest, NextApiResponse } from 'next';
 
@@ -37,7 +37,6 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
   try {
     const hub = getSSEHub();
     const redisKey = 'volume_events';
-    const channel = `chan:${redisKey}`;
 
     res.setHeader('Content-Type', 'text/event-stream');
     res.setHeader('Cache-Control', 'no-cache, no-transform');
@@ -46,9 +45,11 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
     res.flushHeaders?.();
 
     let closed = false;
-    const send = (event: string, data: any) => {
+    const send = (event: string, data: any, id?: string | null) => {
       if (closed) return;
       const payload = typeof data === 'string' ? data : JSON.stringify(data);
+      // The id becomes the client's Last-Event-ID, so a reconnect resumes with deltas
+      if (id) res.write(`id: ${id}\n`);
       res.write(`event: ${event}\n`);
       res.write(`data: ${payload}\n\n`);
     };
@@ -57,10 +58,25 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
       if (!closed) res.write(`event: ping\ndata: ${Date.now()}\n\n`);
     }, 15000);
 
-    const initial = await hub.getInitial(redisKey);
-    if (initial) send('update', JSON.parse(initial)); else send('init', { message: 'No Volume data found' });
-  const unsubscribe = await hub.subscribe(channel, (message: string) => {
-      try { send('update', JSON.parse(message)); } catch {}
+    // Resume from a stream ID: replay only the events the client missed
+    const since = resumeId((req.headers['last-event-id'] as string | undefined) || (req.query.since as string | undefined));
+    if (since) {
+      const stopDeltas = await hub.followDeltas(redisKey, since, (id, event) => {
+        if (!closed) res.write(`id: ${id}\nevent: delta\ndata: ${JSON.stringify(event)}\n\n`);
+      });
+      req.on('close', () => {
+        closed = true;
+        clearInterval(heartbeat);
+        stopDeltas();
+        res.end();
+      });
+      return;
+    }
+
+    const { data: initial, id: initialId } = await hub.getInitialWithId(redisKey);
+    if (initial) send('update', JSON.parse(initial), initialId); else send('init', { message: 'No Volume data found' });
+    const unsubscribe = await hub.subscribeSnapshots(redisKey, (id, message) => {
+      try { send('update', JSON.parse(message), id); } catch {}
     });
 
     req.on('close', () => {
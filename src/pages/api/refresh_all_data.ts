@@ -1,6 +1,6 @@
 import type { NextApiRequest, NextApiResponse } from 'next';
 import { getRedisClient } from '@/lib/redis';
-import { query as pgQuery } from '../../lib/postgres';
+import { query as pgQuery, SIGNAL_COLUMNS } from '../../lib/postgres';
 
 export default async function handler(req: NextApiRequest, res: NextApiResponse) {
   if (req.method !== 'POST') {
@@ -114,7 +114,7 @@ export default async function handler(req: NextApiRequest, res: NextApiResponse)
     const timeframes = ['5', '60'];
     for (const tf of timeframes) {
       try {
-        const signalsRes = await pgQuery(`SELECT * FROM signals_${tf}_new WHERE status = 'ACTIVE'`);
+        const signalsRes = await pgQuery(`SELECT ${SIGNAL_COLUMNS} FROM signals_${tf}_new WHERE status = 'ACTIVE'`);
         const signalsData = JSON.stringify(signalsRes.rows);
         const redisKey = `active_signals_${tf}`;
         await redis.set(redisKey, signalsData, { EX: 3600 });